@@ -4,8 +4,16 @@ import plotly.graph_objects as go
 import os
 import sqlite3
 import time
+import threading
 import numpy as np
 import datetime
+import functools
+from collections import Counter
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
 
 # --- Initial Configuration ---
 st.set_page_config(layout="wide", page_title="Gestión de Equipos y Obras (Minería)")
@@ -56,24 +64,214 @@ DATETIME_COLUMNS = {
     TABLE_ASIGNACION_MATERIALES: 'Fecha_Asignacion',
 }
 
+COST_COLUMNS = {
+    TABLE_PRESUPUESTO_MATERIALES: ('Costo_Presupuestado', 'Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado'),
+    TABLE_COMPRAS_MATERIALES: ('Costo_Compra', 'Cantidad_Comprada', 'Precio_Unitario_Comprado'),
+    TABLE_ASIGNACION_MATERIALES: ('Costo_Asignado', 'Cantidad_Asignada', 'Precio_Unitario_Asignado'),
+}
+
+CATEGORY_COLUMNS = {
+    TABLE_CONSUMO: ['Interno'],
+    TABLE_COSTOS_SALARIAL: ['Interno'],
+    TABLE_GASTOS_FIJOS: ['Interno'],
+    TABLE_GASTOS_MANTENIMIENTO: ['Interno'],
+}
+
 PANDAS_INT_DTYPE = pd.Int64Dtype() if hasattr(pd, 'Int64Dtype') else 'float64'
+PANDAS_STRING_DTYPE = pd.StringDtype() if hasattr(pd, 'StringDtype') else object
+EXPECTED_COLS = {table_name: list(cols.keys()) for table_name, cols in TABLE_COLUMNS.items()}
+FLOAT_COLS = {table_name: [col for col, dtype in cols.items() if 'float' in dtype] for table_name, cols in TABLE_COLUMNS.items()}
+TEXT_NULL_SENTINELS = ['', 'nan', 'None', str(pd.NA)]
+KEY_TEXT_COLUMNS = {'Interno', 'ID_Flota'}
+COLUMNAR_READ_TABLES = {
+    table_name for table_name, cols in TABLE_COLUMNS.items()
+    if table_name in DATETIME_COLUMNS or sum('float' in dtype for dtype in cols.values()) * 2 > len(cols)
+}
 
 @st.cache_resource
 def get_db_conn():
     conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False, timeout=10)
     conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
+@st.cache_resource
+def db_write_lock():
+    return threading.RLock()
+
+@functools.lru_cache(maxsize=4)
+def text_null_value_set(arrow_type):
+    return pa.array(TEXT_NULL_SENTINELS, type=arrow_type), pa.scalar(None, arrow_type)
+
+def normalize_text(series, strip=False):
+    text = series.astype(PANDAS_STRING_DTYPE)
+    if pc is not None and getattr(text.dtype, 'storage', None) == 'pyarrow':
+        values = pa.array(text.array)
+        if strip:
+            values = pc.utf8_trim_whitespace(values)
+        sentinels, null = text_null_value_set(values.type)
+        cleaned = pc.if_else(pc.is_in(values, value_set=sentinels), null, values)
+        return pd.Series(pd.array(cleaned, dtype=text.dtype), index=text.index, name=text.name)
+    if strip:
+        text = text.str.strip()
+    return text.mask(text.isin(TEXT_NULL_SENTINELS), pd.NA)
+
+def stripped_text(series):
+    return series.astype(PANDAS_STRING_DTYPE).str.strip()
+
+def has_duplicate_text(series, casefold=False):
+    text = stripped_text(series)
+    if casefold:
+        text = text.str.lower()
+    return bool(text.duplicated().any())
+
+def blank_to_na(series):
+    text = series.astype(PANDAS_STRING_DTYPE)
+    if pc is not None and getattr(text.dtype, 'storage', None) == 'pyarrow':
+        values = pa.array(text.array)
+        cleaned = pc.if_else(pc.equal(values, ''), pa.scalar(None, values.type), values)
+        return pd.Series(pd.array(cleaned, dtype=text.dtype), index=text.index, name=text.name)
+    return text.mask(text.eq('').fillna(False), pd.NA)
+
+def coerce_float(series):
+    return pd.to_numeric(series, errors='coerce').astype(float).fillna(0.0)
+
+def coerce_int(series):
+    return pd.to_numeric(series, errors='coerce').astype(PANDAS_INT_DTYPE)
+
+def coerce_date(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series, errors='coerce', cache=True)
+
+def numeric_values(df, cols, fill_value=None):
+    try:
+        values = df[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    except (TypeError, ValueError):
+        values = df[cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    if fill_value is not None:
+        values = np.where(np.isnan(values), fill_value, values)
+    return values
+
+def unique_id(candidate, existing_ids):
+    unique, counter = candidate, 0
+    while unique in existing_ids:
+        counter += 1
+        unique = f"{candidate}_{counter}"
+    return unique
+
+def new_batch_ids(prefix, count, existing_ids):
+    base_id = f"{prefix}_{int(time.time() * 1e6)}"
+    new_ids = [f"{base_id}_{i}" for i in range(count)]
+    if existing_ids.isdisjoint(new_ids):
+        return new_ids
+    return [unique_id(new_id, existing_ids) for new_id in new_ids]
+
+def lowest_value(values):
+    return values.min() if values.size else np.inf
+
+def pick_coercer(col, dtype, date_col):
+    if col == date_col:
+        return coerce_date
+    if 'float' in dtype:
+        return coerce_float
+    if 'int' in dtype:
+        return coerce_int
+    return normalize_text
+
+COERCERS = {
+    table_name: [(col, pick_coercer(col, dtype, DATETIME_COLUMNS.get(table_name))) for col, dtype in cols.items()]
+    for table_name, cols in TABLE_COLUMNS.items()
+}
+
+SCHEMAS = {
+    table_name: {
+        col: np.dtype(np.float64) if 'float' in dtype else PANDAS_INT_DTYPE if 'int' in dtype else PANDAS_STRING_DTYPE
+        for col, dtype in cols.items() if col != DATETIME_COLUMNS.get(table_name)
+    }
+    for table_name, cols in TABLE_COLUMNS.items()
+}
+
+def empty_frame(expected_cols_dict):
+    return pd.DataFrame({
+        col: pd.Series(dtype=PANDAS_STRING_DTYPE if dtype == 'object' else float if 'float' in dtype else PANDAS_INT_DTYPE if 'int' in dtype else object)
+        for col, dtype in expected_cols_dict.items()
+    })
+
+EMPTY_FRAMES = {table_name: empty_frame(cols) for table_name, cols in TABLE_COLUMNS.items()}
+
+def sum_by_key(keys, values):
+    order = np.argsort(keys, kind='stable')
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    return unique_keys, np.add.reduceat(values[order], starts, axis=0)
+
+def sum_by_interno(df, amount_col, total_col):
+    if 'Interno' not in df.columns or amount_col not in df.columns:
+        return pd.DataFrame(columns=['Interno', total_col])
+    internos = df['Interno']
+    valid = internos.notna().to_numpy()
+    if not valid.any():
+        return pd.DataFrame(columns=['Interno', total_col])
+    keys, totals = sum_by_key(internos.to_numpy(dtype=object)[valid], numeric_values(df, [amount_col], fill_value=0.0)[valid])
+    return pd.DataFrame({'Interno': pd.array(keys, dtype=PANDAS_STRING_DTYPE), total_col: totals[:, 0]})
+
+def price_on_or_before(dates, price_dates, prices):
+    price_ns = price_dates.to_numpy(dtype='datetime64[ns]').view('i8')
+    idx = np.searchsorted(price_ns, dates.to_numpy(dtype='datetime64[ns]').view('i8'), side='right') - 1
+    return np.where(idx >= 0, prices[np.clip(idx, 0, None)], 0.0)
+
+def sorted_by_date(dates, values):
+    ns = dates.to_numpy(dtype='datetime64[ns]').view('i8')
+    order = np.argsort(ns, kind='stable')
+    return ns[order], values[order]
+
+def period_fuel_cost(consumo_ns, litros, precio_ns, precios, start_ts, end_ts):
+    start_ns, end_ns = pd.Timestamp(start_ts).value, pd.Timestamp(end_ts).value
+    p_lo, p_hi = np.searchsorted(precio_ns, start_ns, side='left'), np.searchsorted(precio_ns, end_ns, side='right')
+    if p_lo == p_hi:
+        return 0.0
+    c_lo, c_hi = np.searchsorted(consumo_ns, max(start_ns, precio_ns[p_lo]), side='left'), np.searchsorted(consumo_ns, end_ns, side='right')
+    if c_lo >= c_hi:
+        return 0.0
+    idx = np.searchsorted(precio_ns, consumo_ns[c_lo:c_hi], side='right') - 1
+    return float(np.dot(litros[c_lo:c_hi], precios[idx]))
+
+def format_iso_dates(series):
+    dates = coerce_date(series)
+    days = np.datetime_as_string(dates.to_numpy().astype('datetime64[D]'), unit='D')
+    return pd.Series(days, index=series.index, dtype=object).mask(dates.isna(), None)
+
+def read_table_columnar(conn, table_name, expected_cols_dict):
+    cursor = conn.execute(f'SELECT * FROM "{table_name}"')
+    names = [description[0] for description in cursor.description]
+    rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    data = {}
+    for name, values in zip(names, columns):
+        if 'float' in expected_cols_dict.get(name, ''):
+            try:
+                data[name] = np.array(values, dtype=np.float64)
+                continue
+            except (TypeError, ValueError):
+                pass
+        data[name] = list(values) if rows else np.empty(0, dtype=object)
+    return pd.DataFrame(data, columns=names)
+
 def load_table(db_file, table_name):
     conn = get_db_conn()
     expected_cols_dict = TABLE_COLUMNS.get(table_name, {})
-    expected_cols = list(expected_cols_dict.keys())
+    expected_cols = EXPECTED_COLS.get(table_name, [])
+    float_cols = FLOAT_COLS.get(table_name, [])
+    coercers = [(col, coerce) for col, coerce in COERCERS.get(table_name, []) if coerce is not coerce_float]
     df = pd.DataFrame()
     try:
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=? COLLATE NOCASE;", (table_name,))
         table_exists = cursor.fetchone() is not None
-        if table_exists:
+        if table_exists and table_name in COLUMNAR_READ_TABLES:
+            df = read_table_columnar(conn, table_name, expected_cols_dict)
+        elif table_exists:
             df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
         else:
              st.warning(f"La tabla '{table_name}' no existe. Creando DataFrame vacío.")
@@ -83,90 +281,427 @@ def load_table(db_file, table_name):
          st.error(f"Error al cargar '{table_name}': {e}")
 
     df = df.reindex(columns=expected_cols)
-    for col, dtype in expected_cols_dict.items():
-        if col in df.columns:
-             try:
-                  if dtype == 'object':
-                       df[col] = df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                       df[col] = df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA}).mask(df[col].isna(), pd.NA)
-                  elif 'float' in dtype:
-                       df[col] = pd.to_numeric(df[col], errors='coerce').astype(float).fillna(0.0)
-                  elif 'int' in dtype:
-                       if hasattr(pd, 'Int64Dtype'):
-                            df[col] = pd.to_numeric(df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                       else:
-                            df[col] = pd.to_numeric(df[col], errors='coerce').astype(float).fillna(0.0)
-             except Exception:
-                  if 'float' in dtype or 'int' in dtype:
-                       df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
-    if table_name in DATETIME_COLUMNS:
-         date_col = DATETIME_COLUMNS[table_name]
-         if date_col in df.columns:
-              df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
+    if float_cols:
+        df[float_cols] = numeric_values(df, float_cols, fill_value=0.0)
+    for col, coerce in coercers:
+        try:
+            df[col] = coerce(df[col])
+        except Exception:
+            if coerce is coerce_int:
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+    for col in CATEGORY_COLUMNS.get(table_name, []):
+        df[col] = df[col].astype('category')
     return df
 
+def database_mtime(db_file):
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in (db_file, f"{db_file}-wal"))
+
+@st.cache_data(show_spinner=False, max_entries=len(TABLE_COLUMNS))
+def cached_table(db_file, table_name, mtime):
+    return load_table(db_file, table_name)
+
+def build_table_sql(table_name, expected_cols_dict):
+    sqlite_dtypes = {col: 'REAL' if 'float' in dtype else 'INTEGER' if 'int' in dtype else 'TEXT' for col, dtype in expected_cols_dict.items()}
+    create_sql = f'CREATE TABLE IF NOT EXISTS "{table_name}" (' + ', '.join(f'"{col}" {sqlite_dtypes[col]}' for col in expected_cols_dict) + ')'
+    insert_sql = f'INSERT INTO "{table_name}" (' + ', '.join(f'"{col}"' for col in expected_cols_dict) + ') VALUES (' + ', '.join('?' for _ in expected_cols_dict) + ')'
+    return create_sql, insert_sql
+
+TABLE_SQL = {table_name: build_table_sql(table_name, cols) for table_name, cols in TABLE_COLUMNS.items()}
+
+DELETE_SQL = {
+    table_name: f'DELETE FROM "{table_name}" WHERE rowid = (SELECT rowid FROM "{table_name}" WHERE ' + ' AND '.join(f'"{col}" IS ?' for col in cols) + ' LIMIT 1)'
+    for table_name, cols in TABLE_COLUMNS.items()
+}
+
+def compile_prepare_fn(expected_cols_dict, date_col):
+    expected_cols = list(expected_cols_dict.keys())
+    numeric_cols = [col for col, dtype in expected_cols_dict.items() if 'float' in dtype or 'int' in dtype]
+    int_cols = [col for col, dtype in expected_cols_dict.items() if 'int' in dtype]
+    text_cols = [col for col, dtype in expected_cols_dict.items() if dtype == 'object']
+    def prepare(df):
+        df_to_save = df.reindex(columns=expected_cols)
+        if numeric_cols:
+            df_to_save[numeric_cols] = numeric_values(df_to_save, numeric_cols, fill_value=0.0)
+        for col in int_cols:
+            df_to_save[col] = df_to_save[col].astype(int)
+        if date_col is not None:
+            df_to_save[date_col] = format_iso_dates(df_to_save[date_col])
+        for col in text_cols:
+            df_to_save[col] = normalize_text(df_to_save[col], strip=True)
+        df_to_save = df_to_save.astype(object).where(df_to_save.notna(), None)
+        return list(df_to_save.itertuples(index=False, name=None))
+    return prepare
+
+PREPARE_FNS = {table_name: compile_prepare_fn(cols, DATETIME_COLUMNS.get(table_name)) for table_name, cols in TABLE_COLUMNS.items()}
+
+def compile_save_fn(table_name):
+    create_sql, insert_sql = TABLE_SQL[table_name]
+    prepare = PREPARE_FNS[table_name]
+    def save(df, conn):
+        rows = prepare(df)
+        conn.execute('BEGIN')
+        conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        conn.execute(create_sql)
+        conn.executemany(insert_sql, rows)
+        conn.commit()
+    return save
+
+SAVE_FNS = {table_name: compile_save_fn(table_name) for table_name in TABLE_COLUMNS}
+
 def save_table(df, db_file, table_name):
     conn = get_db_conn()
+    with db_write_lock():
+        try:
+            SAVE_FNS[table_name](df, conn)
+        except sqlite3.Error as e:
+            st.error(f"Error SQLite al guardar '{table_name}': {e}")
+            if conn: conn.rollback()
+        except Exception as e:
+             st.error(f"Error al guardar '{table_name}': {e}")
+             if conn: conn.rollback()
+
+def save_table_changes(df_original, df, db_file, table_name):
+    conn = get_db_conn()
+    create_sql, insert_sql = TABLE_SQL[table_name]
+    prepare = PREPARE_FNS[table_name]
     try:
-        df_to_save = df.copy()
-        expected_cols_dict = TABLE_COLUMNS.get(table_name, {})
-        df_to_save = df_to_save.reindex(columns=list(expected_cols_dict.keys()))
-        for col, dtype in expected_cols_dict.items():
-             if 'float' in dtype or 'int' in dtype:
-                  if col in df_to_save.columns:
-                       df_to_save[col] = pd.to_numeric(df_to_save[col], errors='coerce').fillna(0.0)
-             if dtype == PANDAS_INT_DTYPE:
-                 if col in df_to_save.columns:
-                     df_to_save[col] = pd.to_numeric(df_to_save[col], errors='coerce').fillna(0).astype(int)
-        if table_name in DATETIME_COLUMNS:
-            date_col = DATETIME_COLUMNS[table_name]
-            if date_col in df_to_save.columns:
-                 df_to_save.loc[:, date_col] = pd.to_datetime(df_to_save[date_col], errors='coerce').dt.strftime('%Y-%m-%d').replace({np.nan: None, pd.NA: None, None: None})
-        for col, dtype in expected_cols_dict.items():
-             if dtype == 'object' and col in df_to_save.columns:
-                  df_to_save.loc[:, col] = df_to_save[col].astype(str).str.strip().replace({'nan': None, 'None': None, '': None, str(pd.NA): None}).mask(df_to_save[col].isna(), None)
-        sqlite_dtypes = {col: 'TEXT' for col in expected_cols_dict.keys()}
-        for col, dtype in expected_cols_dict.items():
-             if 'float' in dtype: sqlite_dtypes[col] = 'REAL'
-             elif 'int' in dtype or dtype == PANDAS_INT_DTYPE: sqlite_dtypes[col] = 'INTEGER'
-        df_to_save.to_sql(table_name, conn, if_exists='replace', index=False, dtype=sqlite_dtypes)
-        conn.commit()
-    except sqlite3.Error as e:
-        st.error(f"Error SQLite al guardar '{table_name}': {e}")
-        if conn: conn.rollback()
+        old_rows = Counter(prepare(df_original))
+        new_rows = Counter(prepare(df))
     except Exception as e:
          st.error(f"Error al guardar '{table_name}': {e}")
-         if conn: conn.rollback()
+         return
+    if old_rows == new_rows:
+        return
+    with db_write_lock():
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(create_sql)
+            for row in (old_rows - new_rows).elements():
+                if conn.execute(DELETE_SQL[table_name], row).rowcount != 1:
+                    conn.rollback()
+                    save_table(df, db_file, table_name)
+                    return
+            conn.executemany(insert_sql, (new_rows - old_rows).elements())
+            conn.commit()
+        except sqlite3.Error as e:
+            st.error(f"Error SQLite al guardar '{table_name}': {e}")
+            if conn: conn.rollback()
+        except Exception as e:
+             st.error(f"Error al guardar '{table_name}': {e}")
+             if conn: conn.rollback()
+
+def sql_number(value):
+    if type(value) is float and value == value:
+        return value
+    return 0.0 if value is None or pd.isna(value) else float(value)
+
+def sql_date(value):
+    if type(value) is datetime.date or type(value) is pd.Timestamp:
+        return value.strftime('%Y-%m-%d')
+    return None if value is None or pd.isna(value) else pd.Timestamp(value).strftime('%Y-%m-%d')
+
+def sql_text(value):
+    if type(value) is not str:
+        if value is None or pd.isna(value):
+            return None
+        value = str(value)
+    text = value.strip()
+    return None if text in TEXT_NULL_SENTINELS else text
+
+SQL_ROW_CONVERTERS = {
+    table_name: [
+        (col, sql_date if col == DATETIME_COLUMNS.get(table_name) else sql_number if 'float' in dtype or 'int' in dtype else sql_text)
+        for col, dtype in cols.items()
+    ]
+    for table_name, cols in TABLE_COLUMNS.items()
+}
 
-def calcular_costo_presupuestado(df):
+def insert_rows(db_file, table_name, row_dicts):
+    conn = get_db_conn()
+    create_sql, insert_sql = TABLE_SQL[table_name]
+    converters = SQL_ROW_CONVERTERS[table_name]
+    params = [tuple(convert(row_dict.get(col)) for col, convert in converters) for row_dict in row_dicts]
+    with db_write_lock():
+        try:
+            conn.execute(create_sql)
+            conn.executemany(insert_sql, params)
+            conn.commit()
+        except sqlite3.Error as e:
+            st.error(f"Error SQLite al guardar '{table_name}': {e}")
+            if conn: conn.rollback()
+
+def insert_row(db_file, table_name, row_dict):
+    insert_rows(db_file, table_name, [row_dict])
+
+def replace_row_by_date(db_file, table_name, row_dict):
+    conn = get_db_conn()
+    create_sql, insert_sql = TABLE_SQL[table_name]
+    date_col = DATETIME_COLUMNS[table_name]
+    params = tuple(convert(row_dict.get(col)) for col, convert in SQL_ROW_CONVERTERS[table_name])
+    with db_write_lock():
+        try:
+            conn.execute('BEGIN')
+            conn.execute(create_sql)
+            conn.execute(f'DELETE FROM "{table_name}" WHERE date("{date_col}") = ?', (sql_date(row_dict.get(date_col)),))
+            conn.execute(insert_sql, params)
+            conn.commit()
+        except sqlite3.Error as e:
+            st.error(f"Error SQLite al guardar '{table_name}': {e}")
+            if conn: conn.rollback()
+
+def with_cost_column(df, table_name):
+    cost_col, cantidad_col, precio_col = COST_COLUMNS[table_name]
     df_calc = df.copy()
-    cantidad = pd.to_numeric(df_calc.get('Cantidad_Presupuestada', pd.Series(0.0, index=df_calc.index)), errors='coerce').fillna(0.0)
-    precio_unitario = pd.to_numeric(df_calc.get('Precio_Unitario_Presupuestado', pd.Series(0.0, index=df_calc.index)), errors='coerce').fillna(0.0)
-    if 'Costo_Presupuestado' not in df_calc.columns:
-         df_calc['Costo_Presupuestado'] = 0.0
-    df_calc.loc[:, 'Costo_Presupuestado'] = cantidad * precio_unitario
-    df_calc['Costo_Presupuestado'] = df_calc['Costo_Presupuestado'].astype(float)
+    amounts = numeric_values(df_calc.reindex(columns=[cantidad_col, precio_col]), [cantidad_col, precio_col], fill_value=0.0)
+    df_calc[[cantidad_col, precio_col, cost_col]] = np.column_stack((amounts, amounts[:, 0] * amounts[:, 1]))
     return df_calc
 
+def material_amounts(df, cols):
+    if df.empty or 'Material' not in df.columns:
+        return pd.Index([], dtype=PANDAS_STRING_DTYPE), np.zeros((0, len(cols)), dtype=np.float64)
+    materials = normalize_text(df['Material'], strip=True)
+    valid = materials.notna().to_numpy(dtype=bool)
+    return pd.Index(materials[valid].astype(PANDAS_STRING_DTYPE)), numeric_values(df.reindex(columns=cols), cols, fill_value=0.0)[valid]
+
+def cost_total(df, table_name):
+    cost_col, cantidad_col, precio_col = COST_COLUMNS[table_name]
+    amounts = numeric_values(df.reindex(columns=[cantidad_col, precio_col]), [cantidad_col, precio_col], fill_value=0.0)
+    return float(amounts[:, 0] @ amounts[:, 1])
+
+def calcular_costo_presupuestado(df):
+    return with_cost_column(df, TABLE_PRESUPUESTO_MATERIALES)
+
 def calcular_costo_compra(df):
-    df_calc = df.copy()
-    cantidad = pd.to_numeric(df_calc.get('Cantidad_Comprada', pd.Series(0.0, index=df_calc.index)), errors='coerce').fillna(0.0)
-    precio_unitario = pd.to_numeric(df_calc.get('Precio_Unitario_Comprado', pd.Series(0.0, index=df_calc.index)), errors='coerce').fillna(0.0)
-    if 'Costo_Compra' not in df_calc.columns:
-         df_calc['Costo_Compra'] = 0.0
-    df_calc.loc[:, 'Costo_Compra'] = cantidad * precio_unitario
-    df_calc['Costo_Compra'] = df_calc['Costo_Compra'].astype(float)
-    return df_calc
+    return with_cost_column(df, TABLE_COMPRAS_MATERIALES)
 
 def calcular_costo_asignado(df):
-    df_calc = df.copy()
-    cantidad = pd.to_numeric(df_calc.get('Cantidad_Asignada', pd.Series(0.0, index=df_calc.index)), errors='coerce').fillna(0.0)
-    precio_unitario = pd.to_numeric(df_calc.get('Precio_Unitario_Asignado', pd.Series(0.0, index=df_calc.index)), errors='coerce').fillna(0.0)
-    if 'Costo_Asignado' not in df_calc.columns:
-         df_calc['Costo_Asignado'] = 0.0
-    df_calc.loc[:, 'Costo_Asignado'] = cantidad * precio_unitario
-    df_calc['Costo_Asignado'] = df_calc['Costo_Asignado'].astype(float)
-    return df_calc
+    return with_cost_column(df, TABLE_ASIGNACION_MATERIALES)
+
+def append_row(df, row_dict, expected_cols):
+    if list(df.columns) != expected_cols or not df.index.equals(pd.RangeIndex(len(df))):
+        df = df.reindex(columns=expected_cols).reset_index(drop=True)
+    values = [row_dict.get(col) for col in expected_cols]
+    position = len(df)
+    df = df.reindex(pd.RangeIndex(position + 1))
+    for col, value in zip(expected_cols, values):
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and value is not None and value not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories([value])
+    try:
+        df.iloc[position] = values
+    except (TypeError, ValueError):
+        df = df.astype(object)
+        df.iloc[position] = values
+    return df
+
+def mark_editor_dirty(flag_key):
+    st.session_state[flag_key] = True
+
+def ensure_columns(df, cols):
+    return df if list(df.columns) == cols else df.reindex(columns=cols)
+
+def hash_rows(df, cols):
+    df = ensure_columns(df, cols)
+    date_cols = df.select_dtypes(include='datetime').columns
+    if len(date_cols):
+        df = df.astype({col: 'datetime64[ns]' for col in date_cols})
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def frame_fingerprint(df, cols):
+    return int(hash_rows(df, cols).sum(dtype=np.uint64))
+
+def session_memo(key, df, build):
+    cached = st.session_state.get(key)
+    if cached is None or cached[0] is not df or cached[1] != len(df):
+        cached = (df, len(df), build())
+        st.session_state[key] = cached
+    return cached[2]
+
+def derived_fingerprint(key, source, df, cols):
+    return session_memo(key, source, lambda: frame_fingerprint(df, cols))
+
+def stored_fingerprint(table_name, df):
+    return derived_fingerprint(f"fp_{table_name}", df, df, EXPECTED_COLS[table_name])
+
+def canonical_entry(table_name, df):
+    def build():
+        clean = df.reindex(columns=EXPECTED_COLS[table_name])
+        schema = SCHEMAS[table_name]
+        float_cols = [col for col in FLOAT_COLS[table_name] if clean[col].dtype != np.float64]
+        if float_cols:
+            clean[float_cols] = numeric_values(clean, float_cols, fill_value=0.0)
+        for col, coerce in COERCERS[table_name]:
+            if coerce is coerce_float:
+                continue
+            if coerce is normalize_text:
+                clean[col] = normalize_text(clean[col], strip=col in KEY_TEXT_COLUMNS)
+            elif clean[col].dtype != schema.get(col):
+                try:
+                    clean[col] = coerce(clean[col])
+                except (TypeError, ValueError):
+                    pass
+        date_ns = None
+        if table_name in DATETIME_COLUMNS:
+            date_ns, order = sorted_by_date(clean[DATETIME_COLUMNS[table_name]], np.arange(len(clean)))
+            clean = clean.iloc[order]
+        return clean, date_ns
+    return session_memo(f"clean_{table_name}", df, build)
+
+def clean_text_column(table_name, df, col):
+    return session_memo(f"clean_{table_name}_{col}", df, lambda: normalize_text(df[col], strip=True))
+
+def text_equals(table_name, df, col, value):
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return clean_text_column(table_name, df, col).eq(str(value)).fillna(False).to_numpy(dtype=bool)
+
+def text_positions(table_name, df, col):
+    def build():
+        clean = clean_text_column(table_name, df, col) if col in df.columns else pd.Series(dtype=PANDAS_STRING_DTYPE)
+        return clean.groupby(clean, sort=False).indices
+    return session_memo(f"positions_{table_name}_{col}", df, build)
+
+def id_set(table_name, df, col):
+    return session_memo(f"ids_{table_name}_{col}", df, lambda: frozenset(df[col].astype(str)) if col in df.columns else frozenset())
+
+def rows_matching(table_name, df, col, value):
+    return df.iloc[text_positions(table_name, df, col).get(str(value), np.empty(0, dtype=np.intp))]
+
+def date_slice(table_name, df, start_ts, end_ts):
+    clean, date_ns = canonical_entry(table_name, df)
+    lo = np.searchsorted(date_ns, pd.Timestamp(start_ts).value, side='left')
+    hi = np.searchsorted(date_ns, pd.Timestamp(end_ts).value, side='right')
+    return clean.iloc[lo:hi]
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def list_internos(equipos_fingerprint, _internos):
+    return sorted({str(i).strip() for i in _internos.dropna().unique() if str(i).strip() != ''})
+
+def dimension_map(keys, values):
+    keys = normalize_text(keys, strip=True)
+    valid = keys.notna().to_numpy()
+    return dict(zip(keys[valid], values[valid]))
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def equipo_lookups(equipos_fingerprint, flotas_fingerprint, _df_equipos, _df_flotas):
+    interno_to_patente = dimension_map(_df_equipos['Interno'], normalize_text(_df_equipos['Patente'], strip=True))
+    interno_to_flota = dimension_map(_df_equipos['Interno'], normalize_text(_df_equipos['ID_Flota'], strip=True))
+    flota_to_nombre = dimension_map(_df_flotas['ID_Flota'], _df_flotas['Nombre_Flota'])
+    return interno_to_patente, interno_to_flota, flota_to_nombre
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def obra_names(proyectos_fingerprint, _df_proyectos):
+    return dimension_map(_df_proyectos['ID_Obra'], _df_proyectos['Nombre_Obra'])
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def obra_options(proyectos_fingerprint, _df_proyectos):
+    ids = _df_proyectos['ID_Obra']
+    stripped = stripped_text(ids)
+    valid = stripped.ne('').fillna(False).to_numpy(dtype=bool)
+    disponibles = sorted(stripped[valid].unique().tolist())
+    selectable = valid & stripped.eq(ids.astype(PANDAS_STRING_DTYPE)).fillna(False).to_numpy(dtype=bool)
+    selected_ids = ids[selectable].astype(str)
+    labels = (_df_proyectos['Nombre_Obra'][selectable].astype(str).fillna('nan') + ' (ID: ' + selected_ids + ')').to_numpy(dtype=object)
+    order = np.argsort(labels, kind='stable')
+    labels, selected_ids = labels[order].tolist(), selected_ids.to_numpy(dtype=object)[order].tolist()
+    return disponibles, labels, dict(zip(labels, selected_ids))
+
+def obra_chart_labels(df):
+    names = df['Nombre_Obra']
+    labels = names.astype(str).where(stripped_text(names).ne('').fillna(False), df['ID_Obra'].astype(str) + ' (Desconocida)')
+    return labels.where(labels.str.len() <= 25, labels.str[:22] + '...')
+
+def obra_labels(ids, df_proyectos):
+    fallback = ('Obra ID: ' + ids.astype(str)).where(ids != 'ID Desconocida', 'ID Desconocida')
+    if 'ID_Obra' not in df_proyectos.columns or 'Nombre_Obra' not in df_proyectos.columns:
+        return fallback
+    return ids.map(obra_names(stored_fingerprint(TABLE_PROYECTOS, df_proyectos), df_proyectos)).fillna(fallback)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def obra_variacion(obra_id, presupuesto_fingerprint, asignacion_fingerprint, _df_presupuesto, _df_asignacion):
+    presupuesto_materiales, presupuesto_amounts = material_amounts(_df_presupuesto, ['Cantidad_Presupuestada', 'Costo_Presupuestado'])
+    asignacion_materiales, asignacion_amounts = material_amounts(calcular_costo_asignado(_df_asignacion), ['Cantidad_Asignada', 'Costo_Asignado'])
+    material_index = presupuesto_materiales.append(asignacion_materiales).unique().sort_values()
+    amount_cols = ['Cantidad_Presupuestada', 'Cantidad_Asignada', 'Costo_Presupuestado', 'Costo_Asignado']
+    amounts = np.zeros((len(material_index), len(amount_cols)), dtype=np.float64)
+    for materiales, values, targets in ((presupuesto_materiales, presupuesto_amounts, (0, 2)), (asignacion_materiales, asignacion_amounts, (1, 3))):
+        positions = material_index.get_indexer(materiales)
+        for source, target in enumerate(targets):
+            amounts[:, target] = np.bincount(positions, weights=values[:, source], minlength=len(material_index))
+    variacion_obra = pd.DataFrame({'Material': material_index})
+    variacion_obra[amount_cols + ['Cantidad_Variacion', 'Costo_Variacion']] = np.hstack((amounts, amounts[:, [1, 3]] - amounts[:, [0, 2]]))
+    costo_presupuestado_total, costo_asignado_total = amounts[:, 2:].sum(axis=0)
+    return variacion_obra, float(costo_presupuestado_total), float(costo_asignado_total)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cost_editor_frame(table_name, fingerprint, _df, text_cols):
+    date_col = DATETIME_COLUMNS[table_name]
+    df = with_cost_column(_df, table_name).reindex(columns=EXPECTED_COLS[table_name])
+    df[date_col] = coerce_date(df[date_col])
+    for col in text_cols:
+        df[col] = blank_to_na(df[col])
+    return df
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def last_price_by_material(compras_fingerprint, _df_compras):
+    purchases = pd.DataFrame({
+        'Material': stripped_text(_df_compras['Material']).str.lower(),
+        'Precio': pd.to_numeric(_df_compras['Precio_Unitario_Comprado'], errors='coerce'),
+        'Fecha': coerce_date(_df_compras[DATETIME_COLUMNS[TABLE_COMPRAS_MATERIALES]]),
+    }).dropna(subset=['Material', 'Precio'])
+    latest = purchases.sort_values('Fecha', kind='stable', na_position='first').drop_duplicates('Material', keep='last')
+    return dict(zip(latest['Material'].tolist(), latest['Precio'].tolist()))
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def flota_label_maps(flotas_fingerprint, _df_flotas):
+    ids, nombres = _df_flotas['ID_Flota'], _df_flotas['Nombre_Flota']
+    selectable = (ids.astype(str).str.strip() != '') & (nombres.astype(str).str.strip() != '') & ids.notna() & nombres.notna()
+    display_labels = {str(i): f"{n} (ID: {i})" for i, n in zip(ids[selectable], nombres[selectable])}
+    options = sorted(((display_labels[str(i)], i) for i in ids[selectable]), key=lambda x: x[0])
+    names = {str(i).strip(): str(n) for i, n in zip(ids, nombres) if pd.notna(i) and pd.notna(n) and str(i).strip() != ''}
+    return display_labels, options, names
+
+@functools.lru_cache(maxsize=4)
+def internos_categorical_dtype(internos):
+    return pd.CategoricalDtype(categories=list(internos))
+
+@functools.lru_cache(maxsize=4)
+def arrow_value_set(categorical_dtype):
+    return pa.array(categorical_dtype.categories.astype(str).tolist(), type=pa.string())
+
+def invalid_values(series, categorical_dtype):
+    if pc is not None and getattr(series.dtype, 'storage', None) == 'pyarrow':
+        values = pa.array(series.array)
+        unknown = pc.invert(pc.is_in(values, value_set=arrow_value_set(categorical_dtype)))
+        return pc.unique(pc.filter(values, unknown)).drop_null().to_pylist()
+    unknown = categorical_dtype.categories.get_indexer(series) == -1
+    return series[unknown & series.notna().to_numpy()].unique().tolist()
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_date_range(fingerprints, _frames):
+    mins, maxs = [], []
+    for table_name, date_col in DATETIME_COLUMNS.items():
+        df = _frames[table_name]
+        if date_col in df.columns and not df.empty:
+            dates = coerce_date(df[date_col])
+            first_date = dates.min()
+            if pd.notna(first_date):
+                mins.append(first_date)
+                maxs.append(dates.max())
+    return (min(mins).date(), max(maxs).date()) if mins else (None, None)
+
+def app_date_range():
+    frames = {table_name: st.session_state.get(f'df_{table_name.lower()}', pd.DataFrame()) for table_name in DATETIME_COLUMNS}
+    return cached_date_range(tuple(stored_fingerprint(table_name, df) for table_name, df in frames.items()), frames)
+
+def refresh_cost_column(table_name):
+    conn = get_db_conn()
+    cost_col, cantidad_col, precio_col = COST_COLUMNS[table_name]
+    with db_write_lock():
+        try:
+            conn.execute(f'UPDATE "{table_name}" SET "{cost_col}" = COALESCE("{cantidad_col}", 0) * COALESCE("{precio_col}", 0) WHERE "{cost_col}" IS NOT COALESCE("{cantidad_col}", 0) * COALESCE("{precio_col}", 0)')
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
 
 def load_data_into_session_state():
     tables_to_load = {
@@ -178,13 +713,9 @@ def load_data_into_session_state():
     }
     for ss_key, table_name in tables_to_load.items():
         if ss_key not in st.session_state:
-            st.session_state[ss_key] = load_table(DATABASE_FILE, table_name)
-            if table_name == TABLE_PRESUPUESTO_MATERIALES:
-                st.session_state[ss_key] = calcular_costo_presupuestado(st.session_state[ss_key])
-            elif table_name == TABLE_COMPRAS_MATERIALES:
-                 st.session_state[ss_key] = calcular_costo_compra(st.session_state[ss_key])
-            elif table_name == TABLE_ASIGNACION_MATERIALES:
-                 st.session_state[ss_key] = calcular_costo_asignado(st.session_state[ss_key])
+            if table_name in COST_COLUMNS:
+                refresh_cost_column(table_name)
+            st.session_state[ss_key] = cached_table(DATABASE_FILE, table_name, database_mtime(DATABASE_FILE))
 
 load_data_into_session_state()
 
@@ -204,32 +735,10 @@ def page_flotas():
             elif nombre_flota.lower() in st.session_state.df_flotas['Nombre_Flota'].astype(str).str.strip().str.lower().tolist():
                  st.warning(f"La flota '{nombre_flota}' ya existe.")
             else:
-                existing_ids = set(st.session_state.df_flotas['ID_Flota'].astype(str).tolist())
-                base_id = f"FLOTA_{int(time.time() * 1e6)}"
-                id_flota = base_id
-                counter = 0
-                while id_flota in existing_ids:
-                    counter += 1
-                    id_flota = f"{base_id}_{counter}"
+                id_flota = unique_id(f"FLOTA_{int(time.time() * 1e6)}", id_set(TABLE_FLOTAS, st.session_state.df_flotas, 'ID_Flota'))
                 new_flota_data = {'ID_Flota': id_flota, 'Nombre_Flota': nombre_flota}
-                new_flota_df = pd.DataFrame([new_flota_data])
-                expected_cols_flotas = list(TABLE_COLUMNS[TABLE_FLOTAS].keys())
-                new_flota_df = new_flota_df.reindex(columns=expected_cols_flotas)
-                for col, dtype in TABLE_COLUMNS[TABLE_FLOTAS].items():
-                     if col in new_flota_df.columns:
-                           try:
-                                if dtype == 'object':
-                                     new_flota_df[col] = new_flota_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                     new_flota_df[col] = new_flota_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                                elif 'float' in dtype: new_flota_df[col] = pd.to_numeric(new_flota_df[col], errors='coerce').astype(float).fillna(0.0)
-                                elif 'int' in dtype:
-                                     if hasattr(pd, 'Int64Dtype'): new_flota_df[col] = pd.to_numeric(new_flota_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                     else: new_flota_df[col] = pd.to_numeric(new_flota_df[col], errors='coerce').astype(float).fillna(0.0)
-                           except Exception as dtype_e:
-                                st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                df_current_flotas_reindexed = st.session_state.df_flotas.reindex(columns=expected_cols_flotas)
-                st.session_state.df_flotas = pd.concat([df_current_flotas_reindexed, new_flota_df], ignore_index=True)
-                save_table(st.session_state.df_flotas, DATABASE_FILE, TABLE_FLOTAS)
+                st.session_state.df_flotas = append_row(st.session_state.df_flotas, new_flota_data, EXPECTED_COLS[TABLE_FLOTAS])
+                insert_row(DATABASE_FILE, TABLE_FLOTAS, new_flota_data)
                 st.success(f"Flota '{nombre_flota}' añadida con ID: {id_flota}.")
                 st.experimental_rerun()
 
@@ -238,11 +747,11 @@ def page_flotas():
          st.info("No hay flotas registradas aún.")
     else:
         st.info("Edite la tabla siguiente para modificar o eliminar flotas.")
-        df_flotas_editable = st.session_state.df_flotas.copy()
-        expected_cols_flotas = list(TABLE_COLUMNS[TABLE_FLOTAS].keys())
+        df_flotas_editable = st.session_state.df_flotas
+        expected_cols_flotas = EXPECTED_COLS[TABLE_FLOTAS]
         df_flotas_editable = df_flotas_editable.reindex(columns=expected_cols_flotas)
         if 'ID_Flota' in df_flotas_editable.columns:
-             df_flotas_editable['ID_Flota'] = df_flotas_editable['ID_Flota'].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+             df_flotas_editable['ID_Flota'] = blank_to_na(df_flotas_editable['ID_Flota'])
         df_flotas_edited = st.data_editor(
             df_flotas_editable, key="data_editor_flotas", num_rows="dynamic",
             column_config={
@@ -252,38 +761,26 @@ def page_flotas():
         )
         df_flotas_edited_processed = df_flotas_edited.copy()
         df_flotas_edited_processed = df_flotas_edited_processed.reindex(columns=expected_cols_flotas)
-        new_row_mask = df_flotas_edited_processed['ID_Flota'].isna() | (df_flotas_edited_processed['ID_Flota'].astype(str).str.strip() == '')
+        new_row_mask = df_flotas_edited_processed['ID_Flota'].isna() | (stripped_text(df_flotas_edited_processed['ID_Flota']) == '')
         if new_row_mask.any():
-             existing_ids = set(st.session_state.df_flotas['ID_Flota'].astype(str).tolist())
-             new_ids_batch = []
-             for i in range(new_row_mask.sum()):
-                  base_id = f"FLOTA_EDIT_{int(time.time() * 1e6)}_{i}"
-                  unique_id = base_id
-                  counter = 0
-                  while unique_id in existing_ids or unique_id in new_ids_batch:
-                      counter += 1
-                      unique_id = f"{base_id}_{counter}"
-                  new_ids_batch.append(unique_id)
+             new_ids_batch = new_batch_ids("FLOTA_EDIT", int(new_row_mask.sum()), id_set(TABLE_FLOTAS, st.session_state.df_flotas, 'ID_Flota'))
              df_flotas_edited_processed.loc[new_row_mask, 'ID_Flota'] = new_ids_batch
         if 'Nombre_Flota' in df_flotas_edited_processed.columns:
-             df_flotas_edited_processed['Nombre_Flota'] = df_flotas_edited_processed['Nombre_Flota'].astype(str).str.strip().replace({'': None}).mask(df_flotas_edited_processed['Nombre_Flota'].isna(), None)
-        df_flotas_original_compare = st.session_state.df_flotas.reindex(columns=expected_cols_flotas).sort_values(by=expected_cols_flotas).reset_index(drop=True)
-        df_flotas_edited_compare = df_flotas_edited_processed.reindex(columns=expected_cols_flotas).sort_values(by=expected_cols_flotas).reset_index(drop=True)
-        if not df_flotas_edited_compare.equals(df_flotas_original_compare):
+             df_flotas_edited_processed['Nombre_Flota'] = normalize_text(df_flotas_edited_processed['Nombre_Flota'], strip=True)
+        if frame_fingerprint(df_flotas_edited_processed, expected_cols_flotas) != stored_fingerprint(TABLE_FLOTAS, st.session_state.df_flotas):
              if st.button("Guardar Cambios en Lista de Flotas", key="save_flotas_button"):
-                  df_to_save = df_flotas_edited_processed.copy()
-                  df_to_save = df_to_save[df_to_save['Nombre_Flota'].notna()].copy()
+                  df_to_save = df_flotas_edited_processed[df_flotas_edited_processed['Nombre_Flota'].notna()].copy()
                   if df_to_save.empty and not df_flotas_edited_processed.empty:
                        st.error("Error: Ninguna fila válida. Complete Nombre de Flota.")
-                  elif df_to_save['Nombre_Flota'].astype(str).str.strip().str.lower().duplicated().any():
+                  elif has_duplicate_text(df_to_save['Nombre_Flota'], casefold=True):
                        st.error("Error: Nombres de flotas duplicados.")
-                  elif df_to_save['ID_Flota'].astype(str).str.strip().duplicated().any():
+                  elif has_duplicate_text(df_to_save['ID_Flota']):
                         st.error("Error: IDs de flota duplicados.")
                   else:
                        if 'ID_Flota' in df_to_save.columns:
-                           df_to_save['ID_Flota'] = df_to_save['ID_Flota'].astype(str).str.strip().replace({'': None}).mask(df_to_save['ID_Flota'].isna(), None)
+                           df_to_save['ID_Flota'] = normalize_text(df_to_save['ID_Flota'], strip=True)
+                       save_table_changes(st.session_state.df_flotas, df_to_save, DATABASE_FILE, TABLE_FLOTAS)
                        st.session_state.df_flotas = df_to_save
-                       save_table(st.session_state.df_flotas, DATABASE_FILE, TABLE_FLOTAS)
                        st.success("Cambios en flotas guardados.")
                        st.experimental_rerun()
              else:
@@ -299,25 +796,14 @@ def page_equipos():
     # For brevity, I'll skip pasting the whole function if no 'required' argument issue is present.
     # However, the user asked for the *complete* code. I'll paste it and ensure no st.number_input(..., required=True) is there.
     st.write("Aquí puedes añadir, editar y eliminar equipos.")
-    flotas_disponibles_for_select = st.session_state.df_flotas[
-         (st.session_state.df_flotas['ID_Flota'].astype(str).str.strip() != '') &
-         (st.session_state.df_flotas['Nombre_Flota'].astype(str).str.strip() != '') &
-         (st.session_state.df_flotas['ID_Flota'].notna()) &
-         (st.session_state.df_flotas['Nombre_Flota'].notna())
-    ].copy()
-    flota_id_to_display_label = {
-         str(row['ID_Flota']): f"{row['Nombre_Flota']} (ID: {row['ID_Flota']})"
-         for index, row in flotas_disponibles_for_select.iterrows()
-    }
+    flota_id_to_display_label, flota_sorted_options, flota_id_to_name = flota_label_maps(
+         stored_fingerprint(TABLE_FLOTAS, st.session_state.df_flotas), st.session_state.df_flotas)
     null_flota_label = "Sin Flota"
     flota_id_to_display_label[str(pd.NA)] = null_flota_label
     flota_id_to_display_label['nan'] = null_flota_label
     flota_id_to_display_label['None'] = null_flota_label
     flota_id_to_display_label[''] = null_flota_label
-    flota_options_list = [(null_flota_label, pd.NA)] + \
-                          sorted([(flota_id_to_display_label[str(row['ID_Flota'])], row['ID_Flota'])
-                                  for index, row in flotas_disponibles_for_select.iterrows()],
-                                 key=lambda x: x[0])
+    flota_options_list = [(null_flota_label, pd.NA)] + flota_sorted_options
     flota_option_labels = [item[0] for item in flota_options_list]
     flota_label_to_value = dict(flota_options_list)
     if not flota_option_labels or (len(flota_option_labels) == 1 and flota_option_labels[0] == null_flota_label):
@@ -341,24 +827,8 @@ def page_equipos():
                 st.warning(f"Ya existe un equipo con Interno '{interno}'.")
             else:
                 new_equipo_data = {'Interno': interno, 'Patente': patente, 'ID_Flota': selected_flota_value}
-                new_equipo_df = pd.DataFrame([new_equipo_data])
-                expected_cols_equipos = list(TABLE_COLUMNS[TABLE_EQUIPOS].keys())
-                new_equipo_df = new_equipo_df.reindex(columns=expected_cols_equipos)
-                for col, dtype in TABLE_COLUMNS[TABLE_EQUIPOS].items():
-                     if col in new_equipo_df.columns:
-                          try:
-                              if dtype == 'object':
-                                  new_equipo_df[col] = new_equipo_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                  new_equipo_df[col] = new_equipo_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                              elif 'float' in dtype: new_equipo_df[col] = pd.to_numeric(new_equipo_df[col], errors='coerce').astype(float).fillna(0.0)
-                              elif 'int' in dtype:
-                                   if hasattr(pd, 'Int64Dtype'): new_equipo_df[col] = pd.to_numeric(new_equipo_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                   else: new_equipo_df[col] = pd.to_numeric(new_equipo_df[col], errors='coerce').astype(float).fillna(0.0)
-                          except Exception as dtype_e:
-                               st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                df_current_equipos_reindexed = st.session_state.df_equipos.reindex(columns=expected_cols_equipos)
-                st.session_state.df_equipos = pd.concat([df_current_equipos_reindexed, new_equipo_df], ignore_index=True)
-                save_table(st.session_state.df_equipos, DATABASE_FILE, TABLE_EQUIPOS)
+                st.session_state.df_equipos = append_row(st.session_state.df_equipos, new_equipo_data, EXPECTED_COLS[TABLE_EQUIPOS])
+                insert_row(DATABASE_FILE, TABLE_EQUIPOS, new_equipo_data)
                 flota_name_display = flota_id_to_display_label.get(str(selected_flota_value), null_flota_label)
                 st.success(f"Equipo {interno} ({patente}) añadido a flota '{flota_name_display}'.")
                 st.experimental_rerun()
@@ -368,13 +838,11 @@ def page_equipos():
         st.info("No hay equipos registrados aún.")
     else:
         st.info("Edite la tabla siguiente para modificar o eliminar equipos.")
-        df_equipos_editable = st.session_state.df_equipos.copy()
+        df_equipos_editable = st.session_state.df_equipos
         flota_ids_for_editor = st.session_state.df_flotas['ID_Flota'].dropna().astype(str).unique().tolist()
         flota_editor_options_values = [str(pd.NA)] + flota_ids_for_editor
         flota_editor_options_values = list(dict.fromkeys(flota_editor_options_values))
-        flota_id_to_name_editor = {str(row['ID_Flota']).strip(): str(row['Nombre_Flota'])
-                                   for index, row in st.session_state.df_flotas.iterrows()
-                                   if pd.notna(row['ID_Flota']) and pd.notna(row['Nombre_Flota']) and str(row['ID_Flota']).strip() != ''}
+        flota_id_to_name_editor = flota_id_to_name
         flota_id_to_name_editor[str(pd.NA)] = null_flota_label
         flota_id_to_name_editor['nan'] = null_flota_label
         flota_id_to_name_editor['None'] = null_flota_label
@@ -387,11 +855,9 @@ def page_equipos():
                 return flota_id_to_name_editor.get(id_str_clean, f"ID Desconocido ({id_str_clean})")
             except Exception:
                  return f"Error ({id_value})"
-        expected_cols_equipos = list(TABLE_COLUMNS[TABLE_EQUIPOS].keys())
+        expected_cols_equipos = EXPECTED_COLS[TABLE_EQUIPOS]
         df_equipos_editable = df_equipos_editable.reindex(columns=expected_cols_equipos)
-        df_equipos_editable['ID_Flota'] = df_equipos_editable['ID_Flota'].apply(
-             lambda x: str(x).strip() if pd.notna(x) and str(x).strip() != '' else pd.NA
-        )
+        df_equipos_editable['ID_Flota'] = blank_to_na(stripped_text(df_equipos_editable['ID_Flota']))
         df_equipos_edited = st.data_editor(
             df_equipos_editable, key="data_editor_equipos", num_rows="dynamic",
             column_config={
@@ -406,26 +872,21 @@ def page_equipos():
         df_equipos_edited_processed = df_equipos_edited.copy()
         df_equipos_edited_processed = df_equipos_edited_processed.reindex(columns=expected_cols_equipos)
         if 'ID_Flota' in df_equipos_edited_processed.columns:
-             df_equipos_edited_processed['ID_Flota'] = df_equipos_edited_processed['ID_Flota'].apply(
-                 lambda x: pd.NA if pd.isna(x) or str(x).strip() == '' or str(x).lower() in ['nan', 'none', 'na'] else x
-             )
-             df_equipos_edited_processed['ID_Flota'] = df_equipos_edited_processed['ID_Flota'].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({pd.NA: None})
+             flota_ids = df_equipos_edited_processed['ID_Flota'].astype(PANDAS_STRING_DTYPE)
+             df_equipos_edited_processed['ID_Flota'] = flota_ids.mask((stripped_text(flota_ids).eq('') | flota_ids.str.lower().isin(['nan', 'none', 'na'])).fillna(False), pd.NA)
         for col in ['Interno', 'Patente']:
             if col in df_equipos_edited_processed.columns:
-                 df_equipos_edited_processed[col] = df_equipos_edited_processed[col].astype(str).str.strip().replace({'': None}).mask(df_equipos_edited_processed[col].isna(), None)
-        df_equipos_original_compare = st.session_state.df_equipos.reindex(columns=expected_cols_equipos).sort_values(by=expected_cols_equipos).reset_index(drop=True)
-        df_equipos_edited_compare = df_equipos_edited_processed.reindex(columns=expected_cols_equipos).sort_values(by=expected_cols_equipos).reset_index(drop=True)
-        if not df_equipos_edited_compare.equals(df_equipos_original_compare):
+                 df_equipos_edited_processed[col] = normalize_text(df_equipos_edited_processed[col], strip=True)
+        if frame_fingerprint(df_equipos_edited_processed, expected_cols_equipos) != stored_fingerprint(TABLE_EQUIPOS, st.session_state.df_equipos):
              if st.button("Guardar Cambios en Lista de Equipos", key="save_equipos_button"):
-                  df_to_save = df_equipos_edited_processed.copy()
-                  df_to_save = df_to_save[(df_to_save['Interno'].notna()) & (df_to_save['Patente'].notna())].copy()
+                  df_to_save = df_equipos_edited_processed[(df_equipos_edited_processed['Interno'].notna()) & (df_equipos_edited_processed['Patente'].notna())].copy()
                   if df_to_save.empty and not df_equipos_edited_processed.empty:
                        st.error("Error: Ninguna fila válida. Complete Interno y Patente.")
-                  elif df_to_save['Interno'].astype(str).str.strip().str.lower().duplicated().any():
+                  elif has_duplicate_text(df_to_save['Interno'], casefold=True):
                        st.error("Error: Internos de Equipo duplicados.")
                   else:
+                       save_table_changes(st.session_state.df_equipos, df_to_save, DATABASE_FILE, TABLE_EQUIPOS)
                        st.session_state.df_equipos = df_to_save
-                       save_table(st.session_state.df_equipos, DATABASE_FILE, TABLE_EQUIPOS)
                        st.success("Cambios en equipos guardados.")
                        st.experimental_rerun()
              else:
@@ -435,9 +896,7 @@ def page_consumibles():
     st.title("Registro de Consumibles por Equipo")
     st.write("Aquí puedes registrar el consumo de combustible, horas y kilómetros por equipo y fecha.")
 
-    internos_disponibles = st.session_state.df_equipos['Interno'].unique().tolist()
-    internos_disponibles = [str(i).strip() for i in internos_disponibles if pd.notna(i) and str(i).strip() != '']
-    internos_disponibles.sort()
+    internos_disponibles = list_internos(stored_fingerprint(TABLE_EQUIPOS, st.session_state.df_equipos), st.session_state.df_equipos['Interno'])
 
     if not internos_disponibles:
         st.warning("No hay equipos registrados. Por favor, añada equipos primero para registrar consumibles.")
@@ -464,33 +923,13 @@ def page_consumibles():
             else:
                  new_consumo_data = {
                     'Interno': str(interno_seleccionado).strip(),
-                    'Fecha': fecha,
+                    'Fecha': pd.Timestamp(fecha),
                     'Consumo_Litros': float(consumo_litros if consumo_litros is not None else 0.0), # Handle None before float conversion
                     'Horas_Trabajadas': float(horas_trabajadas if horas_trabajadas is not None else 0.0),
                     'Kilometros_Recorridos': float(kilometros_recorridos if kilometros_recorridos is not None else 0.0)
                  }
-                 new_consumo_df = pd.DataFrame([new_consumo_data])
-                 expected_cols_consumo = list(TABLE_COLUMNS[TABLE_CONSUMO].keys())
-                 new_consumo_df = new_consumo_df.reindex(columns=expected_cols_consumo)
-                 date_col_name_consumo = DATETIME_COLUMNS[TABLE_CONSUMO]
-                 if date_col_name_consumo in new_consumo_df.columns:
-                      new_consumo_df[date_col_name_consumo] = pd.to_datetime(new_consumo_df[date_col_name_consumo], errors='coerce')
-                 for col, dtype in TABLE_COLUMNS[TABLE_CONSUMO].items():
-                     if col in new_consumo_df.columns:
-                           try:
-                                if dtype == 'object':
-                                     new_consumo_df[col] = new_consumo_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                     new_consumo_df[col] = new_consumo_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                                elif 'float' in dtype:
-                                      new_consumo_df[col] = pd.to_numeric(new_consumo_df[col], errors='coerce').astype(float).fillna(0.0)
-                                elif 'int' in dtype:
-                                     if hasattr(pd, 'Int64Dtype'): new_consumo_df[col] = pd.to_numeric(new_consumo_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                     else: new_consumo_df[col] = pd.to_numeric(new_consumo_df[col], errors='coerce').astype(float).fillna(0.0)
-                           except Exception as dtype_e:
-                                st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                 df_current_consumo_reindexed = st.session_state.df_consumo.reindex(columns=expected_cols_consumo)
-                 st.session_state.df_consumo = pd.concat([df_current_consumo_reindexed, new_consumo_df], ignore_index=True)
-                 save_table(st.session_state.df_consumo, DATABASE_FILE, TABLE_CONSUMO)
+                 st.session_state.df_consumo = append_row(st.session_state.df_consumo, new_consumo_data, EXPECTED_COLS[TABLE_CONSUMO])
+                 insert_row(DATABASE_FILE, TABLE_CONSUMO, new_consumo_data)
                  st.success("Registro de consumo añadido.")
                  st.experimental_rerun()
 
@@ -500,18 +939,18 @@ def page_consumibles():
          st.info("No hay registros de consumo aún.")
     else:
         st.info("Edite la tabla siguiente para modificar o eliminar registros.")
-        df_consumo_editable = st.session_state.df_consumo.copy()
+        df_consumo_editable = st.session_state.df_consumo.copy(deep=False)
         date_col_name_consumo = DATETIME_COLUMNS[TABLE_CONSUMO]
         if date_col_name_consumo in df_consumo_editable.columns:
-             df_consumo_editable[date_col_name_consumo] = pd.to_datetime(df_consumo_editable[date_col_name_consumo], errors='coerce')
+             df_consumo_editable[date_col_name_consumo] = coerce_date(df_consumo_editable[date_col_name_consumo])
         else:
              df_consumo_editable[date_col_name_consumo] = pd.Series(dtype='datetime64[ns]', index=df_consumo_editable.index)
-        expected_cols_consumo = list(TABLE_COLUMNS[TABLE_CONSUMO].keys())
+        expected_cols_consumo = EXPECTED_COLS[TABLE_CONSUMO]
         df_consumo_editable = df_consumo_editable.reindex(columns=expected_cols_consumo)
         if 'Interno' in df_consumo_editable.columns:
-             df_consumo_editable['Interno'] = df_consumo_editable['Interno'].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+             df_consumo_editable['Interno'] = blank_to_na(df_consumo_editable['Interno'])
         df_consumo_edited = st.data_editor(
-             df_consumo_editable, key="data_editor_consumo", num_rows="dynamic",
+             df_consumo_editable, key="data_editor_consumo", num_rows="dynamic", on_change=mark_editor_dirty, args=("consumo_editor_dirty",),
              column_config={
                   date_col_name_consumo: st.column_config.DateColumn("Fecha", required=True),
                   "Interno": st.column_config.TextColumn("Interno", required=True),
@@ -520,45 +959,40 @@ def page_consumibles():
                   "Kilometros_Recorridos": st.column_config.NumberColumn("Kilómetros Recorridos", min_value=0.0, format="%.2f", required=True),
              }
          )
-        df_consumo_edited_processed = df_consumo_edited.copy()
-        df_consumo_edited_processed = df_consumo_edited_processed.reindex(columns=expected_cols_consumo)
-        if 'Interno' in df_consumo_edited_processed.columns:
-             df_consumo_edited_processed['Interno'] = df_consumo_edited_processed['Interno'].astype(str).str.strip().replace({'': None}).mask(df_consumo_edited_processed['Interno'].isna(), None)
-        df_consumo_original_compare = st.session_state.df_consumo.reindex(columns=expected_cols_consumo).sort_values(by=expected_cols_consumo).reset_index(drop=True)
-        df_consumo_edited_compare = df_consumo_edited_processed.reindex(columns=expected_cols_consumo).sort_values(by=expected_cols_consumo).reset_index(drop=True)
-        if not df_consumo_edited_compare.equals(df_consumo_original_compare):
-             if st.button("Guardar Cambios en Registros de Consumo", key="save_consumo_button"):
-                  df_to_save = df_consumo_edited_processed.copy()
-                  date_col_name_consumo = DATETIME_COLUMNS[TABLE_CONSUMO]
-                  df_to_save = df_to_save[(df_to_save['Interno'].notna()) & (df_to_save[date_col_name_consumo].notna())].copy()
-                  if df_to_save.empty and not df_consumo_edited_processed.empty:
-                       st.error("Error: Ninguna fila válida. Complete Interno y Fecha.")
-                  elif df_to_save['Consumo_Litros'].isnull().any() or df_to_save['Horas_Trabajadas'].isnull().any() or df_to_save['Kilometros_Recorridos'].isnull().any():
-                       st.error("Error: Los campos numéricos no pueden estar vacíos.")
-                  elif ((pd.to_numeric(df_to_save['Consumo_Litros'], errors='coerce').fillna(0) == 0) &
-                        (pd.to_numeric(df_to_save['Horas_Trabajadas'], errors='coerce').fillna(0) == 0) &
-                        (pd.to_numeric(df_to_save['Kilometros_Recorridos'], errors='coerce').fillna(0) == 0)).any():
-                       st.warning("Advertencia: Algunas filas tienen Consumo, Horas y Kilómetros todos cero.")
-                  internos_disponibles_set = set(internos_disponibles)
-                  invalid_internos = df_to_save[~df_to_save['Interno'].astype(str).isin(internos_disponibles_set)]['Interno'].unique().tolist()
-                  if invalid_internos:
-                       st.error(f"Error: Internos no existen: {', '.join(invalid_internos)}.")
-                  else:
-                       st.session_state.df_consumo = df_to_save
-                       save_table(st.session_state.df_consumo, DATABASE_FILE, TABLE_CONSUMO)
-                       st.success("Cambios en registros de consumo guardados.")
-                       st.experimental_rerun()
-             else:
-                 st.info("Hay cambios sin guardar en registros de consumo.")
+        if st.session_state.get("consumo_editor_dirty", False):
+            df_consumo_edited_processed = ensure_columns(df_consumo_edited, expected_cols_consumo)
+            if 'Interno' in df_consumo_edited_processed.columns:
+                 df_consumo_edited_processed['Interno'] = normalize_text(df_consumo_edited_processed['Interno'], strip=True)
+            if frame_fingerprint(df_consumo_edited_processed, expected_cols_consumo) != stored_fingerprint(TABLE_CONSUMO, st.session_state.df_consumo):
+                 if st.button("Guardar Cambios en Registros de Consumo", key="save_consumo_button"):
+                      date_col_name_consumo = DATETIME_COLUMNS[TABLE_CONSUMO]
+                      df_to_save = df_consumo_edited_processed[(df_consumo_edited_processed['Interno'].notna()) & (df_consumo_edited_processed[date_col_name_consumo].notna())]
+                      consumo_values = numeric_values(df_to_save, ['Consumo_Litros', 'Horas_Trabajadas', 'Kilometros_Recorridos'])
+                      if df_to_save.empty and not df_consumo_edited_processed.empty:
+                           st.error("Error: Ninguna fila válida. Complete Interno y Fecha.")
+                      elif np.isnan(lowest_value(consumo_values)):
+                           st.error("Error: Los campos numéricos no pueden estar vacíos.")
+                      elif not consumo_values.any(axis=1).all():
+                           st.warning("Advertencia: Algunas filas tienen Consumo, Horas y Kilómetros todos cero.")
+                      internos_dtype = internos_categorical_dtype(tuple(internos_disponibles))
+                      invalid_internos = invalid_values(df_to_save['Interno'], internos_dtype)
+                      if invalid_internos:
+                           st.error(f"Error: Internos no existen: {', '.join(invalid_internos)}.")
+                      else:
+                           save_table_changes(st.session_state.df_consumo, df_to_save, DATABASE_FILE, TABLE_CONSUMO)
+                           st.session_state.consumo_editor_dirty = False
+                           st.session_state.df_consumo = df_to_save
+                           st.success("Cambios en registros de consumo guardados.")
+                           st.experimental_rerun()
+                 else:
+                     st.info("Hay cambios sin guardar en registros de consumo.")
 
 
 def page_costos_equipos():
     st.title("Registro de Costos por Equipo")
     st.write("Aquí puedes registrar costos salariales, fijos y de mantenimiento por equipo y fecha.")
 
-    internos_disponibles = st.session_state.df_equipos['Interno'].unique().tolist()
-    internos_disponibles = [str(i).strip() for i in internos_disponibles if pd.notna(i) and str(i).strip() != '']
-    internos_disponibles.sort()
+    internos_disponibles = list_internos(stored_fingerprint(TABLE_EQUIPOS, st.session_state.df_equipos), st.session_state.df_equipos['Interno'])
 
     if not internos_disponibles:
         st.warning("No hay equipos registrados. Por favor, añada equipos primero para registrar costos.")
@@ -581,7 +1015,7 @@ def page_costos_equipos():
     )
     st.session_state.selected_cost_interno = selected_interno
     tab1, tab2, tab3 = st.tabs(["Costos Salariales", "Gastos Fijos", "Gastos Mantenimiento"])
-    internos_disponibles_set = set(internos_disponibles)
+    internos_dtype = internos_categorical_dtype(tuple(internos_disponibles))
 
     with tab1:
         st.subheader("Registro de Costos Salariales")
@@ -599,30 +1033,11 @@ def page_costos_equipos():
                 else:
                     new_costo_data = {
                        'Interno': str(selected_interno).strip(),
-                       'Fecha': fecha,
+                       'Fecha': pd.Timestamp(fecha),
                        'Monto_Salarial': float(monto_salarial if monto_salarial is not None else 0.0) # Handle None
                     }
-                    new_costo_df = pd.DataFrame([new_costo_data])
-                    expected_cols_salarial = list(TABLE_COLUMNS[TABLE_COSTOS_SALARIAL].keys())
-                    new_costo_df = new_costo_df.reindex(columns=expected_cols_salarial)
-                    date_col_name_salarial = DATETIME_COLUMNS[TABLE_COSTOS_SALARIAL]
-                    if date_col_name_salarial in new_costo_df.columns:
-                         new_costo_df[date_col_name_salarial] = pd.to_datetime(new_costo_df[date_col_name_salarial], errors='coerce')
-                    for col, dtype in TABLE_COLUMNS[TABLE_COSTOS_SALARIAL].items():
-                       if col in new_costo_df.columns:
-                            try:
-                                 if dtype == 'object':
-                                      new_costo_df[col] = new_costo_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                      new_costo_df[col] = new_costo_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                                 elif 'float' in dtype: new_costo_df[col] = pd.to_numeric(new_costo_df[col], errors='coerce').astype(float).fillna(0.0)
-                                 elif 'int' in dtype:
-                                      if hasattr(pd, 'Int64Dtype'): new_costo_df[col] = pd.to_numeric(new_costo_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                      else: new_costo_df[col] = pd.to_numeric(new_costo_df[col], errors='coerce').astype(float).fillna(0.0)
-                            except Exception as dtype_e:
-                                 st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                    df_current_salarial_reindexed = st.session_state.df_costos_salarial.reindex(columns=expected_cols_salarial)
-                    st.session_state.df_costos_salarial = pd.concat([df_current_salarial_reindexed, new_costo_df], ignore_index=True)
-                    save_table(st.session_state.df_costos_salarial, DATABASE_FILE, TABLE_COSTOS_SALARIAL)
+                    st.session_state.df_costos_salarial = append_row(st.session_state.df_costos_salarial, new_costo_data, EXPECTED_COLS[TABLE_COSTOS_SALARIAL])
+                    insert_row(DATABASE_FILE, TABLE_COSTOS_SALARIAL, new_costo_data)
                     st.success("Costo salarial registrado.")
                     st.experimental_rerun()
         st.subheader("Registros Salariales Existente")
@@ -631,51 +1046,50 @@ def page_costos_equipos():
              st.info("No hay registros salariales aún.")
         else:
             st.info("Edite la tabla siguiente para modificar o eliminar registros.")
-            df_salarial_editable = st.session_state.df_costos_salarial.copy()
+            df_salarial_editable = st.session_state.df_costos_salarial.copy(deep=False)
             date_col_name_salarial = DATETIME_COLUMNS[TABLE_COSTOS_SALARIAL]
             if date_col_name_salarial in df_salarial_editable.columns:
-                 df_salarial_editable[date_col_name_salarial] = pd.to_datetime(df_salarial_editable[date_col_name_salarial], errors='coerce')
+                 df_salarial_editable[date_col_name_salarial] = coerce_date(df_salarial_editable[date_col_name_salarial])
             else:
                  df_salarial_editable[date_col_name_salarial] = pd.Series(dtype='datetime64[ns]', index=df_salarial_editable.index)
-            expected_cols_salarial = list(TABLE_COLUMNS[TABLE_COSTOS_SALARIAL].keys())
+            expected_cols_salarial = EXPECTED_COLS[TABLE_COSTOS_SALARIAL]
             df_salarial_editable = df_salarial_editable.reindex(columns=expected_cols_salarial)
             if 'Interno' in df_salarial_editable.columns:
-                 df_salarial_editable['Interno'] = df_salarial_editable['Interno'].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+                 df_salarial_editable['Interno'] = blank_to_na(df_salarial_editable['Interno'])
             df_salarial_edited = st.data_editor(
-                df_salarial_editable, key="data_editor_salarial", num_rows="dynamic",
+                df_salarial_editable, key="data_editor_salarial", num_rows="dynamic", on_change=mark_editor_dirty, args=("salarial_editor_dirty",),
                  column_config={
                      date_col_name_salarial: st.column_config.DateColumn("Fecha", required=True),
                      "Interno": st.column_config.TextColumn("Interno", required=True),
                      "Monto_Salarial": st.column_config.NumberColumn("Monto Salarial", min_value=0.0, format="%.2f", required=True),
                  }
             )
-            df_salarial_edited_processed = df_salarial_edited.copy()
-            df_salarial_edited_processed = df_salarial_edited_processed.reindex(columns=expected_cols_salarial)
-            if 'Interno' in df_salarial_edited_processed.columns:
-                 df_salarial_edited_processed['Interno'] = df_salarial_edited_processed['Interno'].astype(str).str.strip().replace({'': None}).mask(df_salarial_edited_processed['Interno'].isna(), None)
-            df_salarial_original_compare = st.session_state.df_costos_salarial.reindex(columns=expected_cols_salarial).sort_values(by=expected_cols_salarial).reset_index(drop=True)
-            df_salarial_edited_compare = df_salarial_edited_processed.reindex(columns=expected_cols_salarial).sort_values(by=expected_cols_salarial).reset_index(drop=True)
-            if not df_salarial_edited_compare.equals(df_salarial_original_compare):
-                 if st.button("Guardar Cambios en Registros Salariales", key="save_salarial_button"):
-                      df_to_save = df_salarial_edited_processed.copy()
-                      date_col_name_salarial = DATETIME_COLUMNS[TABLE_COSTOS_SALARIAL]
-                      df_to_save = df_to_save[(df_to_save['Interno'].notna()) & (df_to_save[date_col_name_salarial].notna())].copy()
-                      if df_to_save.empty and not df_salarial_edited_processed.empty:
-                           st.error("Error: Ninguna fila válida. Complete Interno y Fecha.")
-                      elif df_to_save['Monto_Salarial'].isnull().any():
-                            st.error("Error: El campo 'Monto Salarial' no puede estar vacío.")
-                      elif (pd.to_numeric(df_to_save['Monto_Salarial'], errors='coerce').fillna(0) <= 0).any():
-                           st.warning("Advertencia: Algunos registros tienen 'Monto Salarial' <= 0.")
-                      invalid_internos = df_to_save[~df_to_save['Interno'].astype(str).isin(internos_disponibles_set)]['Interno'].unique().tolist()
-                      if invalid_internos:
-                           st.error(f"Error: Internos no existen: {', '.join(invalid_internos)}.")
-                      else:
-                           st.session_state.df_costos_salarial = df_to_save
-                           save_table(st.session_state.df_costos_salarial, DATABASE_FILE, TABLE_COSTOS_SALARIAL)
-                           st.success("Cambios en registros salariales guardados.")
-                           st.experimental_rerun()
-                 else:
-                     st.info("Hay cambios sin guardar en registros salariales.")
+            if st.session_state.get("salarial_editor_dirty", False):
+                df_salarial_edited_processed = ensure_columns(df_salarial_edited, expected_cols_salarial)
+                if 'Interno' in df_salarial_edited_processed.columns:
+                     df_salarial_edited_processed['Interno'] = normalize_text(df_salarial_edited_processed['Interno'], strip=True)
+                if frame_fingerprint(df_salarial_edited_processed, expected_cols_salarial) != stored_fingerprint(TABLE_COSTOS_SALARIAL, st.session_state.df_costos_salarial):
+                     if st.button("Guardar Cambios en Registros Salariales", key="save_salarial_button"):
+                          date_col_name_salarial = DATETIME_COLUMNS[TABLE_COSTOS_SALARIAL]
+                          df_to_save = df_salarial_edited_processed[(df_salarial_edited_processed['Interno'].notna()) & (df_salarial_edited_processed[date_col_name_salarial].notna())]
+                          monto_salarial_min = lowest_value(numeric_values(df_to_save, ['Monto_Salarial']))
+                          if df_to_save.empty and not df_salarial_edited_processed.empty:
+                               st.error("Error: Ninguna fila válida. Complete Interno y Fecha.")
+                          elif np.isnan(monto_salarial_min):
+                                st.error("Error: El campo 'Monto Salarial' no puede estar vacío.")
+                          elif monto_salarial_min <= 0:
+                               st.warning("Advertencia: Algunos registros tienen 'Monto Salarial' <= 0.")
+                          invalid_internos = invalid_values(df_to_save['Interno'], internos_dtype)
+                          if invalid_internos:
+                               st.error(f"Error: Internos no existen: {', '.join(invalid_internos)}.")
+                          else:
+                               save_table_changes(st.session_state.df_costos_salarial, df_to_save, DATABASE_FILE, TABLE_COSTOS_SALARIAL)
+                               st.session_state.salarial_editor_dirty = False
+                               st.session_state.df_costos_salarial = df_to_save
+                               st.success("Cambios en registros salariales guardados.")
+                               st.experimental_rerun()
+                     else:
+                         st.info("Hay cambios sin guardar en registros salariales.")
 
     with tab2:
         st.subheader("Registro de Gastos Fijos")
@@ -697,32 +1111,13 @@ def page_costos_equipos():
                   else:
                       new_gasto_data = {
                          'Interno': str(selected_interno).strip(),
-                         'Fecha': fecha,
+                         'Fecha': pd.Timestamp(fecha),
                          'Tipo_Gasto_Fijo': tipo_gasto,
                          'Monto_Gasto_Fijo': float(monto_gasto if monto_gasto is not None else 0.0), # Handle None
                          'Descripcion': descripcion if descripcion else None
                       }
-                      new_gasto_df = pd.DataFrame([new_gasto_data])
-                      expected_cols_fijos = list(TABLE_COLUMNS[TABLE_GASTOS_FIJOS].keys())
-                      new_gasto_df = new_gasto_df.reindex(columns=expected_cols_fijos)
-                      date_col_name_fijos = DATETIME_COLUMNS[TABLE_GASTOS_FIJOS]
-                      if date_col_name_fijos in new_gasto_df.columns:
-                           new_gasto_df[date_col_name_fijos] = pd.to_datetime(new_gasto_df[date_col_name_fijos], errors='coerce')
-                      for col, dtype in TABLE_COLUMNS[TABLE_GASTOS_FIJOS].items():
-                          if col in new_gasto_df.columns:
-                               try:
-                                    if dtype == 'object':
-                                         new_gasto_df[col] = new_gasto_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                         new_gasto_df[col] = new_gasto_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                                    elif 'float' in dtype: new_gasto_df[col] = pd.to_numeric(new_gasto_df[col], errors='coerce').astype(float).fillna(0.0)
-                                    elif 'int' in dtype:
-                                         if hasattr(pd, 'Int64Dtype'): new_gasto_df[col] = pd.to_numeric(new_gasto_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                         else: new_gasto_df[col] = pd.to_numeric(new_gasto_df[col], errors='coerce').astype(float).fillna(0.0)
-                               except Exception as dtype_e:
-                                    st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                      df_current_fijos_reindexed = st.session_state.df_gastos_fijos.reindex(columns=expected_cols_fijos)
-                      st.session_state.df_gastos_fijos = pd.concat([df_current_fijos_reindexed, new_gasto_df], ignore_index=True)
-                      save_table(st.session_state.df_gastos_fijos, DATABASE_FILE, TABLE_GASTOS_FIJOS)
+                      st.session_state.df_gastos_fijos = append_row(st.session_state.df_gastos_fijos, new_gasto_data, EXPECTED_COLS[TABLE_GASTOS_FIJOS])
+                      insert_row(DATABASE_FILE, TABLE_GASTOS_FIJOS, new_gasto_data)
                       st.success("Gasto fijo registrado.")
                       st.experimental_rerun()
         st.subheader("Registros de Gastos Fijos Existente")
@@ -731,19 +1126,19 @@ def page_costos_equipos():
              st.info("No hay registros de gastos fijos aún.")
         else:
              st.info("Edite la tabla siguiente para modificar o eliminar registros.")
-             df_fijos_editable = st.session_state.df_gastos_fijos.copy()
+             df_fijos_editable = st.session_state.df_gastos_fijos.copy(deep=False)
              date_col_name_fijos = DATETIME_COLUMNS[TABLE_GASTOS_FIJOS]
              if date_col_name_fijos in df_fijos_editable.columns:
-                  df_fijos_editable[date_col_name_fijos] = pd.to_datetime(df_fijos_editable[date_col_name_fijos], errors='coerce')
+                  df_fijos_editable[date_col_name_fijos] = coerce_date(df_fijos_editable[date_col_name_fijos])
              else:
                   df_fijos_editable[date_col_name_fijos] = pd.Series(dtype='datetime64[ns]', index=df_fijos_editable.index)
-             expected_cols_fijos = list(TABLE_COLUMNS[TABLE_GASTOS_FIJOS].keys())
+             expected_cols_fijos = EXPECTED_COLS[TABLE_GASTOS_FIJOS]
              df_fijos_editable = df_fijos_editable.reindex(columns=expected_cols_fijos)
              for col in ['Interno', 'Tipo_Gasto_Fijo', 'Descripcion']:
                  if col in df_fijos_editable.columns:
-                      df_fijos_editable[col] = df_fijos_editable[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+                      df_fijos_editable[col] = blank_to_na(df_fijos_editable[col])
              df_fijos_edited = st.data_editor(
-                 df_fijos_editable, key="data_editor_fijos", num_rows="dynamic",
+                 df_fijos_editable, key="data_editor_fijos", num_rows="dynamic", on_change=mark_editor_dirty, args=("fijos_editor_dirty",),
                  column_config={
                       date_col_name_fijos: st.column_config.DateColumn("Fecha", required=True),
                       "Interno": st.column_config.TextColumn("Interno", required=True),
@@ -752,34 +1147,33 @@ def page_costos_equipos():
                       "Descripcion": st.column_config.TextColumn("Descripción", required=False),
                   }
              )
-             df_fijos_edited_processed = df_fijos_edited.copy()
-             df_fijos_edited_processed = df_fijos_edited_processed.reindex(columns=expected_cols_fijos)
-             for col in ['Interno', 'Tipo_Gasto_Fijo', 'Descripcion']:
-                  if col in df_fijos_edited_processed.columns:
-                       df_fijos_edited_processed[col] = df_fijos_edited_processed[col].astype(str).str.strip().replace({'': None}).mask(df_fijos_edited_processed[col].isna(), None)
-             df_fijos_original_compare = st.session_state.df_gastos_fijos.reindex(columns=expected_cols_fijos).sort_values(by=expected_cols_fijos).reset_index(drop=True)
-             df_fijos_edited_compare = df_fijos_edited_processed.reindex(columns=expected_cols_fijos).sort_values(by=expected_cols_fijos).reset_index(drop=True)
-             if not df_fijos_edited_compare.equals(df_fijos_original_compare):
-                  if st.button("Guardar Cambios en Registros de Gastos Fijos", key="save_fijos_button"):
-                       df_to_save = df_fijos_edited_processed.copy()
-                       date_col_name_fijos = DATETIME_COLUMNS[TABLE_GASTOS_FIJOS]
-                       df_to_save = df_to_save[(df_to_save['Interno'].notna()) & (df_to_save[date_col_name_fijos].notna()) & (df_to_save['Tipo_Gasto_Fijo'].notna())].copy()
-                       if df_to_save.empty and not df_fijos_edited_processed.empty:
-                            st.error("Error: Ninguna fila válida. Complete campos obligatorios.")
-                       elif df_to_save['Monto_Gasto_Fijo'].isnull().any():
-                            st.error("Error: El campo 'Monto Gasto Fijo' no puede estar vacío.")
-                       elif (pd.to_numeric(df_to_save['Monto_Gasto_Fijo'], errors='coerce').fillna(0) <= 0).any():
-                            st.warning("Advertencia: Algunos registros tienen 'Monto Gasto Fijo' <= 0.")
-                       invalid_internos = df_to_save[~df_to_save['Interno'].astype(str).isin(internos_disponibles_set)]['Interno'].unique().tolist()
-                       if invalid_internos:
-                            st.error(f"Error: Internos no existen: {', '.join(invalid_internos)}.")
-                       else:
-                           st.session_state.df_gastos_fijos = df_to_save
-                           save_table(st.session_state.df_gastos_fijos, DATABASE_FILE, TABLE_GASTOS_FIJOS)
-                           st.success("Cambios en registros de gastos fijos guardados.")
-                           st.experimental_rerun()
-                  else:
-                      st.info("Hay cambios sin guardar en registros de gastos fijos.")
+             if st.session_state.get("fijos_editor_dirty", False):
+                 df_fijos_edited_processed = ensure_columns(df_fijos_edited, expected_cols_fijos)
+                 for col in ['Interno', 'Tipo_Gasto_Fijo', 'Descripcion']:
+                      if col in df_fijos_edited_processed.columns:
+                           df_fijos_edited_processed[col] = normalize_text(df_fijos_edited_processed[col], strip=True)
+                 if frame_fingerprint(df_fijos_edited_processed, expected_cols_fijos) != stored_fingerprint(TABLE_GASTOS_FIJOS, st.session_state.df_gastos_fijos):
+                      if st.button("Guardar Cambios en Registros de Gastos Fijos", key="save_fijos_button"):
+                           date_col_name_fijos = DATETIME_COLUMNS[TABLE_GASTOS_FIJOS]
+                           df_to_save = df_fijos_edited_processed[(df_fijos_edited_processed['Interno'].notna()) & (df_fijos_edited_processed[date_col_name_fijos].notna()) & (df_fijos_edited_processed['Tipo_Gasto_Fijo'].notna())]
+                           monto_fijo_min = lowest_value(numeric_values(df_to_save, ['Monto_Gasto_Fijo']))
+                           if df_to_save.empty and not df_fijos_edited_processed.empty:
+                                st.error("Error: Ninguna fila válida. Complete campos obligatorios.")
+                           elif np.isnan(monto_fijo_min):
+                                st.error("Error: El campo 'Monto Gasto Fijo' no puede estar vacío.")
+                           elif monto_fijo_min <= 0:
+                                st.warning("Advertencia: Algunos registros tienen 'Monto Gasto Fijo' <= 0.")
+                           invalid_internos = invalid_values(df_to_save['Interno'], internos_dtype)
+                           if invalid_internos:
+                                st.error(f"Error: Internos no existen: {', '.join(invalid_internos)}.")
+                           else:
+                               save_table_changes(st.session_state.df_gastos_fijos, df_to_save, DATABASE_FILE, TABLE_GASTOS_FIJOS)
+                               st.session_state.fijos_editor_dirty = False
+                               st.session_state.df_gastos_fijos = df_to_save
+                               st.success("Cambios en registros de gastos fijos guardados.")
+                               st.experimental_rerun()
+                      else:
+                          st.info("Hay cambios sin guardar en registros de gastos fijos.")
 
     with tab3:
         st.subheader("Registro de Gastos de Mantenimiento")
@@ -801,32 +1195,13 @@ def page_costos_equipos():
                   else:
                       new_gasto_data = {
                          'Interno': str(selected_interno).strip(),
-                         'Fecha': fecha,
+                         'Fecha': pd.Timestamp(fecha),
                          'Tipo_Mantenimiento': tipo_mantenimiento,
                          'Monto_Mantenimiento': float(monto_mantenimiento if monto_mantenimiento is not None else 0.0), # Handle None
                          'Descripcion': descripcion if descripcion else None
                       }
-                      new_gasto_df = pd.DataFrame([new_gasto_data])
-                      expected_cols_mantenimiento = list(TABLE_COLUMNS[TABLE_GASTOS_MANTENIMIENTO].keys())
-                      new_gasto_df = new_gasto_df.reindex(columns=expected_cols_mantenimiento)
-                      date_col_name_mantenimiento = DATETIME_COLUMNS[TABLE_GASTOS_MANTENIMIENTO]
-                      if date_col_name_mantenimiento in new_gasto_df.columns:
-                           new_gasto_df[date_col_name_mantenimiento] = pd.to_datetime(new_gasto_df[date_col_name_mantenimiento], errors='coerce')
-                      for col, dtype in TABLE_COLUMNS[TABLE_GASTOS_MANTENIMIENTO].items():
-                          if col in new_gasto_df.columns:
-                               try:
-                                    if dtype == 'object':
-                                         new_gasto_df[col] = new_gasto_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                         new_gasto_df[col] = new_gasto_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                                    elif 'float' in dtype: new_gasto_df[col] = pd.to_numeric(new_gasto_df[col], errors='coerce').astype(float).fillna(0.0)
-                                    elif 'int' in dtype:
-                                         if hasattr(pd, 'Int64Dtype'): new_gasto_df[col] = pd.to_numeric(new_gasto_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                         else: new_gasto_df[col] = pd.to_numeric(new_gasto_df[col], errors='coerce').astype(float).fillna(0.0)
-                               except Exception as dtype_e:
-                                    st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                      df_current_mantenimiento_reindexed = st.session_state.df_gastos_mantenimiento.reindex(columns=expected_cols_mantenimiento)
-                      st.session_state.df_gastos_mantenimiento = pd.concat([df_current_mantenimiento_reindexed, new_gasto_df], ignore_index=True)
-                      save_table(st.session_state.df_gastos_mantenimiento, DATABASE_FILE, TABLE_GASTOS_MANTENIMIENTO)
+                      st.session_state.df_gastos_mantenimiento = append_row(st.session_state.df_gastos_mantenimiento, new_gasto_data, EXPECTED_COLS[TABLE_GASTOS_MANTENIMIENTO])
+                      insert_row(DATABASE_FILE, TABLE_GASTOS_MANTENIMIENTO, new_gasto_data)
                       st.success("Gasto de mantenimiento registrado.")
                       st.experimental_rerun()
         st.subheader("Registros de Gastos de Mantenimiento Existente")
@@ -835,19 +1210,19 @@ def page_costos_equipos():
             st.info("No hay registros de mantenimiento aún.")
         else:
             st.info("Edite la tabla siguiente para modificar o eliminar registros.")
-            df_mantenimiento_editable = st.session_state.df_gastos_mantenimiento.copy()
+            df_mantenimiento_editable = st.session_state.df_gastos_mantenimiento.copy(deep=False)
             date_col_name_mantenimiento = DATETIME_COLUMNS[TABLE_GASTOS_MANTENIMIENTO]
             if date_col_name_mantenimiento in df_mantenimiento_editable.columns:
-                 df_mantenimiento_editable[date_col_name_mantenimiento] = pd.to_datetime(df_mantenimiento_editable[date_col_name_mantenimiento], errors='coerce')
+                 df_mantenimiento_editable[date_col_name_mantenimiento] = coerce_date(df_mantenimiento_editable[date_col_name_mantenimiento])
             else:
                  df_mantenimiento_editable[date_col_name_mantenimiento] = pd.Series(dtype='datetime64[ns]', index=df_mantenimiento_editable.index)
-            expected_cols_mantenimiento = list(TABLE_COLUMNS[TABLE_GASTOS_MANTENIMIENTO].keys())
+            expected_cols_mantenimiento = EXPECTED_COLS[TABLE_GASTOS_MANTENIMIENTO]
             df_mantenimiento_editable = df_mantenimiento_editable.reindex(columns=expected_cols_mantenimiento)
             for col in ['Interno', 'Tipo_Mantenimiento', 'Descripcion']:
                  if col in df_mantenimiento_editable.columns:
-                      df_mantenimiento_editable[col] = df_mantenimiento_editable[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+                      df_mantenimiento_editable[col] = blank_to_na(df_mantenimiento_editable[col])
             df_mantenimiento_edited = st.data_editor(
-                df_mantenimiento_editable, key="data_editor_mantenimiento", num_rows="dynamic",
+                df_mantenimiento_editable, key="data_editor_mantenimiento", num_rows="dynamic", on_change=mark_editor_dirty, args=("mantenimiento_editor_dirty",),
                 column_config={
                      date_col_name_mantenimiento: st.column_config.DateColumn("Fecha", required=True),
                      "Interno": st.column_config.TextColumn("Interno", required=True),
@@ -856,34 +1231,33 @@ def page_costos_equipos():
                      "Descripcion": st.column_config.TextColumn("Descripción", required=False),
                  }
             )
-            df_mantenimiento_edited_processed = df_mantenimiento_edited.copy()
-            df_mantenimiento_edited_processed = df_mantenimiento_edited_processed.reindex(columns=expected_cols_mantenimiento)
-            for col in ['Interno', 'Tipo_Mantenimiento', 'Descripcion']:
-                 if col in df_mantenimiento_edited_processed.columns:
-                      df_mantenimiento_edited_processed[col] = df_mantenimiento_edited_processed[col].astype(str).str.strip().replace({'': None}).mask(df_mantenimiento_edited_processed[col].isna(), None)
-            df_mantenimiento_original_compare = st.session_state.df_gastos_mantenimiento.reindex(columns=expected_cols_mantenimiento).sort_values(by=expected_cols_mantenimiento).reset_index(drop=True)
-            df_mantenimiento_edited_compare = df_mantenimiento_edited_processed.reindex(columns=expected_cols_mantenimiento).sort_values(by=expected_cols_mantenimiento).reset_index(drop=True)
-            if not df_mantenimiento_edited_compare.equals(df_mantenimiento_original_compare):
-                 if st.button("Guardar Cambios en Registros de Mantenimiento", key="save_mantenimiento_button"):
-                      df_to_save = df_mantenimiento_edited_processed.copy()
-                      date_col_name_mantenimiento = DATETIME_COLUMNS[TABLE_GASTOS_MANTENIMIENTO]
-                      df_to_save = df_to_save[(df_to_save['Interno'].notna()) & (df_to_save[date_col_name_mantenimiento].notna()) & (df_to_save['Tipo_Mantenimiento'].notna())].copy()
-                      if df_to_save.empty and not df_mantenimiento_edited_processed.empty:
-                           st.error("Error: Ninguna fila válida. Complete campos obligatorios.")
-                      elif df_to_save['Monto_Mantenimiento'].isnull().any():
-                           st.error("Error: El campo 'Monto Mantenimiento' no puede estar vacío.")
-                      elif (pd.to_numeric(df_to_save['Monto_Mantenimiento'], errors='coerce').fillna(0) <= 0).any():
-                           st.warning("Advertencia: Algunos registros tienen 'Monto Mantenimiento' <= 0.")
-                      invalid_internos = df_to_save[~df_to_save['Interno'].astype(str).isin(internos_disponibles_set)]['Interno'].unique().tolist()
-                      if invalid_internos:
-                           st.error(f"Error: Internos no existen: {', '.join(invalid_internos)}.")
-                      else:
-                           st.session_state.df_gastos_mantenimiento = df_to_save
-                           save_table(st.session_state.df_gastos_mantenimiento, DATABASE_FILE, TABLE_GASTOS_MANTENIMIENTO)
-                           st.success("Cambios en registros de mantenimiento guardados.")
-                           st.experimental_rerun()
-                 else:
-                     st.info("Hay cambios sin guardar en registros de mantenimiento.")
+            if st.session_state.get("mantenimiento_editor_dirty", False):
+                df_mantenimiento_edited_processed = ensure_columns(df_mantenimiento_edited, expected_cols_mantenimiento)
+                for col in ['Interno', 'Tipo_Mantenimiento', 'Descripcion']:
+                     if col in df_mantenimiento_edited_processed.columns:
+                          df_mantenimiento_edited_processed[col] = normalize_text(df_mantenimiento_edited_processed[col], strip=True)
+                if frame_fingerprint(df_mantenimiento_edited_processed, expected_cols_mantenimiento) != stored_fingerprint(TABLE_GASTOS_MANTENIMIENTO, st.session_state.df_gastos_mantenimiento):
+                     if st.button("Guardar Cambios en Registros de Mantenimiento", key="save_mantenimiento_button"):
+                          date_col_name_mantenimiento = DATETIME_COLUMNS[TABLE_GASTOS_MANTENIMIENTO]
+                          df_to_save = df_mantenimiento_edited_processed[(df_mantenimiento_edited_processed['Interno'].notna()) & (df_mantenimiento_edited_processed[date_col_name_mantenimiento].notna()) & (df_mantenimiento_edited_processed['Tipo_Mantenimiento'].notna())]
+                          monto_mantenimiento_min = lowest_value(numeric_values(df_to_save, ['Monto_Mantenimiento']))
+                          if df_to_save.empty and not df_mantenimiento_edited_processed.empty:
+                               st.error("Error: Ninguna fila válida. Complete campos obligatorios.")
+                          elif np.isnan(monto_mantenimiento_min):
+                               st.error("Error: El campo 'Monto Mantenimiento' no puede estar vacío.")
+                          elif monto_mantenimiento_min <= 0:
+                               st.warning("Advertencia: Algunos registros tienen 'Monto Mantenimiento' <= 0.")
+                          invalid_internos = invalid_values(df_to_save['Interno'], internos_dtype)
+                          if invalid_internos:
+                               st.error(f"Error: Internos no existen: {', '.join(invalid_internos)}.")
+                          else:
+                               save_table_changes(st.session_state.df_gastos_mantenimiento, df_to_save, DATABASE_FILE, TABLE_GASTOS_MANTENIMIENTO)
+                               st.session_state.mantenimiento_editor_dirty = False
+                               st.session_state.df_gastos_mantenimiento = df_to_save
+                               st.success("Cambios en registros de mantenimiento guardados.")
+                               st.experimental_rerun()
+                     else:
+                         st.info("Hay cambios sin guardar en registros de mantenimiento.")
 
 def page_reportes_mina():
     st.title("Reportes de Mina por Fecha")
@@ -902,13 +1276,12 @@ def page_reportes_mina():
                 st.warning("Por favor, complete el precio (mayor a cero).")
             else:
                 new_precio_data = {'Fecha': fecha_precio, 'Precio_Litro': float(precio_litro if precio_litro is not None else 0.0)} # Handle None
-                new_precio_df = pd.DataFrame([new_precio_data])
                 date_col_name_precio = DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE]
-                df_precios_temp = st.session_state.df_precios_combustible.copy()
+                df_precios_temp = st.session_state.df_precios_combustible.copy(deep=False)
                 if date_col_name_precio not in df_precios_temp.columns:
                      df_precios_temp[date_col_name_precio] = pd.Series(dtype='datetime64[ns]', index=df_precios_temp.index)
                 else:
-                     df_precios_temp[date_col_name_precio] = pd.to_datetime(df_precios_temp[date_col_name_precio], errors='coerce')
+                     df_precios_temp[date_col_name_precio] = coerce_date(df_precios_temp[date_col_name_precio])
                 fecha_precio_dt = pd.to_datetime(fecha_precio, errors='coerce')
                 if pd.notna(fecha_precio_dt):
                     df_filtered_for_duplicate = df_precios_temp[
@@ -918,25 +1291,9 @@ def page_reportes_mina():
                     st.warning("Fecha de precio proporcionada no es válida. No se guardará.")
                     st.experimental_rerun()
                     return
-                expected_cols_precios = list(TABLE_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE].keys())
-                new_precio_df = new_precio_df.reindex(columns=expected_cols_precios)
-                if date_col_name_precio in new_precio_df.columns:
-                     new_precio_df[date_col_name_precio] = pd.to_datetime(new_precio_df[date_col_name_precio], errors='coerce')
-                for col, dtype in TABLE_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE].items():
-                     if col in new_precio_df.columns:
-                           try:
-                                if dtype == 'object':
-                                     new_precio_df[col] = new_precio_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                     new_precio_df[col] = new_precio_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                                elif 'float' in dtype: new_precio_df[col] = pd.to_numeric(new_precio_df[col], errors='coerce').astype(float).fillna(0.0)
-                                elif 'int' in dtype:
-                                     if hasattr(pd, 'Int64Dtype'): new_precio_df[col] = pd.to_numeric(new_precio_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                     else: new_precio_df[col] = pd.to_numeric(new_precio_df[col], errors='coerce').astype(float).fillna(0.0)
-                           except Exception as dtype_e:
-                                st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                df_filtered_for_duplicate_reindexed = df_filtered_for_duplicate.reindex(columns=expected_cols_precios)
-                st.session_state.df_precios_combustible = pd.concat([df_filtered_for_duplicate_reindexed, new_precio_df], ignore_index=True)
-                save_table(st.session_state.df_precios_combustible, DATABASE_FILE, TABLE_PRECIOS_COMBUSTIBLE)
+                new_precio_data[date_col_name_precio] = fecha_precio_dt
+                st.session_state.df_precios_combustible = append_row(df_filtered_for_duplicate, new_precio_data, EXPECTED_COLS[TABLE_PRECIOS_COMBUSTIBLE])
+                replace_row_by_date(DATABASE_FILE, TABLE_PRECIOS_COMBUSTIBLE, new_precio_data)
                 st.success("Precio del combustible registrado/actualizado.")
                 st.experimental_rerun()
     st.subheader("Precios del Combustible Existente")
@@ -944,13 +1301,13 @@ def page_reportes_mina():
     if st.session_state.df_precios_combustible.empty:
         st.info("No hay precios de combustible registrados aún.")
     else:
-        df_precios_editable = st.session_state.df_precios_combustible.copy()
+        df_precios_editable = st.session_state.df_precios_combustible.copy(deep=False)
         date_col_name_precio = DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE]
         if date_col_name_precio in df_precios_editable.columns:
-             df_precios_editable[date_col_name_precio] = pd.to_datetime(df_precios_editable[date_col_name_precio], errors='coerce')
+             df_precios_editable[date_col_name_precio] = coerce_date(df_precios_editable[date_col_name_precio])
         else:
              df_precios_editable[date_col_name_precio] = pd.Series(dtype='datetime64[ns]', index=df_precios_editable.index)
-        expected_cols_precios = list(TABLE_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE].keys())
+        expected_cols_precios = EXPECTED_COLS[TABLE_PRECIOS_COMBUSTIBLE]
         df_precios_editable = df_precios_editable.reindex(columns=expected_cols_precios)
         df_precios_edited = st.data_editor(
             df_precios_editable, key="data_editor_precios", num_rows="dynamic",
@@ -959,26 +1316,23 @@ def page_reportes_mina():
                 "Precio_Litro": st.column_config.NumberColumn("Precio por Litro", min_value=0.0, format="%.2f", required=True),
             }
         )
-        df_precios_edited_processed = df_precios_edited.copy()
-        df_precios_edited_processed = df_precios_edited_processed.reindex(columns=expected_cols_precios)
-        df_to_save = df_precios_edited_processed.copy()
+        df_precios_edited_processed = df_precios_edited.reindex(columns=expected_cols_precios)
         date_col_name_precio = DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE]
-        df_to_save = df_to_save[df_to_save[date_col_name_precio].notna()].copy()
-        df_precios_original_compare = st.session_state.df_precios_combustible.reindex(columns=expected_cols_precios).sort_values(by=expected_cols_precios).reset_index(drop=True)
-        df_precios_edited_compare = df_to_save.reindex(columns=expected_cols_precios).sort_values(by=expected_cols_precios).reset_index(drop=True)
-        if not df_precios_edited_compare.equals(df_precios_original_compare):
+        df_to_save = df_precios_edited_processed[df_precios_edited_processed[date_col_name_precio].notna()].copy()
+        if frame_fingerprint(df_to_save, expected_cols_precios) != stored_fingerprint(TABLE_PRECIOS_COMBUSTIBLE, st.session_state.df_precios_combustible):
              if st.button("Guardar Cambios en Precios de Combustible", key="save_precios_button"):
+                  precio_litro_min = lowest_value(numeric_values(df_to_save, ['Precio_Litro']))
                   if df_to_save.empty and not df_precios_edited_processed.empty:
                        st.error("Error: Ninguna fila válida. Complete Fecha.")
                   elif df_to_save[date_col_name_precio].duplicated().any():
                        st.error("Error: Fechas duplicadas en precios. Cada fecha debe tener un único precio.")
-                  elif df_to_save['Precio_Litro'].isnull().any():
+                  elif np.isnan(precio_litro_min):
                         st.error("Error: El campo 'Precio por Litro' no puede estar vacío.")
-                  elif (pd.to_numeric(df_to_save['Precio_Litro'], errors='coerce').fillna(0) <= 0).any():
+                  elif precio_litro_min <= 0:
                         st.error("Error: El 'Precio por Litro' debe ser mayor a cero.")
                   else:
+                       save_table_changes(st.session_state.df_precios_combustible, df_to_save, DATABASE_FILE, TABLE_PRECIOS_COMBUSTIBLE)
                        st.session_state.df_precios_combustible = df_to_save
-                       save_table(st.session_state.df_precios_combustible, DATABASE_FILE, TABLE_PRECIOS_COMBUSTIBLE)
                        st.success("Cambios en precios de combustible guardados.")
                        st.experimental_rerun()
              else:
@@ -990,15 +1344,8 @@ def page_reportes_mina():
     # For brevity, I'll skip pasting this large reporting section as it's unaffected by the primary error.
     # However, since "complete code" was requested, I'll include it.
     col1, col2 = st.columns(2)
-    all_relevant_dates = pd.Series(dtype='datetime64[ns]')
-    for table_name, date_col in DATETIME_COLUMNS.items():
-         df_temp = st.session_state.get(f'df_{table_name.lower()}', pd.DataFrame())
-         if date_col in df_temp.columns and not df_temp.empty:
-              all_relevant_dates = pd.concat([all_relevant_dates, pd.to_datetime(df_temp[date_col], errors='coerce')])
-    all_relevant_dates = all_relevant_dates.dropna()
-    if not all_relevant_dates.empty:
-        min_app_date = all_relevant_dates.min().date()
-        max_app_date = all_relevant_dates.max().date()
+    min_app_date, max_app_date = app_date_range()
+    if min_app_date is not None:
         today = datetime.date.today()
         default_end = min(today, max_app_date)
         default_start = max(default_end - pd.Timedelta(days=30), min_app_date)
@@ -1009,8 +1356,8 @@ def page_reportes_mina():
         max_app_date = today
         default_start = today - pd.Timedelta(days=30)
         default_end = today
-    min_date_input_display = all_relevant_dates.min().date() if not all_relevant_dates.empty else datetime.date.today() - pd.Timedelta(days=365 * 5)
-    max_date_input_display = all_relevant_dates.max().date() if not all_relevant_dates.empty else datetime.date.today()
+    min_date_input_display = min_app_date if min_app_date is not None else datetime.date.today() - pd.Timedelta(days=365 * 5)
+    max_date_input_display = max_app_date if max_app_date is not None else datetime.date.today()
     with col1:
         fecha_inicio = st.date_input("Fecha de Inicio del Reporte", default_start, min_value=min_date_input_display, max_value=max_date_input_display, key="reporte_fecha_inicio")
     with col2:
@@ -1022,39 +1369,22 @@ def page_reportes_mina():
             return
         start_ts = pd.Timestamp(fecha_inicio).normalize()
         end_ts = pd.Timestamp(fecha_fin) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-        def filter_df_by_date(df_original, date_col_name, start_ts, end_ts, expected_cols_dict):
+        def filter_df_by_date(df_original, date_col_name, start_ts, end_ts, expected_cols_dict, table_name=None):
              if df_original.empty or date_col_name not in df_original.columns or not expected_cols_dict:
-                  empty_df = pd.DataFrame(columns=expected_cols_dict.keys())
-                  for col, dtype in expected_cols_dict.items():
-                       if dtype == 'object': empty_df[col] = pd.Series(dtype=pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                       elif 'float' in dtype: empty_df[col] = pd.Series(dtype=float)
-                       elif 'int' in dtype: empty_df[col] = pd.Series(dtype=PANDAS_INT_DTYPE)
-                  return empty_df
-             df_temp = df_original.copy()
-             df_temp['Date_dt'] = pd.to_datetime(df_temp.get(date_col_name), errors='coerce')
-             df_filtered = df_temp[df_temp['Date_dt'].notna() & (df_temp['Date_dt'] >= start_ts) & (df_temp['Date_dt'] <= end_ts)].copy()
-             df_filtered = df_filtered.drop(columns=['Date_dt'])
-             df_filtered = df_filtered.reindex(columns=expected_cols_dict.keys())
-             for col, dtype in expected_cols_dict.items():
-                  if col in df_filtered.columns:
-                       try:
-                            if dtype == 'object':
-                                 df_filtered[col] = df_filtered[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                            elif 'float' in dtype:
-                                 df_filtered[col] = pd.to_numeric(df_filtered[col], errors='coerce').astype(float)
-                            elif 'int' in dtype:
-                                 if hasattr(pd, 'Int64Dtype'): df_filtered[col] = pd.to_numeric(df_filtered[col], errors='coerce').astype(pd.Int64Dtype())
-                                 else: df_filtered[col] = pd.to_numeric(df_filtered[col], errors='coerce').astype(float)
-                       except Exception:
-                            pass
-             if date_col_name in df_filtered.columns:
-                  df_filtered[date_col_name] = pd.to_datetime(df_filtered[date_col_name], errors='coerce')
-             return df_filtered
-        df_consumo_filtered = filter_df_by_date(st.session_state.df_consumo, DATETIME_COLUMNS[TABLE_CONSUMO], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_CONSUMO, {}))
-        df_precios_filtered = filter_df_by_date(st.session_state.df_precios_combustible, DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_PRECIOS_COMBUSTIBLE, {}))
-        df_salarial_filtered = filter_df_by_date(st.session_state.df_costos_salarial, DATETIME_COLUMNS[TABLE_COSTOS_SALARIAL], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_COSTOS_SALARIAL, {}))
-        df_fijos_filtered = filter_df_by_date(st.session_state.df_gastos_fijos, DATETIME_COLUMNS[TABLE_GASTOS_FIJOS], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_GASTOS_FIJOS, {}))
-        df_mantenimiento_filtered = filter_df_by_date(st.session_state.df_gastos_mantenimiento, DATETIME_COLUMNS[TABLE_GASTOS_MANTENIMIENTO], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_GASTOS_MANTENIMIENTO, {}))
+                  if table_name in EMPTY_FRAMES:
+                       return EMPTY_FRAMES[table_name].copy()
+                  return empty_frame(expected_cols_dict)
+             return date_slice(table_name, df_original, start_ts, end_ts)
+        df_equipos_lookup = st.session_state.get('df_equipos', pd.DataFrame())
+        df_flotas_lookup = st.session_state.get('df_flotas', pd.DataFrame())
+        interno_to_patente, interno_to_flota, flota_to_nombre = equipo_lookups(
+            stored_fingerprint(TABLE_EQUIPOS, df_equipos_lookup), stored_fingerprint(TABLE_FLOTAS, df_flotas_lookup),
+            ensure_columns(df_equipos_lookup, EXPECTED_COLS[TABLE_EQUIPOS]), ensure_columns(df_flotas_lookup, EXPECTED_COLS[TABLE_FLOTAS]))
+        df_consumo_filtered = filter_df_by_date(st.session_state.df_consumo, DATETIME_COLUMNS[TABLE_CONSUMO], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_CONSUMO, {}), TABLE_CONSUMO)
+        df_precios_filtered = filter_df_by_date(st.session_state.df_precios_combustible, DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_PRECIOS_COMBUSTIBLE, {}), TABLE_PRECIOS_COMBUSTIBLE)
+        df_salarial_filtered = filter_df_by_date(st.session_state.df_costos_salarial, DATETIME_COLUMNS[TABLE_COSTOS_SALARIAL], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_COSTOS_SALARIAL, {}), TABLE_COSTOS_SALARIAL)
+        df_fijos_filtered = filter_df_by_date(st.session_state.df_gastos_fijos, DATETIME_COLUMNS[TABLE_GASTOS_FIJOS], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_GASTOS_FIJOS, {}), TABLE_GASTOS_FIJOS)
+        df_mantenimiento_filtered = filter_df_by_date(st.session_state.df_gastos_mantenimiento, DATETIME_COLUMNS[TABLE_GASTOS_MANTENIMIENTO], start_ts, end_ts, TABLE_COLUMNS.get(TABLE_GASTOS_MANTENIMIENTO, {}), TABLE_GASTOS_MANTENIMIENTO)
 
         if df_consumo_filtered.empty:
             st.info("No hay datos de consumo en el rango de fechas seleccionado.")
@@ -1067,38 +1397,29 @@ def page_reportes_mina():
                       df_consumo_filtered[col] = 0.0
              date_col_name_consumo = DATETIME_COLUMNS[TABLE_CONSUMO]
              date_col_name_precio = DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE]
-             consumo_for_merge = df_consumo_filtered.dropna(subset=[date_col_name_consumo]).sort_values(date_col_name_consumo).copy()
-             precios_for_merge = df_precios_filtered.dropna(subset=[date_col_name_precio, 'Precio_Litro']).drop_duplicates(subset=[date_col_name_precio]).sort_values(date_col_name_precio).copy()
+             consumo_for_merge = df_consumo_filtered.dropna(subset=[date_col_name_consumo])
+             precios_for_merge = df_precios_filtered.dropna(subset=[date_col_name_precio, 'Precio_Litro']).drop_duplicates(subset=[date_col_name_precio])
              if not precios_for_merge.empty and date_col_name_precio in precios_for_merge.columns and 'Precio_Litro' in precios_for_merge.columns:
-                 consumo_for_merge[date_col_name_consumo] = pd.to_datetime(consumo_for_merge[date_col_name_consumo], errors='coerce')
-                 precios_for_merge[date_col_name_precio] = pd.to_datetime(precios_for_merge[date_col_name_precio], errors='coerce')
-                 consumo_merged = pd.merge_asof(consumo_for_merge, precios_for_merge[[date_col_name_precio, 'Precio_Litro']], left_on=date_col_name_consumo, right_on=date_col_name_precio, direction='backward', suffixes=('_consumo', '_precio'))
-                 price_col_after_merge = 'Precio_Litro_precio' if 'Precio_Litro_precio' in consumo_merged.columns else 'Precio_Litro'
-                 if price_col_after_merge in consumo_merged.columns:
-                      consumo_merged['Precio_Litro'] = pd.to_numeric(consumo_merged[price_col_after_merge], errors='coerce').fillna(0.0)
-                      if price_col_after_merge != 'Precio_Litro':
-                          consumo_merged = consumo_merged.drop(columns=[price_col_after_merge])
-                 else:
-                      consumo_merged['Precio_Litro'] = 0.0
-                 if date_col_name_consumo + '_consumo' in consumo_merged.columns:
-                     consumo_merged = consumo_merged.rename(columns={date_col_name_consumo + '_consumo': date_col_name_consumo})
-                 if date_col_name_precio in consumo_merged.columns and date_col_name_precio != date_col_name_consumo:
-                     consumo_merged = consumo_merged.drop(columns=[date_col_name_precio])
+                 consumo_merged = consumo_for_merge.reset_index(drop=True)
+                 consumo_merged['Precio_Litro'] = price_on_or_before(
+                     coerce_date(consumo_merged[date_col_name_consumo]),
+                     coerce_date(precios_for_merge[date_col_name_precio]),
+                     numeric_values(precios_for_merge, ['Precio_Litro'], fill_value=0.0)[:, 0])
              else:
-                  consumo_merged = consumo_for_merge.copy()
+                  consumo_merged = consumo_for_merge
                   consumo_merged['Precio_Litro'] = 0.0
-             reporte_consumo_detail = consumo_merged.copy()
+             reporte_consumo_detail = consumo_merged
              if 'Consumo_Litros' not in reporte_consumo_detail.columns: reporte_consumo_detail['Consumo_Litros'] = 0.0
              reporte_consumo_detail['Consumo_Litros'] = pd.to_numeric(reporte_consumo_detail['Consumo_Litros'], errors='coerce').fillna(0.0)
              reporte_consumo_detail['Costo_Combustible'] = reporte_consumo_detail['Consumo_Litros'] * reporte_consumo_detail['Precio_Litro']
              if 'Interno' in reporte_consumo_detail.columns:
-                 reporte_consumo_detail['Interno'] = reporte_consumo_detail['Interno'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(reporte_consumo_detail['Interno'].isna(), None)
                  reporte_consumo_detail_valid_interno = reporte_consumo_detail.dropna(subset=['Interno']).copy()
                  if not reporte_consumo_detail_valid_interno.empty:
-                      reporte_resumen_consumo = reporte_consumo_detail_valid_interno.groupby('Interno', dropna=True).agg(
-                          Total_Consumo_Litros=('Consumo_Litros', 'sum'), Total_Horas=('Horas_Trabajadas', 'sum'),
-                          Total_Kilometros=('Kilometros_Recorridos', 'sum'), Costo_Total_Combustible=('Costo_Combustible', 'sum')
-                      ).reset_index()
+                      resumen_keys, resumen_totals = sum_by_key(
+                          reporte_consumo_detail_valid_interno['Interno'].to_numpy(dtype=object),
+                          numeric_values(reporte_consumo_detail_valid_interno, ['Consumo_Litros', 'Horas_Trabajadas', 'Kilometros_Recorridos', 'Costo_Combustible'], fill_value=0.0))
+                      reporte_resumen_consumo = pd.DataFrame(resumen_totals, columns=['Total_Consumo_Litros', 'Total_Horas', 'Total_Kilometros', 'Costo_Total_Combustible'])
+                      reporte_resumen_consumo.insert(0, 'Interno', pd.array(resumen_keys, dtype=PANDAS_STRING_DTYPE))
                  else:
                       st.info("No hay datos de consumo válidos en el rango de fechas.")
                       reporte_resumen_consumo = pd.DataFrame(columns=['Interno', 'Total_Consumo_Litros', 'Total_Horas', 'Total_Kilometros', 'Costo_Total_Combustible'])
@@ -1111,33 +1432,16 @@ def page_reportes_mina():
                            reporte_resumen_consumo[col] = pd.to_numeric(reporte_resumen_consumo[col], errors='coerce').fillna(0.0)
                       else:
                            reporte_resumen_consumo[col] = 0.0
-                 reporte_resumen_consumo['Avg_Consumo_L_H'] = np.divide(
-                     reporte_resumen_consumo['Total_Consumo_Litros'], reporte_resumen_consumo['Total_Horas'],
-                     out=np.zeros_like(reporte_resumen_consumo['Total_Consumo_Litros'], dtype=float), where=reporte_resumen_consumo['Total_Horas'] != 0
-                 )
-                 reporte_resumen_consumo['Avg_Consumo_L_KM'] = np.divide(
-                     reporte_resumen_consumo['Total_Consumo_Litros'], reporte_resumen_consumo['Total_Kilometros'],
-                     out=np.zeros_like(reporte_resumen_consumo['Total_Consumo_Litros'], dtype=float), where=reporte_resumen_consumo['Total_Kilometros'] != 0
-                 )
-                 df_equipos_for_merge = st.session_state.get('df_equipos', pd.DataFrame())
-                 if 'Interno' in df_equipos_for_merge.columns:
-                      df_equipos_for_merge = df_equipos_for_merge[['Interno', 'Patente', 'ID_Flota']].copy()
-                      df_equipos_for_merge['Interno'] = df_equipos_for_merge['Interno'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_equipos_for_merge['Interno'].isna(), None)
-                      df_equipos_for_merge = df_equipos_for_merge.dropna(subset=['Interno'])
-                      reporte_resumen_consumo['Interno_str_for_merge'] = reporte_resumen_consumo['Interno'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(reporte_resumen_consumo['Interno'].isna(), None)
-                      reporte_resumen_consumo = reporte_resumen_consumo.merge(df_equipos_for_merge[['Interno', 'Patente', 'ID_Flota']], left_on='Interno_str_for_merge', right_on='Interno', how='left', suffixes=('', '_equipo_merge'))
-                      reporte_resumen_consumo['Patente'] = reporte_resumen_consumo.get('Patente_equipo_merge', pd.Series(dtype='object', index=reporte_resumen_consumo.index)).fillna('Sin Patente').astype(str).str.strip().replace({'': 'Sin Patente', 'nan': 'Sin Patente', 'None': 'Sin Patente'})
-                      reporte_resumen_consumo['ID_Flota'] = reporte_resumen_consumo.get('ID_Flota_equipo_merge', pd.Series(dtype='object', index=reporte_resumen_consumo.index)).astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(reporte_resumen_consumo.get('ID_Flota_equipo_merge', pd.Series(dtype='object', index=reporte_resumen_consumo.index)).isna(), None)
-                      reporte_resumen_consumo = reporte_resumen_consumo.drop(columns=['Interno_str_for_merge', 'Interno_equipo_merge', 'Patente_equipo_merge', 'ID_Flota_equipo_merge'], errors='ignore')
-                      df_flotas_for_merge = st.session_state.get('df_flotas', pd.DataFrame())
-                      if 'ID_Flota' in df_flotas_for_merge.columns:
-                           df_flotas_for_merge = df_flotas_for_merge[['ID_Flota', 'Nombre_Flota']].copy()
-                           df_flotas_for_merge['ID_Flota'] = df_flotas_for_merge['ID_Flota'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_flotas_for_merge['ID_Flota'].isna(), None)
-                           df_flotas_for_merge = df_flotas_for_merge.dropna(subset=['ID_Flota'])
-                           reporte_resumen_consumo['ID_Flota_str_for_merge_flota'] = reporte_resumen_consumo['ID_Flota'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(reporte_resumen_consumo['ID_Flota'].isna(), None)
-                           reporte_resumen_consumo = reporte_resumen_consumo.merge(df_flotas_for_merge[['ID_Flota', 'Nombre_Flota']], left_on='ID_Flota_str_for_merge_flota', right_on='ID_Flota', how='left', suffixes=('', '_flota_merge'))
-                           reporte_resumen_consumo['Nombre_Flota'] = reporte_resumen_consumo.get('Nombre_Flota_flota_merge', pd.Series(dtype='object', index=reporte_resumen_consumo.index)).fillna('Sin Flota')
-                           reporte_resumen_consumo = reporte_resumen_consumo.drop(columns=['ID_Flota_str_for_merge_flota', 'ID_Flota_flota_merge'], errors='ignore')
+                 litros = numeric_values(reporte_resumen_consumo, ['Total_Consumo_Litros'], fill_value=0.0)
+                 denominators = numeric_values(reporte_resumen_consumo, ['Total_Horas', 'Total_Kilometros'], fill_value=0.0)
+                 with np.errstate(divide='ignore', invalid='ignore'):
+                      ratios = np.where(denominators != 0, litros / denominators, 0.0)
+                 reporte_resumen_consumo[['Avg_Consumo_L_H', 'Avg_Consumo_L_KM']] = ratios
+                 if 'Interno' in df_equipos_lookup.columns:
+                      reporte_resumen_consumo['Patente'] = reporte_resumen_consumo['Interno'].map(interno_to_patente).fillna('Sin Patente')
+                      reporte_resumen_consumo['ID_Flota'] = reporte_resumen_consumo['Interno'].map(interno_to_flota)
+                      if 'ID_Flota' in df_flotas_lookup.columns:
+                           reporte_resumen_consumo['Nombre_Flota'] = reporte_resumen_consumo['ID_Flota'].map(flota_to_nombre).fillna('Sin Flota')
                       else:
                            reporte_resumen_consumo['Nombre_Flota'] = 'Sin Datos de Flota'
                  else:
@@ -1146,85 +1450,48 @@ def page_reportes_mina():
                      reporte_resumen_consumo['Nombre_Flota'] = 'Sin Datos Equipo'
                      reporte_resumen_consumo['ID_Flota'] = pd.NA
                  expected_display_cols_consumo = ['Interno', 'Patente', 'Nombre_Flota', 'ID_Flota', 'Total_Consumo_Litros', 'Total_Horas', 'Total_Kilometros', 'Avg_Consumo_L_H', 'Avg_Consumo_L_KM', 'Costo_Total_Combustible']
-                 for col in expected_display_cols_consumo:
-                      if col not in reporte_resumen_consumo.columns:
-                           reporte_resumen_consumo[col] = pd.NA
                  st.subheader(f"Reporte Consumo y Costo Combustible ({fecha_inicio} a {fecha_fin})")
                  st.dataframe(reporte_resumen_consumo[expected_display_cols_consumo].round(2))
              else:
                  st.info("No hay datos de consumo válidos en el rango de fechas.")
                  reporte_resumen_consumo = pd.DataFrame(columns=['Interno', 'Patente', 'ID_Flota', 'Nombre_Flota', 'Total_Consumo_Litros', 'Total_Horas', 'Total_Kilometros', 'Avg_Consumo_L_H', 'Avg_Consumo_L_KM', 'Costo_Total_Combustible'])
 
-        salarial_agg = pd.DataFrame(columns=['Interno', 'Total_Salarial'])
-        if 'Interno' in df_salarial_filtered.columns and 'Monto_Salarial' in df_salarial_filtered.columns:
-            df_salarial_filtered_clean = df_salarial_filtered.copy()
-            df_salarial_filtered_clean['Interno'] = df_salarial_filtered_clean['Interno'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_salarial_filtered_clean['Interno'].isna(), None)
-            df_salarial_filtered_clean['Monto_Salarial'] = pd.to_numeric(df_salarial_filtered_clean['Monto_Salarial'], errors='coerce').fillna(0.0)
-            salarial_agg = df_salarial_filtered_clean.dropna(subset=['Interno']).groupby('Interno', dropna=True)['Monto_Salarial'].sum().reset_index(name='Total_Salarial')
-        fijos_agg = pd.DataFrame(columns=['Interno', 'Total_Gastos_Fijos'])
-        if 'Interno' in df_fijos_filtered.columns and 'Monto_Gasto_Fijo' in df_fijos_filtered.columns:
-             df_fijos_filtered_clean = df_fijos_filtered.copy()
-             df_fijos_filtered_clean['Interno'] = df_fijos_filtered_clean['Interno'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_fijos_filtered_clean['Interno'].isna(), None)
-             df_fijos_filtered_clean['Monto_Gasto_Fijo'] = pd.to_numeric(df_fijos_filtered_clean['Monto_Gasto_Fijo'], errors='coerce').fillna(0.0)
-             fijos_agg = df_fijos_filtered_clean.dropna(subset=['Interno']).groupby('Interno', dropna=True)['Monto_Gasto_Fijo'].sum().reset_index(name='Total_Gastos_Fijos')
-        mantenimiento_agg = pd.DataFrame(columns=['Interno', 'Total_Gastos_Mantenimiento'])
-        if 'Interno' in df_mantenimiento_filtered.columns and 'Monto_Mantenimiento' in df_mantenimiento_filtered.columns:
-             df_mantenimiento_filtered_clean = df_mantenimiento_filtered.copy()
-             df_mantenimiento_filtered_clean['Interno'] = df_mantenimiento_filtered_clean['Interno'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_mantenimiento_filtered_clean['Interno'].isna(), None)
-             df_mantenimiento_filtered_clean['Monto_Mantenimiento'] = pd.to_numeric(df_mantenimiento_filtered_clean['Monto_Mantenimiento'], errors='coerce').fillna(0.0)
-             mantenimiento_agg = df_mantenimiento_filtered_clean.dropna(subset=['Interno']).groupby('Interno', dropna=True)['Monto_Mantenimiento'].sum().reset_index(name='Total_Gastos_Mantenimiento')
-        all_internos_series_list = [
-            df_consumo_filtered.get('Interno', pd.Series(dtype='object')).astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}),
-            df_salarial_filtered.get('Interno', pd.Series(dtype='object')).astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}),
-            df_fijos_filtered.get('Interno', pd.Series(dtype='object')).astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}),
-            df_mantenimiento_filtered.get('Interno', pd.Series(dtype='object')).astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}),
+        salarial_agg = sum_by_interno(df_salarial_filtered, 'Monto_Salarial', 'Total_Salarial')
+        fijos_agg = sum_by_interno(df_fijos_filtered, 'Monto_Gasto_Fijo', 'Total_Gastos_Fijos')
+        mantenimiento_agg = sum_by_interno(df_mantenimiento_filtered, 'Monto_Mantenimiento', 'Total_Gastos_Mantenimiento')
+        internos_per_table = [
+            df['Interno'].dropna().unique().to_numpy(dtype=object)
+            for df in (df_consumo_filtered, df_salarial_filtered, df_fijos_filtered, df_mantenimiento_filtered) if 'Interno' in df.columns
         ]
-        all_internos_in_period = pd.concat(all_internos_series_list).dropna().unique().tolist()
+        all_internos_in_period = pd.unique(np.concatenate(internos_per_table)).tolist() if internos_per_table else []
         if not all_internos_in_period:
              st.info("No hay datos de costos en el rango de fechas para ningún equipo.")
         else:
-             df_all_internos = pd.DataFrame({'Interno': all_internos_in_period})
-             df_all_internos['Interno'] = df_all_internos['Interno'].astype(str)
-             df_equipos_for_merge = st.session_state.get('df_equipos', pd.DataFrame())
-             if 'Interno' in df_equipos_for_merge.columns:
-                  df_equipos_for_merge = df_equipos_for_merge[['Interno', 'Patente', 'ID_Flota']].copy()
-                  df_equipos_for_merge['Interno'] = df_equipos_for_merge['Interno'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_equipos_for_merge['Interno'].isna(), None)
-                  df_equipos_for_merge = df_equipos_for_merge.dropna(subset=['Interno'])
-                  reporte_costo_total = df_all_internos.merge(df_equipos_for_merge, on='Interno', how='left')
-                  reporte_costo_total['Patente'] = reporte_costo_total.get('Patente', pd.Series(dtype='object', index=reporte_costo_total.index)).fillna('Sin Patente').astype(str).str.strip().replace({'': 'Sin Patente', 'nan': 'Sin Patente', 'None': 'Sin Patente'})
-                  reporte_costo_total['ID_Flota'] = reporte_costo_total.get('ID_Flota', pd.Series(dtype='object', index=reporte_costo_total.index)).astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(reporte_costo_total.get('ID_Flota', pd.Series(dtype='object', index=reporte_costo_total.index)).isna(), None)
-                  df_flotas_for_merge = st.session_state.get('df_flotas', pd.DataFrame())
-                  if 'ID_Flota' in df_flotas_for_merge.columns:
-                       df_flotas_for_merge = df_flotas_for_merge[['ID_Flota', 'Nombre_Flota']].copy()
-                       df_flotas_for_merge['ID_Flota'] = df_flotas_for_merge['ID_Flota'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_flotas_for_merge['ID_Flota'].isna(), None)
-                       df_flotas_for_merge = df_flotas_for_merge.dropna(subset=['ID_Flota'])
-                       reporte_costo_total['ID_Flota_str_for_merge_flota'] = reporte_costo_total['ID_Flota'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(reporte_costo_total['ID_Flota'].isna(), None)
-                       reporte_costo_total = reporte_costo_total.merge(df_flotas_for_merge[['ID_Flota', 'Nombre_Flota']], left_on='ID_Flota_str_for_merge_flota', right_on='ID_Flota', how='left', suffixes=('', '_flota_merge'))
-                       reporte_costo_total['Nombre_Flota'] = reporte_costo_total.get('Nombre_Flota_flota_merge', pd.Series(dtype='object', index=reporte_costo_total.index)).fillna('Sin Flota')
-                       reporte_costo_total = reporte_costo_total.drop(columns=['ID_Flota_str_for_merge_flota', 'ID_Flota_flota_merge'], errors='ignore')
+             reporte_costo_total = pd.DataFrame({'Interno': pd.Series(all_internos_in_period).astype(str)})
+             if 'Interno' in df_equipos_lookup.columns:
+                  reporte_costo_total['Patente'] = reporte_costo_total['Interno'].map(interno_to_patente).fillna('Sin Patente')
+                  reporte_costo_total['ID_Flota'] = reporte_costo_total['Interno'].map(interno_to_flota)
+                  if 'ID_Flota' in df_flotas_lookup.columns:
+                       reporte_costo_total['Nombre_Flota'] = reporte_costo_total['ID_Flota'].map(flota_to_nombre).fillna('Sin Flota')
                   else:
                        reporte_costo_total['Nombre_Flota'] = 'Sin Datos de Flota'
              else:
                  st.warning("La tabla de equipos no contiene 'Interno'.")
-                 reporte_costo_total = df_all_internos.copy()
                  reporte_costo_total['Patente'] = 'Sin Datos Equipo'
                  reporte_costo_total['Nombre_Flota'] = 'Sin Datos Equipo'
                  reporte_costo_total['ID_Flota'] = pd.NA
-             reporte_costo_total = reporte_costo_total.merge(reporte_resumen_consumo[['Interno', 'Costo_Total_Combustible']].astype({'Interno':'str'}), on='Interno', how='left').fillna({'Costo_Total_Combustible': 0.0})
-             reporte_costo_total = reporte_costo_total.merge(salarial_agg.astype({'Interno':'str'}), on='Interno', how='left').fillna({'Total_Salarial': 0.0})
-             reporte_costo_total = reporte_costo_total.merge(fijos_agg.astype({'Interno':'str'}), on='Interno', how='left').fillna({'Total_Gastos_Fijos': 0.0})
-             reporte_costo_total = reporte_costo_total.merge(mantenimiento_agg.astype({'Interno':'str'}), on='Interno', how='left').fillna({'Total_Gastos_Mantenimiento': 0.0})
-             cost_cols = ['Costo_Total_Combustible', 'Total_Salarial', 'Total_Gastos_Fijos', 'Total_Gastos_Mantenimiento']
-             for col in cost_cols:
-                  if col not in reporte_costo_total.columns:
-                      reporte_costo_total[col] = 0.0
-                  else:
-                      reporte_costo_total[col] = pd.to_numeric(reporte_costo_total[col], errors='coerce').fillna(0.0)
-             reporte_costo_total['Costo_Total_Equipo'] = reporte_costo_total[cost_cols].sum(axis=1)
+             cost_sources = [(reporte_resumen_consumo, 'Costo_Total_Combustible'), (salarial_agg, 'Total_Salarial'), (fijos_agg, 'Total_Gastos_Fijos'), (mantenimiento_agg, 'Total_Gastos_Mantenimiento')]
+             cost_cols = [col for _, col in cost_sources]
+             cost_matrix = np.zeros((len(reporte_costo_total), len(cost_cols) + 1), dtype=np.float64)
+             interno_index = pd.Index(reporte_costo_total['Interno'])
+             for j, (agg_df, col) in enumerate(cost_sources):
+                  if 'Interno' in agg_df.columns and col in agg_df.columns and not agg_df.empty:
+                      positions = interno_index.get_indexer(agg_df['Interno'].astype(str))
+                      found = positions >= 0
+                      cost_matrix[positions[found], j] = numeric_values(agg_df, [col], fill_value=0.0)[found, 0]
+             cost_matrix[:, -1] = cost_matrix[:, :-1].sum(axis=1)
+             reporte_costo_total[cost_cols + ['Costo_Total_Equipo']] = cost_matrix
              expected_display_cols_total_cost = ['Interno', 'Patente', 'Nombre_Flota', 'ID_Flota'] + cost_cols + ['Costo_Total_Equipo']
-             for col in expected_display_cols_total_cost:
-                 if col not in reporte_costo_total.columns:
-                      reporte_costo_total[col] = pd.NA
              st.subheader(f"Reporte Costo Total por Equipo ({fecha_inicio} a {fecha_fin})")
              if reporte_costo_total.empty:
                  st.info("No hay datos de costos en el rango de fechas para ningún equipo.")
@@ -1243,15 +1510,8 @@ def page_variacion_costos_flota():
     st.write("Compara los costos totales de la flota entre dos períodos para visualizar la variación.")
     st.subheader("Seleccione Períodos a Comparar")
     col1, col2, col3, col4 = st.columns(4)
-    all_relevant_dates = pd.Series(dtype='datetime64[ns]')
-    for table_name, date_col in DATETIME_COLUMNS.items():
-         df_temp = st.session_state.get(f'df_{table_name.lower()}', pd.DataFrame())
-         if date_col in df_temp.columns and not df_temp.empty:
-              all_relevant_dates = pd.concat([all_relevant_dates, pd.to_datetime(df_temp[date_col], errors='coerce')])
-    all_relevant_dates = all_relevant_dates.dropna()
-    if not all_relevant_dates.empty:
-        min_app_date = all_relevant_dates.min().date()
-        max_app_date = all_relevant_dates.max().date()
+    min_app_date, max_app_date = app_date_range()
+    if min_app_date is not None:
         today = datetime.date.today()
         default_end_p2 = min(today, max_app_date)
         default_start_p2 = max(default_end_p2 - pd.Timedelta(days=30), min_app_date)
@@ -1273,8 +1533,8 @@ def page_variacion_costos_flota():
         default_end_p2 = max(default_end_p2, min_date_input_display)
         default_end_p1 = max(default_end_p1, default_start_p1)
         default_end_p2 = max(default_end_p2, default_start_p2)
-    min_date_input_display = all_relevant_dates.min().date() if not all_relevant_dates.empty else datetime.date.today() - pd.Timedelta(days=365 * 5)
-    max_date_input_display = all_relevant_dates.max().date() if not all_relevant_dates.empty else datetime.date.today()
+    min_date_input_display = min_app_date if min_app_date is not None else datetime.date.today() - pd.Timedelta(days=365 * 5)
+    max_date_input_display = max_app_date if max_app_date is not None else datetime.date.today()
     with col1:
         fecha_inicio_p1 = st.date_input("Inicio Período 1", default_start_p1, min_value=min_date_input_display, max_value=max_date_input_display, key="fecha_inicio_p1")
     with col2:
@@ -1288,61 +1548,38 @@ def page_variacion_costos_flota():
     elif not (fecha_fin_p1 < fecha_inicio_p2 or fecha_fin_p2 < fecha_inicio_p1 or (fecha_inicio_p1 == fecha_inicio_p2 and fecha_fin_p1 == fecha_fin_p2)):
          st.warning("Advertencia: Los períodos seleccionados se solapan o no están en orden.")
     if st.button("Generar Gráfico de Cascada", key="generate_waterfall_button"):
-        def aggregate_cost_column(df_original, date_col_name, cost_col_name, start_ts, end_ts, expected_cols_dict):
-            if df_original.empty or date_col_name not in df_original.columns or cost_col_name not in df_original.columns:
-                 return 0.0
-            df_temp = df_original.copy()
-            df_temp['Date_dt'] = pd.to_datetime(df_temp.get(date_col_name), errors='coerce')
-            df_temp[cost_col_name] = pd.to_numeric(df_temp.get(cost_col_name, pd.Series(0.0, index=df_temp.index)), errors='coerce').fillna(0.0)
-            df_filtered = df_temp[df_temp['Date_dt'].notna() & (df_temp['Date_dt'] >= start_ts) & (df_temp['Date_dt'] <= end_ts)].copy()
-            return df_filtered[cost_col_name].sum()
+        def aggregate_cost_column(table_name, cost_col_name, periods):
+            df_original = st.session_state[f'df_{table_name.lower()}']
+            if df_original.empty or DATETIME_COLUMNS[table_name] not in df_original.columns or cost_col_name not in df_original.columns:
+                 return (0.0,) * len(periods)
+            df_clean, date_ns = canonical_entry(table_name, df_original)
+            amounts = numeric_values(df_clean, [cost_col_name], fill_value=0.0)[:, 0]
+            starts = np.searchsorted(date_ns, [pd.Timestamp(start_ts).value for start_ts, _ in periods], side='left')
+            ends = np.searchsorted(date_ns, [pd.Timestamp(end_ts).value for _, end_ts in periods], side='right')
+            return tuple(float(amounts[lo:hi].sum()) for lo, hi in zip(starts, ends))
         start_ts_p1 = pd.Timestamp(fecha_inicio_p1).normalize()
         end_ts_p1 = pd.Timestamp(fecha_fin_p1) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
         start_ts_p2 = pd.Timestamp(fecha_inicio_p2).normalize()
         end_ts_p2 = pd.Timestamp(fecha_fin_p2) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-        consumo_p1_filtered_dt = filter_df_by_date(st.session_state.df_consumo, DATETIME_COLUMNS[TABLE_CONSUMO], start_ts_p1, end_ts_p1, TABLE_COLUMNS.get(TABLE_CONSUMO, {}))
-        precios_p1_filtered_dt = filter_df_by_date(st.session_state.df_precios_combustible, DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE], start_ts_p1, end_ts_p1, TABLE_COLUMNS.get(TABLE_PRECIOS_COMBUSTIBLE, {}))
-        costo_combustible_p1 = 0
-        date_col_name_consumo = DATETIME_COLUMNS[TABLE_CONSUMO]
-        date_col_name_precio = DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE]
-        if not consumo_p1_filtered_dt.empty and not precios_p1_filtered_dt.empty and date_col_name_consumo in consumo_p1_filtered_dt.columns and date_col_name_precio in precios_p1_filtered_dt.columns and 'Consumo_Litros' in consumo_p1_filtered_dt.columns and 'Precio_Litro' in precios_p1_filtered_dt.columns:
-             consumo_p1_filtered_dt[date_col_name_consumo] = pd.to_datetime(consumo_p1_filtered_dt[date_col_name_consumo], errors='coerce')
-             precios_p1_filtered_dt[date_col_name_precio] = pd.to_datetime(precios_p1_filtered_dt[date_col_name_precio], errors='coerce')
-             consumo_p1_sorted = consumo_p1_filtered_dt.dropna(subset=[date_col_name_consumo]).sort_values(date_col_name_consumo).copy()
-             precios_p1_sorted = precios_p1_filtered_dt.dropna(subset=[date_col_name_precio, 'Precio_Litro']).drop_duplicates(subset=[date_col_name_precio]).sort_values(date_col_name_precio).copy()
-             if not consumo_p1_sorted.empty and not precios_p1_sorted.empty:
-                  consumo_merged = pd.merge_asof(consumo_p1_sorted, precios_p1_sorted[[date_col_name_precio, 'Precio_Litro']], left_on=date_col_name_consumo, right_on=date_col_name_precio, direction='backward', suffixes=('_consumo', '_precio'))
-                  price_col_after_merge = 'Precio_Litro_precio' if 'Precio_Litro_precio' in consumo_merged.columns else 'Precio_Litro'
-                  if price_col_after_merge in consumo_merged.columns and 'Consumo_Litros' in consumo_merged.columns:
-                       consumo_merged['Consumo_Litros'] = pd.to_numeric(consumo_merged['Consumo_Litros'], errors='coerce').fillna(0.0)
-                       consumo_merged[price_col_after_merge] = pd.to_numeric(consumo_merged[price_col_after_merge], errors='coerce').fillna(0.0)
-                       costo_combustible_p1 = (consumo_merged['Consumo_Litros'] * consumo_merged[price_col_after_merge]).sum()
-                  consumo_merged = consumo_merged.loc[:,~consumo_merged.columns.duplicated()].copy()
-        costo_salarial_p1 = aggregate_cost_column(st.session_state.df_costos_salarial, DATETIME_COLUMNS[TABLE_COSTOS_SALARIAL], 'Monto_Salarial', start_ts_p1, end_ts_p1, TABLE_COLUMNS.get(TABLE_COSTOS_SALARIAL, {}))
-        costo_fijos_p1 = aggregate_cost_column(st.session_state.df_gastos_fijos, DATETIME_COLUMNS[TABLE_GASTOS_FIJOS], 'Monto_Gasto_Fijo', start_ts_p1, end_ts_p1, TABLE_COLUMNS.get(TABLE_GASTOS_FIJOS, {}))
-        costo_mantenimiento_p1 = aggregate_cost_column(st.session_state.df_gastos_mantenimiento, DATETIME_COLUMNS[TABLE_GASTOS_MANTENIMIENTO], 'Monto_Mantenimiento', start_ts_p1, end_ts_p1, TABLE_COLUMNS.get(TABLE_GASTOS_MANTENIMIENTO, {}))
+        periods = ((start_ts_p1, end_ts_p1), (start_ts_p2, end_ts_p2))
+        costo_salarial_p1, costo_salarial_p2 = aggregate_cost_column(TABLE_COSTOS_SALARIAL, 'Monto_Salarial', periods)
+        costo_fijos_p1, costo_fijos_p2 = aggregate_cost_column(TABLE_GASTOS_FIJOS, 'Monto_Gasto_Fijo', periods)
+        costo_mantenimiento_p1, costo_mantenimiento_p2 = aggregate_cost_column(TABLE_GASTOS_MANTENIMIENTO, 'Monto_Mantenimiento', periods)
+        df_consumo_all = st.session_state.df_consumo
+        df_precios_all = st.session_state.df_precios_combustible
+        if df_consumo_all.empty or df_precios_all.empty:
+            costo_combustible_p1 = costo_combustible_p2 = 0.0
+        else:
+            df_consumo_clean, consumo_ns = canonical_entry(TABLE_CONSUMO, df_consumo_all)
+            litros = numeric_values(df_consumo_clean, ['Consumo_Litros'], fill_value=0.0)[:, 0]
+            df_precios_clean, precio_ns = canonical_entry(TABLE_PRECIOS_COMBUSTIBLE, df_precios_all)
+            precio_values = numeric_values(df_precios_clean, ['Precio_Litro'])[:, 0]
+            valid_precios = df_precios_clean[DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE]].notna().to_numpy() & ~np.isnan(precio_values)
+            precio_ns, first_precio = np.unique(precio_ns[valid_precios], return_index=True)
+            precios = precio_values[valid_precios][first_precio]
+            costo_combustible_p1 = period_fuel_cost(consumo_ns, litros, precio_ns, precios, start_ts_p1, end_ts_p1)
+            costo_combustible_p2 = period_fuel_cost(consumo_ns, litros, precio_ns, precios, start_ts_p2, end_ts_p2)
         total_costo_p1 = costo_combustible_p1 + costo_salarial_p1 + costo_fijos_p1 + costo_mantenimiento_p1
-        consumo_p2_filtered_dt = filter_df_by_date(st.session_state.df_consumo, DATETIME_COLUMNS[TABLE_CONSUMO], start_ts_p2, end_ts_p2, TABLE_COLUMNS.get(TABLE_CONSUMO, {}))
-        precios_p2_filtered_dt = filter_df_by_date(st.session_state.df_precios_combustible, DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE], start_ts_p2, end_ts_p2, TABLE_COLUMNS.get(TABLE_PRECIOS_COMBUSTIBLE, {}))
-        costo_combustible_p2 = 0
-        date_col_name_consumo = DATETIME_COLUMNS[TABLE_CONSUMO]
-        date_col_name_precio = DATETIME_COLUMNS[TABLE_PRECIOS_COMBUSTIBLE]
-        if not consumo_p2_filtered_dt.empty and not precios_p2_filtered_dt.empty and date_col_name_consumo in consumo_p2_filtered_dt.columns and date_col_name_precio in precios_p2_filtered_dt.columns and 'Consumo_Litros' in consumo_p2_filtered_dt.columns and 'Precio_Litro' in precios_p2_filtered_dt.columns:
-             consumo_p2_filtered_dt[date_col_name_consumo] = pd.to_datetime(consumo_p2_filtered_dt[date_col_name_consumo], errors='coerce')
-             precios_p2_filtered_dt[date_col_name_precio] = pd.to_datetime(precios_p2_filtered_dt[date_col_name_precio], errors='coerce')
-             consumo_p2_sorted = consumo_p2_filtered_dt.dropna(subset=[date_col_name_consumo]).sort_values(date_col_name_consumo).copy()
-             precios_p2_sorted = precios_p2_filtered_dt.dropna(subset=[date_col_name_precio, 'Precio_Litro']).drop_duplicates(subset=[date_col_name_precio]).sort_values(date_col_name_precio).copy()
-             if not consumo_p2_sorted.empty and not precios_p2_sorted.empty:
-                  consumo_merged = pd.merge_asof(consumo_p2_sorted, precios_p2_sorted[[date_col_name_precio, 'Precio_Litro']], left_on=date_col_name_consumo, right_on=date_col_name_precio, direction='backward', suffixes=('_consumo', '_precio'))
-                  price_col_after_merge = 'Precio_Litro_precio' if 'Precio_Litro_precio' in consumo_merged.columns else 'Precio_Litro'
-                  if price_col_after_merge in consumo_merged.columns and 'Consumo_Litros' in consumo_merged.columns:
-                       consumo_merged['Consumo_Litros'] = pd.to_numeric(consumo_merged['Consumo_Litros'], errors='coerce').fillna(0.0)
-                       consumo_merged[price_col_after_merge] = pd.to_numeric(consumo_merged[price_col_after_merge], errors='coerce').fillna(0.0)
-                       costo_combustible_p2 = (consumo_merged['Consumo_Litros'] * consumo_merged[price_col_after_merge]).sum()
-                  consumo_merged = consumo_merged.loc[:,~consumo_merged.columns.duplicated()].copy()
-        costo_salarial_p2 = aggregate_cost_column(st.session_state.df_costos_salarial, DATETIME_COLUMNS[TABLE_COSTOS_SALARIAL], 'Monto_Salarial', start_ts_p2, end_ts_p2, TABLE_COLUMNS.get(TABLE_COSTOS_SALARIAL, {}))
-        costo_fijos_p2 = aggregate_cost_column(st.session_state.df_gastos_fijos, DATETIME_COLUMNS[TABLE_GASTOS_FIJOS], 'Monto_Gasto_Fijo', start_ts_p2, end_ts_p2, TABLE_COLUMNS.get(TABLE_GASTOS_FIJOS, {}))
-        costo_mantenimiento_p2 = aggregate_cost_column(st.session_state.df_gastos_mantenimiento, DATETIME_COLUMNS[TABLE_GASTOS_MANTENIMIENTO], 'Monto_Mantenimiento', start_ts_p2, end_ts_p2, TABLE_COLUMNS.get(TABLE_GASTOS_MANTENIMIENTO, {}))
         total_costo_p2 = costo_combustible_p2 + costo_salarial_p2 + costo_fijos_p2 + costo_mantenimiento_p2
         labels = [f'Total Costo<br>P1<br>({fecha_inicio_p1.strftime("%Y-%m-%d")} a {fecha_fin_p1.strftime("%Y-%m-%d")})']
         measures = ['absolute']
@@ -1354,17 +1591,21 @@ def page_variacion_costos_flota():
         variacion_mantenimiento = costo_mantenimiento_p2 - costo_mantenimiento_p1
         variacion_total = total_costo_p2 - total_costo_p1
         variation_threshold = 0.01
-        variation_data = []
-        if 'Consumo_Litros' in TABLE_COLUMNS.get(TABLE_CONSUMO, {}) and 'Precio_Litro' in TABLE_COLUMNS.get(TABLE_PRECIOS_COMBUSTIBLE, {}) and abs(variacion_combustible) >= variation_threshold: variation_data.append({'label': 'Var. Combustible', 'value': variacion_combustible})
-        if 'Monto_Salarial' in TABLE_COLUMNS.get(TABLE_COSTOS_SALARIAL, {}) and abs(variacion_salarial) >= variation_threshold: variation_data.append({'label': 'Var. Salarial', 'value': variacion_salarial})
-        if 'Monto_Gasto_Fijo' in TABLE_COLUMNS.get(TABLE_GASTOS_FIJOS, {}) and abs(variacion_fijos) >= variation_threshold: variation_data.append({'label': 'Var. Fijos', 'value': variacion_fijos})
-        if 'Monto_Mantenimiento' in TABLE_COLUMNS.get(TABLE_GASTOS_MANTENIMIENTO, {}) and abs(variacion_mantenimiento) >= variation_threshold: variation_data.append({'label': 'Var. Mantenimiento', 'value': variacion_mantenimiento})
-        variation_data.sort(key=lambda x: x['value'], reverse=True)
-        for item in variation_data:
-            labels.append(item['label'])
+        variation_labels = np.array(['Var. Combustible', 'Var. Salarial', 'Var. Fijos', 'Var. Mantenimiento'])
+        variation_values = np.array([variacion_combustible, variacion_salarial, variacion_fijos, variacion_mantenimiento])
+        variation_available = np.array([
+            'Consumo_Litros' in TABLE_COLUMNS.get(TABLE_CONSUMO, {}) and 'Precio_Litro' in TABLE_COLUMNS.get(TABLE_PRECIOS_COMBUSTIBLE, {}),
+            'Monto_Salarial' in TABLE_COLUMNS.get(TABLE_COSTOS_SALARIAL, {}),
+            'Monto_Gasto_Fijo' in TABLE_COLUMNS.get(TABLE_GASTOS_FIJOS, {}),
+            'Monto_Mantenimiento' in TABLE_COLUMNS.get(TABLE_GASTOS_MANTENIMIENTO, {}),
+        ])
+        keep = np.flatnonzero(variation_available & (np.abs(variation_values) >= variation_threshold))
+        keep = keep[np.argsort(-variation_values[keep], kind='stable')]
+        for label, value in zip(variation_labels[keep].tolist(), variation_values[keep].tolist()):
+            labels.append(label)
             measures.append('relative')
-            values.append(item['value'])
-            texts.append(f"${item['value']:,.2f}")
+            values.append(value)
+            texts.append(f"${value:,.2f}")
         labels.append(f'Total Costo<br>P2<br>({fecha_inicio_p2.strftime("%Y-%m-%d")} a {fecha_fin_p2.strftime("%Y-%m-%d")})')
         measures.append('total')
         values.append(total_costo_p2)
@@ -1403,7 +1644,7 @@ def page_variacion_costos_flota():
             st.write(f"- Fijos: ${costo_fijos_p2:,.2f}")
             st.write(f"- Mantenimiento: ${costo_mantenimiento_p2:,.2f}")
             st.write(f"**Total Periodo 2: ${total_costo_p2:,.2f}**")
-        if abs(variacion_total) >= variation_threshold or variation_data:
+        if abs(variacion_total) >= variation_threshold or keep.size:
             st.subheader("Variaciones por Categoría")
             st.write(f"- Combustible: ${variacion_combustible:,.2f}")
             st.write(f"- Salarial: ${variacion_salarial:,.2f}")
@@ -1426,53 +1667,29 @@ def page_gestion_obras():
         if submitted:
             if not nombre_obra or not responsable:
                 st.warning("Por favor, complete Nombre de Obra y Responsable.")
-            elif nombre_obra.lower() in st.session_state.df_proyectos['Nombre_Obra'].astype(str).str.strip().str.lower().tolist():
+            elif nombre_obra.lower() in stripped_text(st.session_state.df_proyectos['Nombre_Obra']).str.lower().tolist():
                 st.warning(f"La obra '{nombre_obra}' ya existe.")
             else:
-                existing_ids = set(st.session_state.df_proyectos['ID_Obra'].astype(str).tolist())
-                base_id = f"OBRA_{int(time.time() * 1e6)}"
-                id_obra = base_id
-                counter = 0
-                while id_obra in existing_ids:
-                    counter += 1
-                    id_obra = f"{base_id}_{counter}"
+                id_obra = unique_id(f"OBRA_{int(time.time() * 1e6)}", id_set(TABLE_PROYECTOS, st.session_state.df_proyectos, 'ID_Obra'))
                 new_obra_data = {'ID_Obra': id_obra, 'Nombre_Obra': nombre_obra, 'Responsable': responsable}
-                new_obra_df = pd.DataFrame([new_obra_data])
-                expected_cols_proyectos = list(TABLE_COLUMNS[TABLE_PROYECTOS].keys())
-                new_obra_df = new_obra_df.reindex(columns=expected_cols_proyectos)
-                for col, dtype in TABLE_COLUMNS[TABLE_PROYECTOS].items():
-                    if col in new_obra_df.columns:
-                         try:
-                              if dtype == 'object':
-                                   new_obra_df[col] = new_obra_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                   new_obra_df[col] = new_obra_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                              elif 'float' in dtype: new_obra_df[col] = pd.to_numeric(new_obra_df[col], errors='coerce').astype(float).fillna(0.0)
-                              elif 'int' in dtype:
-                                   if hasattr(pd, 'Int64Dtype'): new_obra_df[col] = pd.to_numeric(new_obra_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                   else: new_obra_df[col] = pd.to_numeric(new_obra_df[col], errors='coerce').astype(float).fillna(0.0)
-                         except Exception as dtype_e:
-                              st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                df_current_proyectos_reindexed = st.session_state.df_proyectos.reindex(columns=expected_cols_proyectos)
-                st.session_state.df_proyectos = pd.concat([df_current_proyectos_reindexed, new_obra_df], ignore_index=True)
-                save_table(st.session_state.df_proyectos, DATABASE_FILE, TABLE_PROYECTOS)
+                st.session_state.df_proyectos = append_row(st.session_state.df_proyectos, new_obra_data, EXPECTED_COLS[TABLE_PROYECTOS])
+                insert_row(DATABASE_FILE, TABLE_PROYECTOS, new_obra_data)
                 st.success(f"Obra '{nombre_obra}' creada con ID: {id_obra}")
                 st.experimental_rerun()
 
     st.subheader("Lista de Obras")
-    obras_disponibles_list = st.session_state.df_proyectos['ID_Obra'].unique().tolist()
-    obras_disponibles_list = [str(id).strip() for id in obras_disponibles_list if pd.notna(id) and str(id).strip() != '']
-    obras_disponibles_list.sort()
+    obras_disponibles_list = obra_options(stored_fingerprint(TABLE_PROYECTOS, st.session_state.df_proyectos), st.session_state.df_proyectos)[0]
     if not obras_disponibles_list:
         st.info("No hay obras creadas aún.")
         if "select_obra_gestion_selectbox_persistent" in st.session_state:
              del st.session_state["select_obra_gestion_selectbox_persistent"]
     else:
          st.info("Edite la tabla siguiente para modificar o eliminar obras.")
-         df_proyectos_editable = st.session_state.df_proyectos.copy()
-         expected_cols_proyectos = list(TABLE_COLUMNS[TABLE_PROYECTOS].keys())
+         df_proyectos_editable = st.session_state.df_proyectos
+         expected_cols_proyectos = EXPECTED_COLS[TABLE_PROYECTOS]
          df_proyectos_editable = df_proyectos_editable.reindex(columns=expected_cols_proyectos)
          if 'ID_Obra' in df_proyectos_editable.columns:
-              df_proyectos_editable['ID_Obra'] = df_proyectos_editable['ID_Obra'].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+              df_proyectos_editable['ID_Obra'] = blank_to_na(df_proyectos_editable['ID_Obra'])
          df_proyectos_edited = st.data_editor(
               df_proyectos_editable, key="data_editor_proyectos", num_rows="dynamic",
               column_config={
@@ -1483,46 +1700,32 @@ def page_gestion_obras():
          )
          df_proyectos_edited_processed = df_proyectos_edited.copy()
          df_proyectos_edited_processed = df_proyectos_edited_processed.reindex(columns=expected_cols_proyectos)
-         new_row_mask = df_proyectos_edited_processed['ID_Obra'].isna() | (df_proyectos_edited_processed['ID_Obra'].astype(str).str.strip() == '')
+         new_row_mask = df_proyectos_edited_processed['ID_Obra'].isna() | (stripped_text(df_proyectos_edited_processed['ID_Obra']) == '')
          if new_row_mask.any():
-              existing_ids = set(st.session_state.df_proyectos['ID_Obra'].astype(str).tolist())
-              new_ids_batch = []
-              for i in range(new_row_mask.sum()):
-                  base_id = f"OBRA_EDIT_{int(time.time() * 1e6)}_{i}"
-                  unique_id = base_id
-                  counter = 0
-                  while unique_id in existing_ids or unique_id in new_ids_batch:
-                      counter += 1
-                      unique_id = f"{base_id}_{counter}"
-                  new_ids_batch.append(unique_id)
+              new_ids_batch = new_batch_ids("OBRA_EDIT", int(new_row_mask.sum()), id_set(TABLE_PROYECTOS, st.session_state.df_proyectos, 'ID_Obra'))
               df_proyectos_edited_processed.loc[new_row_mask, 'ID_Obra'] = new_ids_batch
          for col in ['Nombre_Obra', 'Responsable']:
             if col in df_proyectos_edited_processed.columns:
-                 df_proyectos_edited_processed[col] = df_proyectos_edited_processed[col].astype(str).str.strip().replace({'': None}).mask(df_proyectos_edited_processed[col].isna(), None)
-         df_proyectos_original_compare = st.session_state.df_proyectos.reindex(columns=expected_cols_proyectos).sort_values(by=expected_cols_proyectos).reset_index(drop=True)
-         df_proyectos_edited_compare = df_proyectos_edited_processed.reindex(columns=expected_cols_proyectos).sort_values(by=expected_cols_proyectos).reset_index(drop=True)
-         if not df_proyectos_edited_compare.equals(df_proyectos_original_compare):
+                 df_proyectos_edited_processed[col] = normalize_text(df_proyectos_edited_processed[col], strip=True)
+         if frame_fingerprint(df_proyectos_edited_processed, expected_cols_proyectos) != stored_fingerprint(TABLE_PROYECTOS, st.session_state.df_proyectos):
               if st.button("Guardar Cambios en Lista de Obras", key="save_proyectos_button"):
-                   df_to_save = df_proyectos_edited_processed.copy()
-                   df_to_save = df_to_save[(df_to_save['Nombre_Obra'].notna()) & (df_to_save['Responsable'].notna())].copy()
+                   df_to_save = df_proyectos_edited_processed[(df_proyectos_edited_processed['Nombre_Obra'].notna()) & (df_proyectos_edited_processed['Responsable'].notna())].copy()
                    if df_to_save.empty and not df_proyectos_edited_processed.empty:
                         st.error("Error: Ninguna fila válida. Complete Nombre Obra y Responsable.")
-                   elif df_to_save['Nombre_Obra'].astype(str).str.strip().str.lower().duplicated().any():
+                   elif has_duplicate_text(df_to_save['Nombre_Obra'], casefold=True):
                         st.error("Error: Nombres de obras duplicados.")
-                   elif df_to_save['ID_Obra'].astype(str).str.strip().duplicated().any():
+                   elif has_duplicate_text(df_to_save['ID_Obra']):
                        st.error("Error: IDs de obra duplicados.")
                    else:
                        if 'ID_Obra' in df_to_save.columns:
-                           df_to_save['ID_Obra'] = df_to_save['ID_Obra'].astype(str).str.strip().replace({'': None}).mask(df_to_save['ID_Obra'].isna(), None)
+                           df_to_save['ID_Obra'] = normalize_text(df_to_save['ID_Obra'], strip=True)
+                       save_table_changes(st.session_state.df_proyectos, df_to_save, DATABASE_FILE, TABLE_PROYECTOS)
                        st.session_state.df_proyectos = df_to_save
-                       save_table(st.session_state.df_proyectos, DATABASE_FILE, TABLE_PROYECTOS)
                        st.success("Cambios en obras guardados.")
                        st.experimental_rerun()
               else:
                   st.info("Hay cambios sin guardar en la lista de obras.")
-    obras_disponibles_list = st.session_state.df_proyectos['ID_Obra'].unique().tolist()
-    obras_disponibles_list = [str(id).strip() for id in obras_disponibles_list if pd.notna(id) and str(id).strip() != '']
-    obras_disponibles_list.sort()
+    obras_disponibles_list, obra_gestion_labels, obra_gestion_label_to_id = obra_options(stored_fingerprint(TABLE_PROYECTOS, st.session_state.df_proyectos), st.session_state.df_proyectos)
     st.markdown("---")
     st.subheader("Gestionar Presupuesto por Obra")
     if not obras_disponibles_list:
@@ -1530,11 +1733,6 @@ def page_gestion_obras():
          if "select_obra_gestion_selectbox_persistent" in st.session_state:
               del st.session_state["select_obra_gestion_selectbox_persistent"]
          return
-    obra_options_gestion_filtered_df = st.session_state.df_proyectos[st.session_state.df_proyectos['ID_Obra'].astype(str).isin(obras_disponibles_list)].copy()
-    obra_options_gestion_list = [(f"{o['Nombre_Obra']} (ID: {o['ID_Obra']})", o['ID_Obra']) for index, o in obra_options_gestion_filtered_df.iterrows() if pd.notna(o['ID_Obra'])]
-    obra_options_gestion_list.sort(key=lambda x: x[0])
-    obra_gestion_labels = [item[0] for item in obra_options_gestion_list]
-    obra_gestion_label_to_id = dict(obra_options_gestion_list)
     if not obra_gestion_labels:
          st.info("No hay obras disponibles para gestionar presupuesto.")
          if "select_obra_gestion_selectbox_persistent" in st.session_state: del st.session_state["select_obra_gestion_selectbox_persistent"]
@@ -1549,36 +1747,27 @@ def page_gestion_obras():
         "Seleccione una Obra:", options=obra_gestion_labels, index=default_obra_index, key="select_obra_gestion_selectbox_persistent"
     )
     obra_seleccionada_id = obra_gestion_label_to_id.get(selected_obra_label_gestion)
-    if obra_seleccionada_id is None or str(obra_seleccionada_id) not in obras_disponibles_list:
+    obra_id_s = str(obra_seleccionada_id).strip()
+    if obra_seleccionada_id is None or obra_id_s not in obras_disponibles_list:
          st.warning(f"La obra '{selected_obra_label_gestion}' ya no es válida.")
          if "select_obra_gestion_selectbox_persistent" in st.session_state: del st.session_state["select_obra_gestion_selectbox_persistent"]
          st.experimental_rerun()
          return
-    obra_name_row = st.session_state.df_proyectos[st.session_state.df_proyectos['ID_Obra'].astype(str) == str(obra_seleccionada_id)].iloc[0] if not st.session_state.df_proyectos[st.session_state.df_proyectos['ID_Obra'].astype(str) == str(obra_seleccionada_id)].empty else None
-    obra_nombre = obra_name_row['Nombre_Obra'] if obra_name_row is not None and 'Nombre_Obra' in obra_name_row and pd.notna(obra_name_row['Nombre_Obra']) else f"Obra ID: {obra_seleccionada_id}"
+    obra_name_rows = rows_matching(TABLE_PROYECTOS, st.session_state.df_proyectos, 'ID_Obra', obra_id_s)
+    obra_name_row = obra_name_rows.iloc[0] if not obra_name_rows.empty else None
+    obra_nombre = obra_name_row['Nombre_Obra'] if obra_name_row is not None and 'Nombre_Obra' in obra_name_row and pd.notna(obra_name_row['Nombre_Obra']) else f"Obra ID: {obra_id_s}"
     st.markdown(f"#### Presupuesto de Materiales para '{obra_nombre}'")
-    df_presupuesto_materiales_temp = st.session_state.df_presupuesto_materiales.copy()
-    if 'ID_Obra' in df_presupuesto_materiales_temp.columns:
-         df_presupuesto_materiales_temp['ID_Obra_clean'] = df_presupuesto_materiales_temp['ID_Obra'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_presupuesto_materiales_temp['ID_Obra'].isna(), None)
-    else:
-         df_presupuesto_materiales_temp['ID_Obra_clean'] = None
-    df_presupuesto_obra = df_presupuesto_materiales_temp[
-        df_presupuesto_materiales_temp['ID_Obra_clean'] == str(obra_seleccionada_id)
-    ].copy()
-    df_presupuesto_obra = df_presupuesto_obra.drop(columns=['ID_Obra_clean'], errors='ignore')
+    presupuesto_source = st.session_state.df_presupuesto_materiales
+    df_presupuesto_obra = rows_matching(TABLE_PRESUPUESTO_MATERIALES, presupuesto_source, 'ID_Obra', obra_id_s)
     st.info("Edite la tabla siguiente para añadir, modificar o eliminar items del presupuesto.")
-    df_presupuesto_obra_display = df_presupuesto_obra.copy()
-    for col in ['Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado']:
-        if col not in df_presupuesto_obra_display.columns: df_presupuesto_obra_display[col] = 0.0
-        df_presupuesto_obra_display[col] = pd.to_numeric(df_presupuesto_obra_display[col], errors='coerce').fillna(0.0)
-    df_presupuesto_obra_display = calcular_costo_presupuestado(df_presupuesto_obra_display)
-    expected_cols_presupuesto = list(TABLE_COLUMNS[TABLE_PRESUPUESTO_MATERIALES].keys())
-    df_presupuesto_obra_display = df_presupuesto_obra_display.reindex(columns=expected_cols_presupuesto)
+    df_presupuesto_obra_costed = calcular_costo_presupuestado(df_presupuesto_obra)
+    expected_cols_presupuesto = EXPECTED_COLS[TABLE_PRESUPUESTO_MATERIALES]
+    df_presupuesto_obra_display = df_presupuesto_obra_costed.reindex(columns=expected_cols_presupuesto)
     for col in ['ID_Obra', 'Material']:
         if col in df_presupuesto_obra_display.columns:
-             df_presupuesto_obra_display[col] = df_presupuesto_obra_display[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+             df_presupuesto_obra_display[col] = blank_to_na(df_presupuesto_obra_display[col])
     df_presupuesto_obra_edited = st.data_editor(
-        df_presupuesto_obra_display, key=f"data_editor_presupuesto_{obra_seleccionada_id}", num_rows="dynamic",
+        df_presupuesto_obra_display, key=f"data_editor_presupuesto_{obra_id_s}", num_rows="dynamic",
         column_config={
             "ID_Obra": st.column_config.TextColumn("ID Obra", disabled=True),
             "Material": st.column_config.TextColumn("Material", required=True),
@@ -1589,130 +1778,57 @@ def page_gestion_obras():
     )
     df_presupuesto_obra_edited_processed = df_presupuesto_obra_edited.copy()
     df_presupuesto_obra_edited_processed = df_presupuesto_obra_edited_processed.reindex(columns=expected_cols_presupuesto)
-    df_presupuesto_obra_edited_processed['ID_Obra'] = str(obra_seleccionada_id)
+    df_presupuesto_obra_edited_processed['ID_Obra'] = obra_id_s
     if 'Material' in df_presupuesto_obra_edited_processed.columns:
-        df_presupuesto_obra_edited_processed['Material'] = df_presupuesto_obra_edited_processed['Material'].astype(str).str.strip().replace({'': None}).mask(df_presupuesto_obra_edited_processed['Material'].isna(), None)
-    for col in ['Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado']:
-         if col not in df_presupuesto_obra_edited_processed.columns: df_presupuesto_obra_edited_processed[col] = 0.0
-         df_presupuesto_obra_edited_processed[col] = pd.to_numeric(df_presupuesto_obra_edited_processed[col], errors='coerce').fillna(0.0)
+        df_presupuesto_obra_edited_processed['Material'] = normalize_text(df_presupuesto_obra_edited_processed['Material'], strip=True)
     df_presupuesto_obra_edited_processed = calcular_costo_presupuestado(df_presupuesto_obra_edited_processed)
-    df_presupuesto_obra_original_filtered = st.session_state.df_presupuesto_materiales.copy()
-    if 'ID_Obra' in df_presupuesto_obra_original_filtered.columns:
-         df_presupuesto_obra_original_filtered['ID_Obra_clean'] = df_presupuesto_obra_original_filtered['ID_Obra'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_presupuesto_obra_original_filtered['ID_Obra'].isna(), None)
-    else:
-         df_presupuesto_obra_original_filtered['ID_Obra_clean'] = None
-    df_presupuesto_obra_original_filtered = df_presupuesto_obra_original_filtered[
-        df_presupuesto_obra_original_filtered['ID_Obra_clean'] == str(obra_seleccionada_id)
-    ].copy()
-    df_presupuesto_obra_original_filtered = df_presupuesto_obra_original_filtered.drop(columns=['ID_Obra_clean'], errors='ignore')
-    df_presupuesto_obra_original_filtered = df_presupuesto_obra_original_filtered.reindex(columns=expected_cols_presupuesto)
-    for col in ['Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado']:
-         if col not in df_presupuesto_obra_original_filtered.columns: df_presupuesto_obra_original_filtered[col] = 0.0
-         df_presupuesto_obra_original_filtered[col] = pd.to_numeric(df_presupuesto_obra_original_filtered[col], errors='coerce').fillna(0.0)
-    df_presupuesto_obra_original_filtered = calcular_costo_presupuestado(df_presupuesto_obra_original_filtered)
-    df_presupuesto_obra_original_compare = df_presupuesto_obra_original_filtered.sort_values(by=expected_cols_presupuesto).reset_index(drop=True)
-    df_presupuesto_obra_edited_compare = df_presupuesto_obra_edited_processed.sort_values(by=expected_cols_presupuesto).reset_index(drop=True)
-    if not df_presupuesto_obra_edited_compare.equals(df_presupuesto_obra_original_compare):
-         if st.button(f"Guardar Cambios en Presupuesto de '{obra_nombre}'", key=f"save_presupuesto_{obra_seleccionada_id}_button"):
-             df_to_save_obra = df_presupuesto_obra_edited_processed.copy()
-             df_to_save_obra = df_to_save_obra[(df_to_save_obra['Material'].notna()) &
-                                               (df_to_save_obra['Cantidad_Presupuestada'].notna()) &
-                                               (df_to_save_obra['Precio_Unitario_Presupuestado'].notna())].copy()
+    if len(df_presupuesto_obra_edited_processed) != len(df_presupuesto_obra_display) or frame_fingerprint(df_presupuesto_obra_edited_processed, expected_cols_presupuesto) != derived_fingerprint(f"fp_presupuesto_obra_{obra_id_s}", presupuesto_source, df_presupuesto_obra_display, expected_cols_presupuesto):
+         if st.button(f"Guardar Cambios en Presupuesto de '{obra_nombre}'", key=f"save_presupuesto_{obra_id_s}_button"):
+             df_to_save_obra = df_presupuesto_obra_edited_processed[(df_presupuesto_obra_edited_processed['Material'].notna()) &
+                                                                    (df_presupuesto_obra_edited_processed['Cantidad_Presupuestada'].notna()) &
+                                                                    (df_presupuesto_obra_edited_processed['Precio_Unitario_Presupuestado'].notna())].copy()
              if df_to_save_obra.empty and not df_presupuesto_obra_edited_processed.empty:
                   st.error("Error: Ninguna fila válida. Complete campos obligatorios.")
-             elif 'Material' in df_to_save_obra.columns and df_to_save_obra['Material'].astype(str).str.strip().str.lower().duplicated().any():
+             elif 'Material' in df_to_save_obra.columns and has_duplicate_text(df_to_save_obra['Material'], casefold=True):
                   st.error("Error: Materiales duplicados para esta obra.")
              else:
-                 df_rest_presupuesto = st.session_state.df_presupuesto_materiales.copy()
-                 if 'ID_Obra' in df_rest_presupuesto.columns:
-                      df_rest_presupuesto['ID_Obra_clean'] = df_rest_presupuesto['ID_Obra'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_rest_presupuesto['ID_Obra'].isna(), None)
-                 else:
-                      df_rest_presupuesto['ID_Obra_clean'] = 'ID Desconocida'
-                 df_rest_presupuesto = df_rest_presupuesto[
-                     df_rest_presupuesto['ID_Obra_clean'] != str(obra_seleccionada_id)
-                 ].copy()
-                 df_rest_presupuesto = df_rest_presupuesto.drop(columns=['ID_Obra_clean'], errors='ignore')
+                 df_rest_presupuesto = st.session_state.df_presupuesto_materiales[~text_equals(TABLE_PRESUPUESTO_MATERIALES, st.session_state.df_presupuesto_materiales, 'ID_Obra', obra_id_s)]
                  df_rest_presupuesto = df_rest_presupuesto.reindex(columns=expected_cols_presupuesto)
-                 st.session_state.df_presupuesto_materiales = pd.concat([df_rest_presupuesto, df_to_save_obra.reindex(columns=expected_cols_presupuesto)], ignore_index=True)
-                 save_table(st.session_state.df_presupuesto_materiales, DATABASE_FILE, TABLE_PRESUPUESTO_MATERIALES)
+                 df_presupuesto_to_save = pd.concat([df_rest_presupuesto, df_to_save_obra.reindex(columns=expected_cols_presupuesto)], ignore_index=True)
+                 save_table_changes(st.session_state.df_presupuesto_materiales, df_presupuesto_to_save, DATABASE_FILE, TABLE_PRESUPUESTO_MATERIALES)
+                 st.session_state.df_presupuesto_materiales = df_presupuesto_to_save
                  st.success(f"Presupuesto de '{obra_nombre}' guardado.")
                  st.experimental_rerun()
          else:
              st.info(f"Hay cambios sin guardar en el presupuesto de '{obra_nombre}'.")
     st.markdown(f"#### Reporte de Presupuesto para '{obra_nombre}'")
-    df_presupuesto_obra_current = st.session_state.df_presupuesto_materiales.copy()
-    if 'ID_Obra' in df_presupuesto_obra_current.columns:
-         df_presupuesto_obra_current['ID_Obra_clean'] = df_presupuesto_obra_current['ID_Obra'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_presupuesto_obra_current['ID_Obra'].isna(), None)
+    if st.session_state.df_presupuesto_materiales is presupuesto_source:
+        df_presupuesto_obra_current, df_presupuesto_obra_with_cost = df_presupuesto_obra, df_presupuesto_obra_costed
     else:
-         df_presupuesto_obra_current['ID_Obra_clean'] = None
-    df_presupuesto_obra_current = df_presupuesto_obra_current[
-         df_presupuesto_obra_current['ID_Obra_clean'] == str(obra_seleccionada_id)
-    ].copy()
-    df_presupuesto_obra_current = df_presupuesto_obra_current.drop(columns=['ID_Obra_clean'], errors='ignore')
+        df_presupuesto_obra_current = rows_matching(TABLE_PRESUPUESTO_MATERIALES, st.session_state.df_presupuesto_materiales, 'ID_Obra', obra_id_s)
+        df_presupuesto_obra_with_cost = calcular_costo_presupuestado(df_presupuesto_obra_current)
     if df_presupuesto_obra_current.empty:
         st.info("No hay presupuesto de materiales registrado para esta obra.")
     else:
         st.subheader("Detalle del Presupuesto")
-        for col in ['Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado']:
-             if col not in df_presupuesto_obra_current.columns: df_presupuesto_obra_current[col] = 0.0
-             df_presupuesto_obra_current[col] = pd.to_numeric(df_presupuesto_obra_current[col], errors='coerce').fillna(0.0)
-        df_presupuesto_obra_with_cost = calcular_costo_presupuestado(df_presupuesto_obra_current)
         report_cols_presupuesto = ['Material', 'Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado', 'Costo_Presupuestado']
         report_cols_presupuesto_present = [col for col in report_cols_presupuesto if col in df_presupuesto_obra_with_cost.columns]
         if report_cols_presupuesto_present:
              st.dataframe(df_presupuesto_obra_with_cost[report_cols_presupuesto_present].round(2))
         else:
              st.warning("No se pudieron mostrar detalles del presupuesto.")
-        cantidad_presupuestada_sum = pd.to_numeric(df_presupuesto_obra_with_cost.get('Cantidad_Presupuestada', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
-        costo_presupuestado_sum = pd.to_numeric(df_presupuesto_obra_with_cost.get('Costo_Presupuestado', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
+        cantidad_presupuestada_sum, costo_presupuestado_sum = numeric_values(df_presupuesto_obra_with_cost, ['Cantidad_Presupuestada', 'Costo_Presupuestado'], fill_value=0.0).sum(axis=0)
         st.subheader("Resumen del Presupuesto")
         st.write(f"**Cantidad Total Presupuestada:** {cantidad_presupuestada_sum:,.2f}")
         st.write(f"**Costo Total Presupuestado:** ${costo_presupuestado_sum:,.2f}")
     st.markdown(f"#### Variación Materiales para '{obra_nombre}' (Presupuesto vs Asignado)")
-    df_asignacion_materiales_temp = st.session_state.df_asignacion_materiales.copy()
-    if 'ID_Obra' in df_asignacion_materiales_temp.columns:
-         df_asignacion_materiales_temp['ID_Obra_clean'] = df_asignacion_materiales_temp['ID_Obra'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_asignacion_materiales_temp['ID_Obra'].isna(), None)
-    else:
-         df_asignacion_materiales_temp['ID_Obra_clean'] = None
-    df_asignacion_obra_current = df_asignacion_materiales_temp[
-         df_asignacion_materiales_temp['ID_Obra_clean'] == str(obra_seleccionada_id)
-    ].copy()
-    df_asignacion_obra_current = df_asignacion_obra_current.drop(columns=['ID_Obra_clean'], errors='ignore')
-    for col in ['Cantidad_Asignada', 'Precio_Unitario_Asignado']:
-         if col not in df_asignacion_obra_current.columns: df_asignacion_obra_current[col] = 0.0
-         df_asignacion_obra_current[col] = pd.to_numeric(df_asignacion_obra_current[col], errors='coerce').fillna(0.0)
-    df_asignacion_obra_current = calcular_costo_asignado(df_asignacion_obra_current)
+    df_asignacion_obra_current = rows_matching(TABLE_ASIGNACION_MATERIALES, st.session_state.df_asignacion_materiales, 'ID_Obra', obra_id_s)
     if df_presupuesto_obra_current.empty and df_asignacion_obra_current.empty:
         st.info("No hay presupuesto ni materiales asignados para esta obra.")
     else:
-       presupuesto_agg = pd.DataFrame(columns=['Material', 'Cantidad_Presupuestada', 'Costo_Presupuestado'])
-       if not df_presupuesto_obra_current.empty and 'Material' in df_presupuesto_obra_current.columns and 'Cantidad_Presupuestada' in df_presupuesto_obra_current.columns and 'Costo_Presupuestado' in df_presupuesto_obra_current.columns:
-           df_presupuesto_obra_current_clean = df_presupuesto_obra_current.copy()
-           df_presupuesto_obra_current_clean['Material'] = df_presupuesto_obra_current_clean['Material'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None})
-           df_presupuesto_obra_current_clean['Cantidad_Presupuestada'] = pd.to_numeric(df_presupuesto_obra_current_clean['Cantidad_Presupuestada'], errors='coerce').fillna(0.0)
-           df_presupuesto_obra_current_clean['Costo_Presupuestado'] = pd.to_numeric(df_presupuesto_obra_current_clean['Costo_Presupuestado'], errors='coerce').fillna(0.0)
-           presupuesto_agg = df_presupuesto_obra_current_clean.dropna(subset=['Material']).groupby('Material', dropna=True).agg(
-               Cantidad_Presupuestada=('Cantidad_Presupuestada', 'sum'), Costo_Presupuestado=('Costo_Presupuestado', 'sum')
-           ).reset_index()
-       asignacion_agg = pd.DataFrame(columns=['Material', 'Cantidad_Asignada', 'Costo_Asignado'])
-       if not df_asignacion_obra_current.empty and 'Material' in df_asignacion_obra_current.columns and 'Cantidad_Asignada' in df_asignacion_obra_current.columns and 'Costo_Asignado' in df_asignacion_obra_current.columns:
-           df_asignacion_obra_current_clean = df_asignacion_obra_current.copy()
-           df_asignacion_obra_current_clean['Material'] = df_asignacion_obra_current_clean['Material'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None})
-           df_asignacion_obra_current_clean['Cantidad_Asignada'] = pd.to_numeric(df_asignacion_obra_current_clean['Cantidad_Asignada'], errors='coerce').fillna(0.0)
-           df_asignacion_obra_current_clean['Costo_Asignado'] = pd.to_numeric(df_asignacion_obra_current_clean['Costo_Asignado'], errors='coerce').fillna(0.0)
-           asignacion_agg = df_asignacion_obra_current_clean.dropna(subset=['Material']).groupby('Material', dropna=True).agg(
-               Cantidad_Asignada=('Cantidad_Asignada', 'sum'), Costo_Asignado=('Costo_Asignado', 'sum')
-           ).reset_index()
-       presupuesto_agg['Material'] = presupuesto_agg['Material'].astype(str)
-       asignacion_agg['Material'] = asignacion_agg['Material'].astype(str)
-       variacion_obra = pd.merge(presupuesto_agg, asignacion_agg, on='Material', how='outer').fillna(0)
-       cost_cols = ['Costo_Presupuestado', 'Costo_Asignado']
-       qty_cols = ['Cantidad_Presupuestada', 'Cantidad_Asignada']
-       for col in cost_cols + qty_cols:
-           if col not in variacion_obra.columns: variacion_obra[col] = 0.0
-           else: variacion_obra[col] = pd.to_numeric(variacion_obra[col], errors='coerce').fillna(0.0)
-       variacion_obra['Cantidad_Variacion'] = variacion_obra['Cantidad_Asignada'] - variacion_obra['Cantidad_Presupuestada']
-       variacion_obra['Costo_Variacion'] = variacion_obra['Costo_Asignado'] - variacion_obra['Costo_Presupuestado']
+       variacion_obra, total_costo_presupuestado_obra, total_costo_asignado_obra = obra_variacion(obra_id_s, stored_fingerprint(TABLE_PRESUPUESTO_MATERIALES, st.session_state.df_presupuesto_materiales),
+                                       stored_fingerprint(TABLE_ASIGNACION_MATERIALES, st.session_state.df_asignacion_materiales),
+                                       df_presupuesto_obra_current, df_asignacion_obra_current)
        st.subheader("Reporte de Variación por Material")
        if variacion_obra.empty:
             st.info("No hay datos de variación de materiales para esta obra.")
@@ -1723,8 +1839,6 @@ def page_gestion_obras():
            display_cols_present = [col for col in report_cols_variacion if col in variacion_obra.columns]
            if display_cols_present: st.dataframe(variacion_obra[display_cols_present].round(2))
            else: st.warning("No se pudo mostrar el reporte de variación.")
-           total_costo_presupuestado_obra = pd.to_numeric(variacion_obra.get('Costo_Presupuestado', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
-           total_costo_asignado_obra = pd.to_numeric(variacion_obra.get('Costo_Asignado', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
            total_variacion_costo_obra = total_costo_asignado_obra - total_costo_presupuestado_obra
            st.subheader("Resumen de Variación de Costo Total")
            st.write(f"Costo Presupuestado Total: ${total_costo_presupuestado_obra:,.2f}")
@@ -1733,20 +1847,13 @@ def page_gestion_obras():
            variation_threshold_obra = 0.01
            if abs(total_variacion_costo_obra) >= variation_threshold_obra or abs(total_costo_presupuestado_obra) >= variation_threshold_obra or abs(total_costo_asignado_obra) >= variation_threshold_obra:
                 st.subheader("Gráfico de Variación de Costo por Obra")
-                labels_obra_cascada = [f'Presupuesto<br>{obra_nombre}']
-                values_obra_cascada = [total_costo_presupuestado_obra]
-                measures_obra_cascada = ['absolute']
-                texts_obra_cascada = [f"${total_costo_presupuestado_obra:,.2f}"]
-                if abs(total_variacion_costo_obra) >= variation_threshold_obra:
-                     labels_obra_cascada.append('Variación Total')
-                     values_obra_cascada.append(total_variacion_costo_obra)
-                     measures_obra_cascada.append('relative')
-                     texts_obra_cascada.append(f"${total_variacion_costo_obra:,.2f}")
-                labels_obra_cascada.append(f'Asignado<br>{obra_nombre}')
-                values_obra_cascada.append(total_costo_asignado_obra)
-                measures_obra_cascada.append('total')
-                texts_obra_cascada.append(f"${total_costo_asignado_obra:,.2f}") # Corrected texts here
-                if (len(labels_obra_cascada) > 2) or (len(labels_obra_cascada) == 2 and abs(values_obra_cascada[0] - values_obra_cascada[1]) >= variation_threshold_obra) or (len(labels_obra_cascada) == 2 and abs(values_obra_cascada[0]) >= variation_threshold_obra):
+                show_variacion_obra = abs(total_variacion_costo_obra) >= variation_threshold_obra
+                variacion_step_obra = (('Variación Total', total_variacion_costo_obra, 'relative', f"${total_variacion_costo_obra:,.2f}"),) if show_variacion_obra else ()
+                labels_obra_cascada, values_obra_cascada, measures_obra_cascada, texts_obra_cascada = zip(
+                    (f'Presupuesto<br>{obra_nombre}', total_costo_presupuestado_obra, 'absolute', f"${total_costo_presupuestado_obra:,.2f}"),
+                    *variacion_step_obra,
+                    (f'Asignado<br>{obra_nombre}', total_costo_asignado_obra, 'total', f"${total_costo_asignado_obra:,.2f}"))
+                if show_variacion_obra or abs(total_costo_presupuestado_obra - total_costo_asignado_obra) >= variation_threshold_obra or abs(total_costo_presupuestado_obra) >= variation_threshold_obra:
                      fig_obra_variacion = go.Figure(go.Waterfall(
                         name = f"Variación Obra: {obra_nombre}", orientation = "v", measure = measures_obra_cascada,
                         x = labels_obra_cascada, textposition = "outside", text = texts_obra_cascada, y = values_obra_cascada,
@@ -1776,19 +1883,11 @@ def page_reporte_presupuesto_total_obras():
     if st.session_state.df_presupuesto_materiales.empty:
         st.info("No hay presupuesto de materiales registrado para ninguna obra.")
         return
-    df_presupuesto = st.session_state.df_presupuesto_materiales.copy()
-    for col in ['Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado']:
-        if col not in df_presupuesto.columns: df_presupuesto[col] = 0.0
-        df_presupuesto[col] = pd.to_numeric(df_presupuesto[col], errors='coerce').fillna(0.0)
-    df_presupuesto = calcular_costo_presupuestado(df_presupuesto)
+    df_presupuesto = calcular_costo_presupuestado(st.session_state.df_presupuesto_materiales)
     if 'ID_Obra' in df_presupuesto.columns:
-        df_presupuesto['ID_Obra_clean'] = df_presupuesto['ID_Obra'].astype(str).str.strip().replace({'': 'ID Desconocida', 'nan': 'ID Desconocida', 'None': 'ID Desconocida'})
+        df_presupuesto['ID_Obra_clean'] = normalize_text(df_presupuesto['ID_Obra'], strip=True).fillna('ID Desconocida')
     else:
          df_presupuesto['ID_Obra_clean'] = 'ID Desconocida'
-    if 'Cantidad_Presupuestada' not in df_presupuesto.columns: df_presupuesto['Cantidad_Presupuestada'] = 0.0
-    if 'Costo_Presupuestado' not in df_presupuesto.columns: df_presupuesto['Costo_Presupuestado'] = 0.0
-    df_presupuesto['Cantidad_Presupuestada'] = pd.to_numeric(df_presupuesto['Cantidad_Presupuestada'], errors='coerce').fillna(0.0)
-    df_presupuesto['Costo_Presupuestado'] = pd.to_numeric(df_presupuesto['Costo_Presupuestado'], errors='coerce').fillna(0.0)
     if not df_presupuesto.empty:
         reporte_por_obra = df_presupuesto.groupby('ID_Obra_clean', dropna=False).agg(
             Cantidad_Total_Presupuestada=('Cantidad_Presupuestada', 'sum'),
@@ -1796,16 +1895,7 @@ def page_reporte_presupuesto_total_obras():
         ).reset_index()
     else:
          reporte_por_obra = pd.DataFrame(columns=['ID_Obra_clean', 'Cantidad_Total_Presupuestada', 'Costo_Total_Presupuestado'])
-    df_proyectos_temp = st.session_state.df_proyectos.copy()
-    if 'ID_Obra' in df_proyectos_temp.columns:
-         df_proyectos_temp['ID_Obra_clean_for_merge'] = df_proyectos_temp['ID_Obra'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_proyectos_temp['ID_Obra'].isna(), None)
-         reporte_por_obra = reporte_por_obra.merge(df_proyectos_temp[['ID_Obra_clean_for_merge', 'Nombre_Obra']], left_on='ID_Obra_clean', right_on='ID_Obra_clean_for_merge', how='left')
-         reporte_por_obra['Nombre_Obra'] = reporte_por_obra.apply(
-             lambda row: row['Nombre_Obra'] if pd.notna(row['Nombre_Obra']) else f"Obra ID: {row['ID_Obra_clean']}" if row['ID_Obra_clean'] != 'ID Desconocida' else 'ID Desconocida', axis=1
-         )
-         reporte_por_obra = reporte_por_obra.drop(columns=['ID_Obra_clean_for_merge'], errors='ignore')
-    else:
-         reporte_por_obra['Nombre_Obra'] = reporte_por_obra['ID_Obra_clean'].apply(lambda x: f"Obra ID: {x}" if x != 'ID Desconocida' else 'ID Desconocida')
+    reporte_por_obra['Nombre_Obra'] = obra_labels(reporte_por_obra['ID_Obra_clean'], st.session_state.df_proyectos)
     reporte_por_obra = reporte_por_obra.rename(columns={'ID_Obra_clean': 'ID_Obra'})
     sort_cols = []
     if 'Nombre_Obra' in reporte_por_obra.columns: sort_cols.append('Nombre_Obra')
@@ -1823,8 +1913,8 @@ def page_reporte_presupuesto_total_obras():
          display_cols_present = [col for col in display_cols if col in reporte_por_obra.columns]
          if display_cols_present: st.dataframe(reporte_por_obra[display_cols_present].round(2))
          else: st.warning("No se pudo mostrar el reporte.")
-         cantidad_gran_total = pd.to_numeric(reporte_por_obra.get('Cantidad_Total_Presupuestada', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
-         costo_gran_total = pd.to_numeric(reporte_por_obra.get('Costo_Total_Presupuestado', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
+         cantidad_gran_total = float(reporte_por_obra['Cantidad_Total_Presupuestada'].sum())
+         costo_gran_total = float(reporte_por_obra['Costo_Total_Presupuestado'].sum())
          st.subheader("Gran Total Presupuestado (Todas las Obras)")
          st.write(f"**Cantidad Gran Total Presupuestada:** {cantidad_gran_total:,.2f}")
          st.write(f"**Costo Gran Total Presupuestado:** ${costo_gran_total:,.2f}")
@@ -1852,40 +1942,15 @@ def page_compras_asignacion():
             elif cantidad_comprada == 0 and precio_unitario_comprado == 0:
                 st.warning("Cantidad y precio no pueden ser ambos cero.")
             else:
-                existing_ids = set(st.session_state.df_compras_materiales['ID_Compra'].astype(str).tolist())
-                base_id = f"COMPRA_{int(time.time() * 1e6)}"
-                id_compra = base_id
-                counter = 0
-                while id_compra in existing_ids:
-                    counter += 1
-                    id_compra = f"{base_id}_{counter}"
+                id_compra = unique_id(f"COMPRA_{int(time.time() * 1e6)}", id_set(TABLE_COMPRAS_MATERIALES, st.session_state.df_compras_materiales, 'ID_Compra'))
                 new_compra_data = {
-                    'ID_Compra': id_compra, 'Fecha_Compra': fecha_compra, 'Material': material_compra,
+                    'ID_Compra': id_compra, 'Fecha_Compra': pd.Timestamp(fecha_compra), 'Material': material_compra,
                     'Cantidad_Comprada': float(cantidad_comprada if cantidad_comprada is not None else 0.0), # Handle None
                     'Precio_Unitario_Comprado': float(precio_unitario_comprado if precio_unitario_comprado is not None else 0.0) # Handle None
                 }
-                new_compra_df = pd.DataFrame([new_compra_data])
-                new_compra_df = calcular_costo_compra(new_compra_df)
-                expected_cols_compras = list(TABLE_COLUMNS[TABLE_COMPRAS_MATERIALES].keys())
-                new_compra_df = new_compra_df.reindex(columns=expected_cols_compras)
-                date_col_name_compra = DATETIME_COLUMNS[TABLE_COMPRAS_MATERIALES]
-                if date_col_name_compra in new_compra_df.columns:
-                     new_compra_df[date_col_name_compra] = pd.to_datetime(new_compra_df[date_col_name_compra], errors='coerce')
-                for col, dtype in TABLE_COLUMNS[TABLE_COMPRAS_MATERIALES].items():
-                     if col in new_compra_df.columns:
-                           try:
-                                if dtype == 'object':
-                                     new_compra_df[col] = new_compra_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                     new_compra_df[col] = new_compra_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                                elif 'float' in dtype: new_compra_df[col] = pd.to_numeric(new_compra_df[col], errors='coerce').astype(float).fillna(0.0)
-                                elif 'int' in dtype:
-                                     if hasattr(pd, 'Int64Dtype'): new_compra_df[col] = pd.to_numeric(new_compra_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                     else: new_compra_df[col] = pd.to_numeric(new_compra_df[col], errors='coerce').astype(float).fillna(0.0)
-                           except Exception as dtype_e:
-                                st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                df_current_compras_reindexed = st.session_state.df_compras_materiales.reindex(columns=expected_cols_compras)
-                st.session_state.df_compras_materiales = pd.concat([df_current_compras_reindexed, new_compra_df], ignore_index=True)
-                save_table(st.session_state.df_compras_materiales, DATABASE_FILE, TABLE_COMPRAS_MATERIALES)
+                new_compra_data['Costo_Compra'] = new_compra_data['Cantidad_Comprada'] * new_compra_data['Precio_Unitario_Comprado']
+                st.session_state.df_compras_materiales = append_row(st.session_state.df_compras_materiales, new_compra_data, EXPECTED_COLS[TABLE_COMPRAS_MATERIALES])
+                insert_row(DATABASE_FILE, TABLE_COMPRAS_MATERIALES, new_compra_data)
                 st.success(f"Compra de '{material_compra}' registrada con ID: {id_compra}")
                 st.experimental_rerun()
 
@@ -1894,21 +1959,10 @@ def page_compras_asignacion():
         st.info("No hay compras registradas aún.")
     else:
          st.info("Edite la tabla siguiente para modificar o eliminar compras.")
-         df_compras_editable = st.session_state.df_compras_materiales.copy()
          date_col_name_compra = DATETIME_COLUMNS[TABLE_COMPRAS_MATERIALES]
-         if date_col_name_compra in df_compras_editable.columns:
-              df_compras_editable[date_col_name_compra] = pd.to_datetime(df_compras_editable[date_col_name_compra], errors='coerce')
-         else:
-              df_compras_editable[date_col_name_compra] = pd.Series(dtype='datetime64[ns]', index=df_compras_editable.index)
-         for col in ['Cantidad_Comprada', 'Precio_Unitario_Comprado']:
-             if col not in df_compras_editable.columns: df_compras_editable[col] = 0.0
-             df_compras_editable[col] = pd.to_numeric(df_compras_editable[col], errors='coerce').fillna(0.0)
-         df_compras_editable = calcular_costo_compra(df_compras_editable)
-         expected_cols_compras = list(TABLE_COLUMNS[TABLE_COMPRAS_MATERIALES].keys())
-         df_compras_editable = df_compras_editable.reindex(columns=expected_cols_compras)
-         for col in ['ID_Compra', 'Material']:
-             if col in df_compras_editable.columns:
-                 df_compras_editable[col] = df_compras_editable[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+         expected_cols_compras = EXPECTED_COLS[TABLE_COMPRAS_MATERIALES]
+         df_compras_editable = cost_editor_frame(TABLE_COMPRAS_MATERIALES, stored_fingerprint(TABLE_COMPRAS_MATERIALES, st.session_state.df_compras_materiales),
+                                                 st.session_state.df_compras_materiales, ('ID_Compra', 'Material'))
          df_compras_edited = st.data_editor(
              df_compras_editable, key="data_editor_compras", num_rows="dynamic",
              column_config={
@@ -1924,46 +1978,31 @@ def page_compras_asignacion():
          df_compras_edited_processed = df_compras_edited_processed.reindex(columns=expected_cols_compras)
          for col in ['ID_Compra', 'Material']:
             if col in df_compras_edited_processed.columns:
-                 df_compras_edited_processed[col] = df_compras_edited_processed[col].astype(str).str.strip().replace({'': None}).mask(df_compras_edited_processed[col].isna(), None)
-         for col in ['Cantidad_Comprada', 'Precio_Unitario_Comprado']:
-             if col not in df_compras_edited_processed.columns: df_compras_edited_processed[col] = 0.0
-             df_compras_edited_processed[col] = pd.to_numeric(df_compras_edited_processed[col], errors='coerce').fillna(0.0)
+                 df_compras_edited_processed[col] = normalize_text(df_compras_edited_processed[col], strip=True)
          df_compras_edited_processed = calcular_costo_compra(df_compras_edited_processed)
          new_row_mask = df_compras_edited_processed['ID_Compra'].isna()
          if new_row_mask.any():
-              existing_ids = set(st.session_state.df_compras_materiales['ID_Compra'].astype(str).tolist())
-              new_ids_batch = []
-              for i in range(new_row_mask.sum()):
-                   base_id = f"COMPRA_EDIT_{int(time.time() * 1e6)}_{i}"
-                   unique_id = base_id
-                   counter = 0
-                   while unique_id in existing_ids or unique_id in new_ids_batch:
-                       counter += 1
-                       unique_id = f"{base_id}_{counter}"
-                   new_ids_batch.append(unique_id)
+              new_ids_batch = new_batch_ids("COMPRA_EDIT", int(new_row_mask.sum()), id_set(TABLE_COMPRAS_MATERIALES, st.session_state.df_compras_materiales, 'ID_Compra'))
               df_compras_edited_processed.loc[new_row_mask, 'ID_Compra'] = new_ids_batch
-         df_compras_original_compare = st.session_state.df_compras_materiales.reindex(columns=expected_cols_compras).sort_values(by=expected_cols_compras).reset_index(drop=True)
-         df_compras_edited_compare = df_compras_edited_processed.reindex(columns=expected_cols_compras).sort_values(by=expected_cols_compras).reset_index(drop=True)
-         if not df_compras_edited_compare.equals(df_compras_original_compare):
+         if frame_fingerprint(df_compras_edited_processed, expected_cols_compras) != stored_fingerprint(TABLE_COMPRAS_MATERIALES, st.session_state.df_compras_materiales):
               if st.button("Guardar Cambios en Historial de Compras", key="save_compras_button"):
-                 df_to_save = df_compras_edited_processed.copy()
                  date_col_name_compra = DATETIME_COLUMNS[TABLE_COMPRAS_MATERIALES]
-                 df_to_save = df_to_save[(df_to_save['ID_Compra'].notna()) &
-                                         (df_to_save[date_col_name_compra].notna()) &
-                                         (df_to_save['Material'].notna()) &
-                                         (df_to_save['Cantidad_Comprada'].notna()) &
-                                         (df_to_save['Precio_Unitario_Comprado'].notna())
-                                        ].copy()
+                 df_to_save = df_compras_edited_processed[(df_compras_edited_processed['ID_Compra'].notna()) &
+                                                          (df_compras_edited_processed[date_col_name_compra].notna()) &
+                                                          (df_compras_edited_processed['Material'].notna()) &
+                                                          (df_compras_edited_processed['Cantidad_Comprada'].notna()) &
+                                                          (df_compras_edited_processed['Precio_Unitario_Comprado'].notna())
+                                                         ].copy()
+                 compra_values = np.nan_to_num(numeric_values(df_to_save, ['Cantidad_Comprada', 'Precio_Unitario_Comprado']))
                  if df_to_save.empty and not df_compras_edited_processed.empty:
                       st.error("Error: Ninguna fila válida. Complete campos obligatorios.")
-                 elif ((pd.to_numeric(df_to_save['Cantidad_Comprada'], errors='coerce').fillna(0) == 0) &
-                       (pd.to_numeric(df_to_save['Precio_Unitario_Comprado'], errors='coerce').fillna(0) == 0)).any():
+                 elif not compra_values.any(axis=1).all():
                       st.warning("Advertencia: Algunas compras tienen Cantidad y Precio Unitario ambos cero.")
-                 elif df_to_save['ID_Compra'].astype(str).str.strip().duplicated().any():
+                 elif has_duplicate_text(df_to_save['ID_Compra']):
                      st.error("Error: IDs de compra duplicados.")
                  else:
+                      save_table_changes(st.session_state.df_compras_materiales, df_to_save, DATABASE_FILE, TABLE_COMPRAS_MATERIALES)
                       st.session_state.df_compras_materiales = df_to_save
-                      save_table(st.session_state.df_compras_materiales, DATABASE_FILE, TABLE_COMPRAS_MATERIALES)
                       st.success("Cambios en historial de compras guardados.")
                       st.experimental_rerun()
               else:
@@ -1971,20 +2010,13 @@ def page_compras_asignacion():
 
     st.markdown("---")
     st.subheader("Asignar Materiales a Obra")
-    obras_disponibles_assign_list = st.session_state.df_proyectos['ID_Obra'].unique().tolist()
-    obras_disponibles_assign_list = [str(id).strip() for id in obras_disponibles_assign_list if pd.notna(id) and str(id).strip() != '']
-    obras_disponibles_assign_list.sort()
+    obras_disponibles_assign_list, obra_assign_labels, obra_assign_label_to_id = obra_options(stored_fingerprint(TABLE_PROYECTOS, st.session_state.df_proyectos), st.session_state.df_proyectos)
 
     if not obras_disponibles_assign_list:
         st.warning("No hay obras creadas. No se pueden asignar materiales.")
         if "asig_obra_selectbox_persistent" in st.session_state: del st.session_state["asig_obra_selectbox_persistent"]
         return
 
-    obra_options_assign_filtered_df = st.session_state.df_proyectos[st.session_state.df_proyectos['ID_Obra'].astype(str).isin(obras_disponibles_assign_list)].copy()
-    obra_options_assign_list = [(f"{o['Nombre_Obra']} (ID: {o['ID_Obra']})", o['ID_Obra']) for index, o in obra_options_assign_filtered_df.iterrows() if pd.notna(o['ID_Obra'])]
-    obra_options_assign_list.sort(key=lambda x: x[0])
-    obra_assign_labels = [item[0] for item in obra_options_assign_list]
-    obra_assign_label_to_id = dict(obra_options_assign_list)
     if not obra_assign_labels:
         st.warning("No hay obras disponibles para asignar materiales.")
         if "asig_obra_selectbox_persistent" in st.session_state: del st.session_state["asig_obra_selectbox_persistent"]
@@ -2018,18 +2050,8 @@ def page_compras_asignacion():
              if material_options_select:
                   material_asignado = st.selectbox("Material a Asignar:", material_options_select, key="asig_material_select")
                   if material_asignado and material_asignado != '' and material_asignado != "Seleccionar material...":
-                      last_purchase = st.session_state.df_compras_materiales[
-                           st.session_state.df_compras_materiales['Material'].astype(str).str.strip().str.lower() == material_asignado.lower().strip()
-                       ].copy()
-                      date_col_name_compra = DATETIME_COLUMNS[TABLE_COMPRAS_MATERIALES]
-                      if date_col_name_compra in last_purchase.columns:
-                           last_purchase[date_col_name_compra] = pd.to_datetime(last_purchase[date_col_name_compra], errors='coerce')
-                           last_purchase = last_purchase.sort_values(date_col_name_compra, ascending=False)
-                      if not last_purchase.empty and 'Precio_Unitario_Comprado' in last_purchase.columns:
-                          last_purchase['Precio_Unitario_Comprado'] = pd.to_numeric(last_purchase['Precio_Unitario_Comprado'], errors='coerce')
-                          suggested_price_series = last_purchase['Precio_Unitario_Comprado'].dropna()
-                          suggested_price = suggested_price_series.iloc[0] if not suggested_price_series.empty else 0.0
-                      else: suggested_price = 0.0
+                      latest_prices = last_price_by_material(stored_fingerprint(TABLE_COMPRAS_MATERIALES, st.session_state.df_compras_materiales), st.session_state.df_compras_materiales)
+                      suggested_price = latest_prices.get(material_asignado.lower().strip(), 0.0)
                   else: suggested_price = 0.0
              else:
                   st.info("No hay materiales en compras. Use 'Escribir manualmente'.")
@@ -2087,43 +2109,18 @@ def page_compras_asignacion():
              elif cantidad_asignada == 0 and precio_unitario_asignado == 0:
                   st.warning("Cantidad y precio no pueden ser ambos cero.")
              else:
-                  existing_ids = set(st.session_state.df_asignacion_materiales['ID_Asignacion'].astype(str).tolist())
-                  base_id = f"ASIG_{int(time.time() * 1e6)}"
-                  id_asignacion = base_id
-                  counter = 0
-                  while id_asignacion in existing_ids:
-                      counter += 1
-                      id_asignacion = f"{base_id}_{counter}"
+                  id_asignacion = unique_id(f"ASIG_{int(time.time() * 1e6)}", id_set(TABLE_ASIGNACION_MATERIALES, st.session_state.df_asignacion_materiales, 'ID_Asignacion'))
                   new_asignacion_data = {
-                      'ID_Asignacion': id_asignacion, 'Fecha_Asignacion': fecha_asignacion, 'ID_Obra': obra_destino_id,
+                      'ID_Asignacion': id_asignacion, 'Fecha_Asignacion': pd.Timestamp(fecha_asignacion), 'ID_Obra': str(obra_destino_id),
                       'Material': str(material_asignado).strip(),
                       'Cantidad_Asignada': float(cantidad_asignada if cantidad_asignada is not None else 0.0), # Handle None
                       'Precio_Unitario_Asignado': float(precio_unitario_asignado if precio_unitario_asignado is not None else 0.0) # Handle None
                   }
-                  new_asignacion_df = pd.DataFrame([new_asignacion_data])
-                  new_asignacion_df = calcular_costo_asignado(new_asignacion_df)
-                  expected_cols_asignacion = list(TABLE_COLUMNS[TABLE_ASIGNACION_MATERIALES].keys())
-                  new_asignacion_df = new_asignacion_df.reindex(columns=expected_cols_asignacion)
-                  date_col_name_asignacion = DATETIME_COLUMNS[TABLE_ASIGNACION_MATERIALES]
-                  if date_col_name_asignacion in new_asignacion_df.columns:
-                       new_asignacion_df[date_col_name_asignacion] = pd.to_datetime(new_asignacion_df[date_col_name_asignacion], errors='coerce')
-                  for col, dtype in TABLE_COLUMNS[TABLE_ASIGNACION_MATERIALES].items():
-                      if col in new_asignacion_df.columns:
-                            try:
-                                 if dtype == 'object':
-                                      new_asignacion_df[col] = new_asignacion_df[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object)
-                                      new_asignacion_df[col] = new_asignacion_df[col].replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
-                                 elif 'float' in dtype:
-                                      new_asignacion_df[col] = pd.to_numeric(new_asignacion_df[col], errors='coerce').astype(float).fillna(0.0)
-                                 elif 'int' in dtype:
-                                      if hasattr(pd, 'Int64Dtype'): new_asignacion_df[col] = pd.to_numeric(new_asignacion_df[col], errors='coerce').astype(pd.Int64Dtype()).fillna(pd.NA)
-                                      else: new_asignacion_df[col] = pd.to_numeric(new_asignacion_df[col], errors='coerce').astype(float).fillna(0.0)
-                            except Exception as dtype_e:
-                                st.warning(f"No se pudo convertir la nueva columna '{col}' a dtype '{dtype}': {dtype_e}")
-                  df_current_asignacion_reindexed = st.session_state.df_asignacion_materiales.reindex(columns=expected_cols_asignacion)
-                  st.session_state.df_asignacion_materiales = pd.concat([df_current_asignacion_reindexed, new_asignacion_df], ignore_index=True)
-                  save_table(st.session_state.df_asignacion_materiales, DATABASE_FILE, TABLE_ASIGNACION_MATERIALES)
-                  obra_name_row = st.session_state.df_proyectos[st.session_state.df_proyectos['ID_Obra'].astype(str) == str(obra_destino_id)].iloc[0] if str(obra_destino_id) in st.session_state.df_proyectos['ID_Obra'].astype(str).tolist() else None
+                  new_asignacion_data['Costo_Asignado'] = new_asignacion_data['Cantidad_Asignada'] * new_asignacion_data['Precio_Unitario_Asignado']
+                  st.session_state.df_asignacion_materiales = append_row(st.session_state.df_asignacion_materiales, new_asignacion_data, EXPECTED_COLS[TABLE_ASIGNACION_MATERIALES])
+                  insert_row(DATABASE_FILE, TABLE_ASIGNACION_MATERIALES, new_asignacion_data)
+                  obra_name_rows = rows_matching(TABLE_PROYECTOS, st.session_state.df_proyectos, 'ID_Obra', obra_destino_id)
+                  obra_name_row = obra_name_rows.iloc[0] if not obra_name_rows.empty else None
                   obra_name_for_success = obra_name_row['Nombre_Obra'] if obra_name_row is not None and 'Nombre_Obra' in obra_name_row and pd.notna(obra_name_row['Nombre_Obra']) else f"Obra ID: {obra_destino_id}"
                   st.success(f"Material '{material_asignado}' ({cantidad_asignada:.2f} unidades) asignado a obra '{obra_name_for_success}'.")
                   st.experimental_rerun()
@@ -2137,22 +2134,11 @@ def page_compras_asignacion():
         st.info("No hay materiales asignados aún.")
     else:
         st.info("Edite la tabla siguiente para modificar o eliminar asignaciones.")
-        df_asignaciones_editable = st.session_state.df_asignacion_materiales.copy()
         date_col_name_asignacion = DATETIME_COLUMNS[TABLE_ASIGNACION_MATERIALES]
-        if date_col_name_asignacion in df_asignaciones_editable.columns:
-             df_asignaciones_editable[date_col_name_asignacion] = pd.to_datetime(df_asignaciones_editable[date_col_name_asignacion], errors='coerce')
-        else:
-             df_asignaciones_editable[date_col_name_asignacion] = pd.Series(dtype='datetime64[ns]', index=df_asignaciones_editable.index)
-        for col in ['Cantidad_Asignada', 'Precio_Unitario_Asignado']:
-             if col not in df_asignaciones_editable.columns: df_asignaciones_editable[col] = 0.0
-             df_asignaciones_editable[col] = pd.to_numeric(df_asignaciones_editable[col], errors='coerce').fillna(0.0)
-        df_asignaciones_editable = calcular_costo_asignado(df_asignaciones_editable)
         obra_ids_for_editor = obras_disponibles_assign_list
-        expected_cols_asignacion = list(TABLE_COLUMNS[TABLE_ASIGNACION_MATERIALES].keys())
-        df_asignaciones_editable = df_asignaciones_editable.reindex(columns=expected_cols_asignacion)
-        for col in ['ID_Asignacion', 'ID_Obra', 'Material']:
-             if col in df_asignaciones_editable.columns:
-                  df_asignaciones_editable[col] = df_asignaciones_editable[col].astype(pd.StringDtype() if hasattr(pd, 'StringDtype') else object).replace({np.nan: pd.NA, None: pd.NA, '': pd.NA})
+        expected_cols_asignacion = EXPECTED_COLS[TABLE_ASIGNACION_MATERIALES]
+        df_asignaciones_editable = cost_editor_frame(TABLE_ASIGNACION_MATERIALES, stored_fingerprint(TABLE_ASIGNACION_MATERIALES, st.session_state.df_asignacion_materiales),
+                                                     st.session_state.df_asignacion_materiales, ('ID_Asignacion', 'ID_Obra', 'Material'))
         if not obra_ids_for_editor:
              st.warning("No hay obras válidas. Tabla de asignaciones se mostrará sin opción de editar Obra.")
              display_cols_asig_non_editable = [col for col in expected_cols_asignacion if col != 'ID_Obra']
@@ -2179,47 +2165,32 @@ def page_compras_asignacion():
         df_asignaciones_edited_processed = df_asignaciones_edited_processed.reindex(columns=expected_cols_asignacion)
         for col in ['ID_Asignacion', 'ID_Obra', 'Material']:
             if col in df_asignaciones_edited_processed.columns:
-                df_asignaciones_edited_processed[col] = df_asignaciones_edited_processed[col].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_asignaciones_edited_processed[col].isna(), None)
-        for col in ['Cantidad_Asignada', 'Precio_Unitario_Asignado']:
-            if col not in df_asignaciones_edited_processed.columns: df_asignaciones_edited_processed[col] = 0.0
-            df_asignaciones_edited_processed[col] = pd.to_numeric(df_asignaciones_edited_processed[col], errors='coerce').fillna(0.0)
+                df_asignaciones_edited_processed[col] = normalize_text(df_asignaciones_edited_processed[col], strip=True)
         df_asignaciones_edited_processed = calcular_costo_asignado(df_asignaciones_edited_processed)
         new_row_mask = df_asignaciones_edited_processed['ID_Asignacion'].isna()
         if new_row_mask.any():
-            existing_ids = set(st.session_state.df_asignacion_materiales['ID_Asignacion'].astype(str).tolist())
-            new_ids_batch = []
-            for i in range(new_row_mask.sum()):
-                base_id = f"ASIG_EDIT_{int(time.time() * 1e6)}_{i}"
-                unique_id = base_id
-                counter = 0
-                while unique_id in existing_ids or unique_id in new_ids_batch:
-                    counter += 1
-                    unique_id = f"{base_id}_{counter}"
-                new_ids_batch.append(unique_id)
+            new_ids_batch = new_batch_ids("ASIG_EDIT", int(new_row_mask.sum()), id_set(TABLE_ASIGNACION_MATERIALES, st.session_state.df_asignacion_materiales, 'ID_Asignacion'))
             df_asignaciones_edited_processed.loc[new_row_mask, 'ID_Asignacion'] = new_ids_batch
-        df_asignaciones_original_compare = st.session_state.df_asignacion_materiales.reindex(columns=expected_cols_asignacion).sort_values(by=expected_cols_asignacion).reset_index(drop=True)
-        df_asignaciones_edited_compare = df_asignaciones_edited_processed.reindex(columns=expected_cols_asignacion).sort_values(by=expected_cols_asignacion).reset_index(drop=True)
-        if not df_asignaciones_edited_compare.equals(df_asignaciones_original_compare):
+        if frame_fingerprint(df_asignaciones_edited_processed, expected_cols_asignacion) != stored_fingerprint(TABLE_ASIGNACION_MATERIALES, st.session_state.df_asignacion_materiales):
             if st.button("Guardar Cambios en Historial de Asignaciones", key="save_asignaciones_button"):
-                df_to_save = df_asignaciones_edited_processed.copy()
                 date_col_name_asignacion = DATETIME_COLUMNS[TABLE_ASIGNACION_MATERIALES]
-                df_to_save = df_to_save[(df_to_save['ID_Asignacion'].notna()) &
-                                        (df_to_save[date_col_name_asignacion].notna()) &
-                                        (df_to_save['ID_Obra'].notna()) &
-                                        (df_to_save['Material'].notna()) &
-                                        (df_to_save['Cantidad_Asignada'].notna()) &
-                                        (df_to_save['Precio_Unitario_Asignado'].notna())
-                                        ].copy()
+                df_to_save = df_asignaciones_edited_processed[(df_asignaciones_edited_processed['ID_Asignacion'].notna()) &
+                                                              (df_asignaciones_edited_processed[date_col_name_asignacion].notna()) &
+                                                              (df_asignaciones_edited_processed['ID_Obra'].notna()) &
+                                                              (df_asignaciones_edited_processed['Material'].notna()) &
+                                                              (df_asignaciones_edited_processed['Cantidad_Asignada'].notna()) &
+                                                              (df_asignaciones_edited_processed['Precio_Unitario_Asignado'].notna())
+                                                             ].copy()
+                asignacion_values = np.nan_to_num(numeric_values(df_to_save, ['Cantidad_Asignada', 'Precio_Unitario_Asignado']))
                 if df_to_save.empty and not df_asignaciones_edited_processed.empty:
                     st.error("Error: Ninguna fila válida. Complete campos obligatorios.")
-                elif ((pd.to_numeric(df_to_save['Cantidad_Asignada'], errors='coerce').fillna(0) == 0) &
-                    (pd.to_numeric(df_to_save['Precio_Unitario_Asignado'], errors='coerce').fillna(0) == 0)).any():
+                elif not asignacion_values.any(axis=1).all():
                     st.warning("Advertencia: Algunas asignaciones tienen Cantidad y Precio Unitario ambos cero.")
-                elif df_to_save['ID_Asignacion'].astype(str).str.strip().duplicated().any():
+                elif has_duplicate_text(df_to_save['ID_Asignacion']):
                     st.error("Error: IDs de asignación duplicados.")
                 else:
+                    save_table_changes(st.session_state.df_asignacion_materiales, df_to_save, DATABASE_FILE, TABLE_ASIGNACION_MATERIALES)
                     st.session_state.df_asignacion_materiales = df_to_save
-                    save_table(st.session_state.df_asignacion_materiales, DATABASE_FILE, TABLE_ASIGNACION_MATERIALES)
                     st.success("Cambios en historial de asignaciones guardados.")
                     st.experimental_rerun()
             else:
@@ -2236,7 +2207,7 @@ def page_compras_asignacion():
             info_cols_present = [col for col in info_cols if col in st.session_state.df_asignacion_materiales.columns]
             df_asig_info = st.session_state.df_asignacion_materiales[info_cols_present].copy()
             if 'ID_Asignacion' in df_asig_info.columns:
-                 df_asig_info['ID_Asignacion_clean'] = df_asig_info['ID_Asignacion'].astype(str).str.strip().replace({'': 'ID Desconocida', 'nan': 'ID Desconocida', 'None': 'ID Desconocida'})
+                 df_asig_info['ID_Asignacion_clean'] = normalize_text(df_asig_info['ID_Asignacion'], strip=True).fillna('ID Desconocida')
                  df_asig_info = df_asig_info[df_asig_info['ID_Asignacion_clean'].isin(asignaciones_disponibles_list_current)].copy()
             else:
                  st.warning("La tabla de asignaciones no contiene 'ID_Asignacion'.")
@@ -2244,10 +2215,10 @@ def page_compras_asignacion():
                  for col in info_cols[1:]: df_asig_info[col] = 'No Disp.'
             if not df_asig_info.empty:
                  if 'Fecha_Asignacion' in df_asig_info.columns:
-                     df_asig_info['Fecha_Asignacion_str'] = pd.to_datetime(df_asig_info['Fecha_Asignacion'], errors='coerce').dt.strftime('%Y-%m-%d').fillna('Fecha Inválida')
+                     df_asig_info['Fecha_Asignacion_str'] = coerce_date(df_asig_info['Fecha_Asignacion']).dt.strftime('%Y-%m-%d').fillna('Fecha Inválida')
                  else: df_asig_info['Fecha_Asignacion_str'] = 'Fecha No Disp.'
                  for col in ['ID_Obra', 'Material']:
-                      if col in df_asig_info.columns: df_asig_info[col] = df_asig_info[col].astype(str).str.strip().replace({'': 'N/A', 'nan': 'N/A', 'None': 'N/A'})
+                      if col in df_asig_info.columns: df_asig_info[col] = normalize_text(df_asig_info[col], strip=True).fillna('N/A')
                       else: df_asig_info[col] = 'No Disp.'
                  if 'Cantidad_Asignada' in df_asig_info.columns:
                       df_asig_info['Cantidad_Asignada'] = pd.to_numeric(df_as_ig_info['Cantidad_Asignada'], errors='coerce').fillna(0.0).round(2)
@@ -2279,8 +2250,8 @@ def page_compras_asignacion():
                      st.session_state.df_asignacion_materiales['ID_Asignacion'].astype(str).str.strip() != selected_id_clean
                  ].copy()
                  if len(df_filtered) < len(st.session_state.df_asignacion_materiales):
+                     save_table_changes(st.session_state.df_asignacion_materiales, df_filtered, DATABASE_FILE, TABLE_ASIGNACION_MATERIALES)
                      st.session_state.df_asignacion_materiales = df_filtered
-                     save_table(st.session_state.df_asignacion_materiales, DATABASE_FILE, TABLE_ASIGNACION_MATERIALES)
                      st.success(f"Asignación {id_asignacion_eliminar} eliminada.")
                      st.experimental_rerun()
                  else:
@@ -2295,18 +2266,10 @@ def page_reporte_variacion_total_obras():
     if st.session_state.df_presupuesto_materiales.empty and st.session_state.df_asignacion_materiales.empty:
         st.info("No hay datos de presupuesto ni de asignación para generar el reporte.")
         return
-    df_presupuesto = st.session_state.df_presupuesto_materiales.copy()
-    for col in ['Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado']:
-        if col not in df_presupuesto.columns: df_presupuesto[col] = 0.0
-        df_presupuesto[col] = pd.to_numeric(df_presupuesto[col], errors='coerce').fillna(0.0)
-    df_presupuesto = calcular_costo_presupuestado(df_presupuesto)
+    df_presupuesto = calcular_costo_presupuestado(st.session_state.df_presupuesto_materiales)
     if 'ID_Obra' in df_presupuesto.columns:
-        df_presupuesto['ID_Obra_clean'] = df_presupuesto['ID_Obra'].astype(str).str.strip().replace({'': 'ID Desconocida', 'nan': 'ID Desconocida', 'None': 'ID Desconocida'})
+        df_presupuesto['ID_Obra_clean'] = normalize_text(df_presupuesto['ID_Obra'], strip=True).fillna('ID Desconocida')
     else: df_presupuesto['ID_Obra_clean'] = 'ID Desconocida'
-    if 'Cantidad_Presupuestada' not in df_presupuesto.columns: df_presupuesto['Cantidad_Presupuestada'] = 0.0
-    if 'Costo_Presupuestado' not in df_presupuesto.columns: df_presupuesto['Costo_Presupuestado'] = 0.0
-    df_presupuesto['Cantidad_Presupuestada'] = pd.to_numeric(df_presupuesto['Cantidad_Presupuestada'], errors='coerce').fillna(0.0)
-    df_presupuesto['Costo_Presupuestado'] = pd.to_numeric(df_presupuesto['Costo_Presupuestado'], errors='coerce').fillna(0.0)
     if not df_presupuesto.empty:
         presupuesto_total_obra = df_presupuesto.groupby('ID_Obra_clean', dropna=False).agg(
             Cantidad_Total_Presupuestada=('Cantidad_Presupuestada', 'sum'),
@@ -2314,16 +2277,10 @@ def page_reporte_variacion_total_obras():
         ).reset_index()
     else:
          presupuesto_total_obra = pd.DataFrame(columns=['ID_Obra_clean', 'Cantidad_Presupuestada_Total', 'Costo_Presupuestado_Total'])
-    df_asignacion = st.session_state.df_asignacion_materiales.copy()
-    for col in ['Cantidad_Asignada', 'Precio_Unitario_Asignado']:
-        if col not in df_asignacion.columns: df_asignacion[col] = 0.0
-        df_asignacion[col] = pd.to_numeric(df_asignacion[col], errors='coerce').fillna(0.0)
-    df_asignacion = calcular_costo_asignado(df_asignacion)
+    df_asignacion = calcular_costo_asignado(st.session_state.df_asignacion_materiales)
     if 'ID_Obra' in df_asignacion.columns:
-         df_asignacion['ID_Obra_clean'] = df_asignacion['ID_Obra'].astype(str).str.strip().replace({'': 'ID Desconocida', 'nan': 'ID Desconocida', 'None': 'ID Desconocida'})
+         df_asignacion['ID_Obra_clean'] = normalize_text(df_asignacion['ID_Obra'], strip=True).fillna('ID Desconocida')
     else: df_asignacion['ID_Obra_clean'] = 'ID Desconocida'
-    if 'Costo_Asignado' not in df_asignacion.columns: df_asignacion['Costo_Asignado'] = 0.0
-    df_asignacion['Costo_Asignado'] = pd.to_numeric(df_asignacion['Costo_Asignado'], errors='coerce').fillna(0.0)
     if not df_asignacion.empty:
          asignacion_total_obra = df_asignacion.groupby('ID_Obra_clean', dropna=False).agg(
             Cantidad_Asignada_Total=('Cantidad_Asignada', 'sum'),
@@ -2332,22 +2289,11 @@ def page_reporte_variacion_total_obras():
     else:
          asignacion_total_obra = pd.DataFrame(columns=['ID_Obra_clean', 'Cantidad_Asignada_Total', 'Costo_Asignado_Total'])
     reporte_variacion_obras = pd.merge(presupuesto_total_obra, asignacion_total_obra, on='ID_Obra_clean', how='outer').fillna(0)
-    df_proyectos_temp = st.session_state.df_proyectos.copy()
-    if 'ID_Obra' in df_proyectos_temp.columns:
-         df_proyectos_temp['ID_Obra_clean_for_merge'] = df_proyectos_temp['ID_Obra'].astype(str).str.strip().replace({'': None, 'nan': None, 'None': None}).mask(df_proyectos_temp['ID_Obra'].isna(), None)
-         reporte_variacion_obras = reporte_variacion_obras.merge(df_proyectos_temp[['ID_Obra_clean_for_merge', 'Nombre_Obra']], left_on='ID_Obra_clean', right_on='ID_Obra_clean_for_merge', how='left')
-         reporte_variacion_obras['Nombre_Obra'] = reporte_variacion_obras.apply(
-             lambda row: row['Nombre_Obra'] if pd.notna(row['Nombre_Obra']) else f"Obra ID: {row['ID_Obra_clean']}" if row['ID_Obra_clean'] != 'ID Desconocida' else 'ID Desconocida', axis=1
-         )
-         reporte_variacion_obras = reporte_variacion_obras.drop(columns=['ID_Obra_clean_for_merge'], errors='ignore')
-    else:
-         reporte_variacion_obras['Nombre_Obra'] = reporte_variacion_obras['ID_Obra_clean'].apply(lambda x: f"Obra ID: {x}" if x != 'ID Desconocida' else 'ID Desconocida')
+    reporte_variacion_obras['Nombre_Obra'] = obra_labels(reporte_variacion_obras['ID_Obra_clean'], st.session_state.df_proyectos)
     reporte_variacion_obras = reporte_variacion_obras.rename(columns={'ID_Obra_clean': 'ID_Obra'})
     cost_cols = ['Costo_Presupuestado_Total', 'Costo_Asignado_Total']
     qty_cols = ['Cantidad_Presupuestada_Total', 'Cantidad_Asignada_Total']
-    for col in cost_cols + qty_cols:
-         if col not in reporte_variacion_obras.columns: reporte_variacion_obras[col] = 0.0
-         else: reporte_variacion_obras[col] = pd.to_numeric(reporte_variacion_obras[col], errors='coerce').fillna(0.0)
+    reporte_variacion_obras[cost_cols + qty_cols] = numeric_values(reporte_variacion_obras.reindex(columns=cost_cols + qty_cols), cost_cols + qty_cols, fill_value=0.0)
     reporte_variacion_obras['Variacion_Total_Costo'] = reporte_variacion_obras['Costo_Asignado_Total'] - reporte_variacion_obras['Costo_Presupuestado_Total']
     reporte_variacion_obras['Variacion_Total_Cantidad'] = reporte_variacion_obras['Cantidad_Asignada_Total'] - reporte_variacion_obras['Cantidad_Presupuestada_Total']
     sort_cols = []
@@ -2366,8 +2312,8 @@ def page_reporte_variacion_total_obras():
         display_cols_present = [col for col in display_cols if col in reporte_variacion_obras.columns]
         if display_cols_present: st.dataframe(reporte_variacion_obras[display_cols_present].round(2))
         else: st.warning("No se pudo mostrar el reporte de variación por obra.")
-        total_presupuestado_general = pd.to_numeric(reporte_variacion_obras.get('Costo_Presupuestado_Total', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
-        total_asignado_general = pd.to_numeric(reporte_variacion_obras.get('Costo_Asignado_Total', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
+        total_presupuestado_general = float(reporte_variacion_obras['Costo_Presupuestado_Total'].sum())
+        total_asignado_general = float(reporte_variacion_obras['Costo_Asignado_Total'].sum())
         total_variacion_general_costo = total_asignado_general - total_presupuestado_general
         variation_threshold_general = 0.01
         if abs(total_variacion_general_costo) >= variation_threshold_general or abs(total_presupuestado_general) >= variation_threshold_general or abs(total_asignado_general) >= variation_threshold_general:
@@ -2378,13 +2324,11 @@ def page_reporte_variacion_total_obras():
             texts_costo = [f"${total_presupuestado_general:,.2f}"]
             if 'Variacion_Total_Costo' in reporte_variacion_obras.columns and 'Nombre_Obra' in reporte_variacion_obras.columns and 'ID_Obra' in reporte_variacion_obras.columns:
                 reporte_variacion_obras_significant_cost_var = reporte_variacion_obras[abs(reporte_variacion_obras['Variacion_Total_Costo']) >= variation_threshold_general].sort_values('Variacion_Total_Costo', ascending=False).copy()
-                for index, row in reporte_variacion_obras_significant_cost_var.iterrows():
-                     obra_label = row['Nombre_Obra'] if pd.notna(row['Nombre_Obra']) and str(row['Nombre_Obra']).strip() != '' else str(row['ID_Obra']) + ' (Desconocida)'
-                     if len(obra_label) > 25: obra_label = obra_label[:22] + '...'
-                     labels_costo.append(f"Var: {obra_label}")
-                     values_costo.append(row['Variacion_Total_Costo'])
-                     measures_costo.append('relative')
-                     texts_costo.append(f"${row['Variacion_Total_Costo']:,.2f}")
+                variaciones = reporte_variacion_obras_significant_cost_var['Variacion_Total_Costo'].tolist()
+                labels_costo.extend(('Var: ' + obra_chart_labels(reporte_variacion_obras_significant_cost_var)).tolist())
+                values_costo.extend(variaciones)
+                measures_costo.extend(['relative'] * len(variaciones))
+                texts_costo.extend(f"${value:,.2f}" for value in variaciones)
             labels_costo.append('Total Asignado')
             values_costo.append(total_asignado_general)
             measures_costo.append('total')
@@ -2407,8 +2351,8 @@ def page_reporte_variacion_total_obras():
                  st.info("El costo asignado es igual al presupuestado o la variación es insignificante.")
             else: st.info("No hay datos de costos suficientes para mostrar el gráfico.")
         else: st.info("No hay costo presupuestado ni asignado total para mostrar el gráfico.")
-        total_cantidad_presupuestada_general = pd.to_numeric(reporte_variacion_obras.get('Cantidad_Presupuestada_Total', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
-        total_cantidad_asignada_general = pd.to_numeric(reporte_variacion_obras.get('Cantidad_Asignada_Total', pd.Series(dtype=float)), errors='coerce').fillna(0.0).sum()
+        total_cantidad_presupuestada_general = float(reporte_variacion_obras['Cantidad_Presupuestada_Total'].sum())
+        total_cantidad_asignada_general = float(reporte_variacion_obras['Cantidad_Asignada_Total'].sum())
         total_variacion_general_cantidad = total_cantidad_asignada_general - total_cantidad_presupuestada_general
         if abs(total_variacion_general_cantidad) >= variation_threshold_general or abs(total_cantidad_presupuestada_general) >= variation_threshold_general or abs(total_cantidad_asignada_general) >= variation_threshold_general:
             st.subheader("Gráfico de Cascada: Cantidad Total Presupuestada vs Cantidad Real Total")
@@ -2418,13 +2362,11 @@ def page_reporte_variacion_total_obras():
             texts_cantidad = [f"{total_cantidad_presupuestada_general:,.2f}"]
             if 'Variacion_Total_Cantidad' in reporte_variacion_obras.columns and 'Nombre_Obra' in reporte_variacion_obras.columns and 'ID_Obra' in reporte_variacion_obras.columns:
                 reporte_variacion_obras_significant_qty_var = reporte_variacion_obras[abs(reporte_variacion_obras['Variacion_Total_Cantidad']) >= variation_threshold_general].sort_values('Variacion_Total_Cantidad', ascending=False).copy()
-                for index, row in reporte_variacion_obras_significant_qty_var.iterrows():
-                     obra_label = row['Nombre_Obra'] if pd.notna(row['Nombre_Obra']) and str(row['Nombre_Obra']).strip() != '' else str(row['ID_Obra']) + ' (Desconocida)'
-                     if len(obra_label) > 25: obra_label = obra_label[:22] + '...'
-                     labels_cantidad.append(f"Var Cant: {obra_label}")
-                     values_cantidad.append(row['Variacion_Total_Cantidad'])
-                     measures_cantidad.append('relative')
-                     texts_cantidad.append(f"{row['Variacion_Total_Cantidad']:,.2f}")
+                variaciones = reporte_variacion_obras_significant_qty_var['Variacion_Total_Cantidad'].tolist()
+                labels_cantidad.extend(('Var Cant: ' + obra_chart_labels(reporte_variacion_obras_significant_qty_var)).tolist())
+                values_cantidad.extend(variaciones)
+                measures_cantidad.extend(['relative'] * len(variaciones))
+                texts_cantidad.extend(f"{value:,.2f}" for value in variaciones)
             labels_cantidad.append('Total Asignado (Cant.)')
             values_cantidad.append(total_cantidad_asignada_general)
             measures_cantidad.append('total')
@@ -2468,21 +2410,11 @@ if selected_page == "dashboard":
     st.info("Seleccione una opción del menú lateral para comenzar.")
     st.markdown("---")
     st.subheader("Resumen Rápido")
-    total_equipos = len(st.session_state.get('df_equipos', pd.DataFrame()).dropna(subset=['Interno']).copy())
-    total_obras = len(st.session_state.get('df_proyectos', pd.DataFrame()).dropna(subset=['ID_Obra']).copy())
-    total_flotas = len(st.session_state.get('df_flotas', pd.DataFrame()).dropna(subset=['ID_Flota']).copy())
-    df_presupuesto_summary = st.session_state.get('df_presupuesto_materiales', pd.DataFrame()).copy()
-    for col in ['Cantidad_Presupuestada', 'Precio_Unitario_Presupuestado']:
-        if col not in df_presupuesto_summary.columns: df_presupuesto_summary[col] = 0.0
-        df_presupuesto_summary[col] = pd.to_numeric(df_presupuesto_summary[col], errors='coerce').fillna(0.0)
-    df_presupuesto_summary = calcular_costo_presupuestado(df_presupuesto_summary)
-    total_presupuesto_materiales = pd.to_numeric(df_presupuesto_summary.get('Costo_Presupuestado', pd.Series(dtype=float)), errors='coerce').fillna(0).sum()
-    df_compras_summary = st.session_state.get('df_compras_materiales', pd.DataFrame()).copy()
-    for col in ['Cantidad_Comprada', 'Precio_Unitario_Comprado']:
-        if col not in df_compras_summary.columns: df_compras_summary[col] = 0.0
-        df_compras_summary[col] = pd.to_numeric(df_compras_summary[col], errors='coerce').fillna(0.0)
-    df_compras_summary = calcular_costo_compra(df_compras_summary)
-    total_comprado_materiales = pd.to_numeric(df_compras_summary.get('Costo_Compra', pd.Series(dtype=float)), errors='coerce').fillna(0).sum()
+    total_equipos = len(st.session_state.get('df_equipos', pd.DataFrame()).dropna(subset=['Interno']))
+    total_obras = len(st.session_state.get('df_proyectos', pd.DataFrame()).dropna(subset=['ID_Obra']))
+    total_flotas = len(st.session_state.get('df_flotas', pd.DataFrame()).dropna(subset=['ID_Flota']))
+    total_presupuesto_materiales = cost_total(st.session_state.get('df_presupuesto_materiales', pd.DataFrame()), TABLE_PRESUPUESTO_MATERIALES)
+    total_comprado_materiales = cost_total(st.session_state.get('df_compras_materiales', pd.DataFrame()), TABLE_COMPRAS_MATERIALES)
     col_summary1, col_summary2, col_summary3, col_summary4, col_summary5 = st.columns(5)
     with col_summary1: st.metric("Total Equipos", total_equipos)
     with col_summary2: st.metric("Total Flotas", total_flotas)